@@ -1,10 +1,13 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from .utils import format_currency
+from .utils import currency_filter
 from pathlib import Path
 import os
 
-db = SQLAlchemy()
+# RoutingSession: leituras das views marcadas podem ir para a réplica (ver replica.py)
+from .replica import RoutingSession, replica_url
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 def _is_production():
     # Render sets several env vars; FLASK_ENV may also be "production"
@@ -62,8 +65,16 @@ def create_app():
         "pool_recycle": 1800,  # recycle connections every 30 minutes
         "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
         "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),  # espera por conexão livre
     }
 
+    # Réplica de leitura opcional (relatórios, exportações, dashboard, diagnóstico)
+    replica = replica_url()
+    if replica:
+        replica = _normalize_database_url(replica)
+        if _is_production() and replica.startswith("sqlite"):
+            raise RuntimeError("DATABASE_REPLICA_URL não pode ser SQLite em produção.")
+
 
     # Folder used for report exports (PDF/Excel/CSV).
     # On Render, the filesystem is ephemeral, so we use /tmp by default.
@@ -81,18 +92,87 @@ def create_app():
     # PWA
     app.config["PWA_NAME"] = "Finanças da Casa"
 
+    # SQLite em arquivo: WAL, pragmas e BEGIN IMMEDIATE (ver sqlite_profile.py)
+    from . import replica as replica_routing, sqlite_profile
+    sqlite_profile.configure(app)
+    if replica:
+        replica_routing.configure(app, replica)
+
     db.init_app(app)
+    sqlite_profile.init_app(app)
+    replica_routing.init_app(app)
+
+    # Cache em memória invalidado a cada commit que grava dados
+    from .cache import register_listeners
+    register_listeners()
+
+    # Cada casa (household) só enxerga os próprios dados
+    from . import tenancy
+    tenancy.init_app(app)
+
+    # Exclusões de lançamentos viram "tombstones" para o delta do PWA
+    from .sync import register_listeners as register_sync_listeners
+    register_sync_listeners()
+
+    # Histórico de alterações dos lançamentos (transaction_events)
+    from . import audit
+    audit.init_app(app)
+
+    # Moeda por conta/lançamento e cotações para a moeda dos relatórios
+    from . import currency
+    currency.init_app(app)
+
+    # Movimentos por conta (postings) mantidos junto com os lançamentos
+    from . import ledger
+    ledger.init_app(app)
+
+    # Categorias em árvore (closure table); antes dos alertas, que somam por ancestral
+    from . import categories
+    categories.init_app(app)
+
+    # Gasto acumulado por mês/categoria e alertas de orçamento (80%/100%)
+    from . import alerts
+    alerts.init_app(app)
+
+    # Etiquetas dos lançamentos (transaction_tags)
+    from . import tags
+    tags.init_app(app)
+
+    # Rateio entre categorias; depois dos alertas, que leem as linhas de quem é apagado
+    from . import splits
+    splits.init_app(app)
+
+    # CSS/JS versionados (python -m app.assets build) e compressão gzip
+    from . import assets, compression
+    assets.init_app(app)
+    compression.init_app(app)
 
     # Filtros Jinja customizados
-    app.jinja_env.filters['currency'] = format_currency
+    app.jinja_env.filters['currency'] = currency_filter
+
+    # Bytecode dos templates em disco e {% cache %} para trechos
+    from . import templating
+    templating.init_app(app)
+
+    # Particionamento/arquivo de lançamentos (PostgreSQL, opcional)
+    from . import partitioning
+    partitioning.init_app(app)
+
+    # flask backup / flask restore
+    from . import backup
+    backup.init_app(app)
 
     from .routes import bp
     app.register_blueprint(bp)
 
-    # Create tables + seed defaults (safe with Postgres)
+    # Create tables + seed defaults, uma vez por versão do schema (ver bootstrap.py)
+    from . import bootstrap
+    bootstrap.init_app(app)
+
     with app.app_context():
-        from .models import seed_if_empty
-        db.create_all()
-        seed_if_empty()
+        partitioning.ensure_partitions()
+        # gunicorn --preload: nenhuma conexão aberta no master pode ir para os workers
+        for engine in db.engines.values():
+            engine.dispose()
 
     return app
\ No newline at end of file
@@ -0,0 +1,277 @@
+"""Alertas de orçamento detectados na gravação, sem recalcular o mês.
+
+category_spend guarda o gasto acumulado de cada (mês, categoria), na moeda
+dos relatórios, somando as subcategorias (categories.py): o delta de um
+lançamento em Aluguel vale também para Moradia. Lançamento dividido
+(splits.py) soma cada linha na sua categoria. Toda gravação de despesa
+pelo ORM (formulário, PWA, recorrentes) soma o delta no mesmo flush (evento
+after_flush), com um INSERT ... ON CONFLICT DO UPDATE SET amount = amount +
+delta por chave afetada, que devolve o total novo. Com o total de antes e o de depois, e o
+orçamento efetivo do mês (exceção do mês ou padrão), dá para saber se
+algum limite (BUDGET_ALERT_THRESHOLDS, padrão 80 e 100%) foi cruzado;
+cada limite gera um alerta uma vez por (mês, categoria).
+
+Importação em lote chama `record_inserted` a cada lote, com os ids
+devolvidos pelo INSERT: um SELECT agrupado dos lançamentos novos e o mesmo
+upsert, para o lote todo.
+
+O acumulado é derivado: `flask alerts-rebuild` refaz a partir dos
+lançamentos (depois de cargas via Core, restauração de backup ou troca
+da moeda dos relatórios; mover uma categoria na árvore refaz sozinho). Alterar o orçamento não gera alerta sozinho; o
+próximo lançamento da categoria compara com o valor novo.
+"""
+import os
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, func, insert, inspect, literal, select
+from sqlalchemy.orm import Session, joinedload
+
+from . import db
+from .cache import cached
+from .currency import convert, converted
+from .dbutil import month_key, upsert
+from .models import Budget, BudgetAlert, BudgetTemplate, CategoryClosure, CategorySpend, Transaction
+from .splits import flush_lines, line_columns
+
+THRESHOLDS = tuple(sorted(
+    int(x) for x in os.getenv("BUDGET_ALERT_THRESHOLDS", "80,100").split(",") if x.strip()
+))
+FIELDS = ("txn_type", "category_id", "txn_date", "amount", "currency", "is_split")
+
+
+def _spend(household_id, values: dict, lines=None) -> list:
+    """[((casa, mês, categoria), valor convertido)] de uma despesa (uma por linha do rateio)."""
+    if values.get("txn_type") != "expense" or values.get("txn_date") is None or values.get("amount") is None:
+        return []
+    d = values["txn_date"]
+    ym = d.strftime("%Y-%m")
+    if not values.get("is_split"):
+        lines = [(values["category_id"], values["amount"])]
+    out = []
+    for c, a in lines or ():
+        value = convert(a, values.get("currency"), d)
+        if value is not None:  # sem cotação: fora do gasto, como no SELECT de conferência
+            out.append(((household_id, ym, c), value))
+    return out
+
+
+def _before(state) -> dict:
+    out = {}
+    for f in FIELDS:
+        hist = state.attrs[f].history
+        if hist.deleted:
+            out[f] = hist.deleted[0]
+        else:
+            out[f] = hist.unchanged[0] if hist.unchanged else state.dict.get(f)
+    return out
+
+
+def _track_spend(session, flush_context):
+    deltas = {}
+
+    def add(items, sign):
+        for key, value in items:
+            deltas[key] = deltas.get(key, 0.0) + sign * value
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Transaction):
+            continue
+        state = inspect(obj)
+        # linhas do rateio só são lidas de quem é (ou era) dividido
+        if obj in session.new:
+            add(_spend(obj.household_id, state.dict, obj.is_split and flush_lines(state)), 1)
+        elif obj in session.deleted:
+            add(_spend(obj.household_id, state.dict, obj.is_split and flush_lines(state, before=True)), -1)
+        elif any(state.attrs[f].history.has_changes() for f in FIELDS + ("splits",)):
+            before = _before(state)
+            add(_spend(obj.household_id, before, before["is_split"] and flush_lines(state, before=True)), -1)
+            add(_spend(obj.household_id, state.dict, obj.is_split and flush_lines(state)), 1)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def effective_budgets(conn, keys) -> dict:
+    """{(mês, categoria): orçamento} com a exceção do mês ou, sem ela, o padrão."""
+    months = {m for m, _ in keys}
+    categories = {c for _, c in keys}
+    b = Budget.__table__
+    bt = BudgetTemplate.__table__
+    overrides = {
+        (m, c): p for m, c, p in conn.execute(
+            select(b.c.month, b.c.category_id, b.c.planned_amount)
+            .where(b.c.month.in_(months), b.c.category_id.in_(categories))
+        )
+    }
+    templates = dict(conn.execute(
+        select(bt.c.category_id, bt.c.planned_amount).where(bt.c.category_id.in_(categories))
+    ).all())
+    return {(m, c): overrides.get((m, c), templates.get(c)) for m, c in keys}
+
+
+def _with_ancestors(conn, deltas: dict) -> dict:
+    """Repete o delta de cada categoria em todos os ancestrais (category_closure)."""
+    cc = CategoryClosure.__table__
+    up = {}
+    for ancestor, descendant in conn.execute(
+        select(cc.c.ancestor_id, cc.c.descendant_id)
+        .where(cc.c.descendant_id.in_({c for _, _, c in deltas}), cc.c.depth > 0)
+    ):
+        up.setdefault(descendant, []).append(ancestor)
+    out = dict(deltas)
+    for (h, m, c), d in deltas.items():
+        for a in up.get(c, ()):
+            out[(h, m, a)] = out.get((h, m, a), 0.0) + d
+    return out
+
+
+def apply_deltas(conn, deltas: dict) -> int:
+    """Soma {(casa, mês, categoria): delta} em category_spend e grava os alertas cruzados.
+
+    Cada delta vale também para os ancestrais da categoria. Um upsert para
+    todas as chaves; orçamento só é consultado para as que subiram.
+    Devolve o número de alertas novos. Não faz commit.
+    """
+    if not deltas:
+        return 0
+    deltas = _with_ancestors(conn, deltas)
+    rows = [
+        {"household_id": h, "month": m, "category_id": c, "amount": d}
+        for (h, m, c), d in deltas.items() if d
+    ]
+    if not rows:
+        return 0
+    cs = CategorySpend.__table__
+    ins = upsert(cs).values(rows)
+    stmt = ins.on_conflict_do_update(
+        index_elements=["month", "category_id"], set_={"amount": cs.c.amount + ins.excluded.amount},
+    ).returning(cs.c.household_id, cs.c.month, cs.c.category_id, cs.c.amount)
+
+    rising = {}
+    for h, m, c, total in conn.execute(stmt):
+        delta = deltas[(h, m, c)]
+        if delta > 0:
+            rising[(m, c)] = (h, total - delta, total)
+    if not rising:
+        return 0
+
+    planned = effective_budgets(conn, rising)
+    now = datetime.utcnow()
+    alerts = []
+    for (m, c), (h, before, after) in rising.items():
+        budget = planned.get((m, c))
+        if not budget or budget <= 0:
+            continue
+        for pct in THRESHOLDS:
+            if before < budget * pct / 100 <= after:
+                alerts.append({
+                    "household_id": h, "month": m, "category_id": c, "threshold": pct,
+                    "spent": after, "planned": budget, "created_at": now,
+                })
+    if alerts:
+        conn.execute(upsert(BudgetAlert.__table__).values(alerts).on_conflict_do_nothing(
+            index_elements=["month", "category_id", "threshold"],
+        ))
+    return len(alerts)
+
+
+def _grouped_spend(*cond, rollup: bool = False):
+    """SELECT (casa, mês, categoria, soma convertida) das despesas que atendem `cond`.
+
+    Com `rollup`, a categoria é cada ancestral (a soma inclui as subcategorias).
+    """
+    t = Transaction.__table__
+    start, end = db.session.execute(select(func.min(t.c.txn_date), func.max(t.c.txn_date)).where(*cond)).one()
+    if start is None:
+        return None
+    line_category, line_amount, with_lines = line_columns()
+    amount, with_rates = converted(line_amount, t.c.currency, t.c.txn_date, start, end)
+    ym = month_key(t.c.txn_date).label("month")
+    category = line_category
+    if rollup:
+        cc = CategoryClosure.__table__
+        category = cc.c.ancestor_id
+    stmt = with_lines(
+        select(t.c.household_id, ym, category.label("category_id"), func.sum(amount).label("amount")).select_from(t)
+    )
+    if rollup:
+        stmt = stmt.join(cc, cc.c.descendant_id == line_category)
+    return with_rates(stmt).where(t.c.txn_type == "expense", *cond).group_by(t.c.household_id, ym, category)
+
+
+def record_inserted(household_id: int, ids: list) -> int:
+    """Acumulado e alertas dos lançamentos inseridos em lote (os `ids` devolvidos pelo INSERT). Não faz commit."""
+    t = Transaction.__table__
+    stmt = _grouped_spend(t.c.household_id == household_id, t.c.id.in_(ids))
+    if stmt is None:
+        return 0
+    conn = db.session.connection()
+    deltas = {(h, m, c): float(v or 0) for h, m, c, v in conn.execute(stmt)}
+    return apply_deltas(conn, deltas)
+
+
+def rebuild_spend(household_id: int = None) -> int:
+    """Refaz category_spend a partir dos lançamentos (todas as casas por padrão). Não faz commit."""
+    t = Transaction.__table__
+    cs = CategorySpend.__table__
+    cond = [] if household_id is None else [t.c.household_id == household_id]
+    conn = db.session.connection()
+    del_stmt = delete(cs)
+    if household_id is not None:
+        del_stmt = del_stmt.where(cs.c.household_id == household_id)
+    conn.execute(del_stmt)
+    stmt = _grouped_spend(*cond, rollup=True)
+    if stmt is None:
+        return 0
+    return conn.execute(insert(cs).from_select(["household_id", "month", "category_id", "amount"], stmt)).rowcount
+
+
+def rebuild_if_empty():
+    """Primeira subida com os alertas: gera o acumulado dos lançamentos antigos."""
+    has_spend = db.session.execute(select(literal(1)).select_from(CategorySpend).limit(1)).first()
+    has_txns = db.session.execute(select(literal(1)).select_from(Transaction).limit(1)).first()
+    if has_txns and not has_spend:
+        rebuild_spend()
+        db.session.commit()
+
+
+# ---------------- feed ----------------
+def unread_count() -> int:
+    """Alertas não lidos da casa (em cache até a próxima gravação)."""
+    return cached(("budget_alerts_unread",), lambda: db.session.execute(
+        select(func.count(BudgetAlert.id)).where(BudgetAlert.read_at.is_(None))
+    ).scalar() or 0)
+
+
+def feed(limit: int = 100) -> list:
+    return (
+        BudgetAlert.query
+        .options(joinedload(BudgetAlert.category))
+        .order_by(BudgetAlert.created_at.desc(), BudgetAlert.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def mark_all_read() -> int:
+    """Não faz commit."""
+    return BudgetAlert.query.filter(BudgetAlert.read_at.is_(None)).update(
+        {BudgetAlert.read_at: datetime.utcnow()}, synchronize_session=False,
+    )
+
+
+@click.command("alerts-rebuild")
+@click.option("--household", type=int, help="Só esta casa (padrão: todas).")
+@with_appcontext
+def alerts_rebuild_command(household):
+    """Recalcula o gasto acumulado por mês/categoria (category_spend)."""
+    n = rebuild_spend(household)
+    db.session.commit()
+    click.echo(f"{n} totais mês/categoria gerados.")
+
+
+def init_app(app):
+    app.cli.add_command(alerts_rebuild_command)
+    if not event.contains(Session, "after_flush", _track_spend):
+        event.listen(Session, "after_flush", _track_spend)
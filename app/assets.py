@@ -0,0 +1,203 @@
+"""Pipeline de arquivos estáticos.
+
+    python -m app.assets vendor   # baixa Bootstrap/ícones para static/vendor
+    python -m app.assets build    # minifica, versiona e pré-comprime
+
+O build grava em static/dist/ cada CSS/JS minificado com o hash no nome
+(app.3f2a9c1b.css), as versões .gz e .br (se o pacote brotli existir) e um
+manifest.json. Os templates usam `asset_url('app.css')`: com manifest,
+aponta para a versão com hash, servida com cache "immutable" e no formato
+pré-comprimido que o navegador aceitar; sem build, cai no arquivo original.
+O /sw.js (templates/sw.js) pré-carrega essas mesmas URLs (`precache_urls`).
+
+Não depende do banco, então roda no buildCommand do Render.
+"""
+import gzip
+import hashlib
+import json
+import re
+import shutil
+import sys
+import urllib.request
+from pathlib import Path
+
+from flask import current_app, request, send_from_directory, url_for
+
+STATIC = Path(__file__).resolve().parent / "static"
+DIST = STATIC / "dist"
+MANIFEST = DIST / "manifest.json"
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+MIN_PRECOMPRESS = 1024
+
+BOOTSTRAP = "5.3.3"
+ICONS = "1.11.3"
+VENDOR = {
+    "vendor/bootstrap.min.css": f"https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAP}/dist/css/bootstrap.min.css",
+    "vendor/bootstrap.bundle.min.js": f"https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAP}/dist/js/bootstrap.bundle.min.js",
+    "vendor/bootstrap-icons.min.css": f"https://cdn.jsdelivr.net/npm/bootstrap-icons@{ICONS}/font/bootstrap-icons.min.css",
+    "vendor/fonts/bootstrap-icons.woff2": f"https://cdn.jsdelivr.net/npm/bootstrap-icons@{ICONS}/font/fonts/bootstrap-icons.woff2",
+    "vendor/fonts/bootstrap-icons.woff": f"https://cdn.jsdelivr.net/npm/bootstrap-icons@{ICONS}/font/fonts/bootstrap-icons.woff",
+}
+
+# arquivos que o service worker guarda na instalação (templates/sw.js)
+PRECACHE = (
+    "vendor/bootstrap.min.css", "vendor/bootstrap-icons.min.css", "vendor/bootstrap.bundle.min.js",
+    "app.css", "offline.js",
+)
+
+
+# ---------------- minificação ----------------
+def minify_css(src: str) -> str:
+    src = re.sub(r"/\*.*?\*/", "", src, flags=re.S)
+    src = re.sub(r"\s+", " ", src)
+    src = re.sub(r"\s*([{};,>])\s*", r"\1", src)
+    # ":" só nas declarações: no seletor, ".a :not(.b)" não é ".a:not(.b)"
+    src = re.sub(r"\{[^{}]*\}", lambda m: re.sub(r"\s*:\s*", ":", m.group()), src)
+    return src.replace(";}", "}").strip()
+
+
+def minify_js(src: str) -> str:
+    """Conservador: tira indentação, linhas vazias e linhas só de comentário."""
+    out = []
+    for line in src.splitlines():
+        s = line.strip()
+        if not s or s.startswith("//"):
+            continue
+        out.append(s)
+    return "\n".join(out) + "\n"
+
+
+# ---------------- build ----------------
+def _fingerprinted(rel: str, data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()[:8]
+    p = Path(rel)
+    stem = p.name[: -len(".min" + p.suffix)] + ".min" if p.name.endswith(".min" + p.suffix) else p.stem
+    return str(p.with_name(f"{stem}.{digest}{p.suffix}"))
+
+
+def _precompress(path: Path):
+    data = path.read_bytes()
+    if len(data) < MIN_PRECOMPRESS:
+        return
+    path.with_name(path.name + ".gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    try:
+        import brotli
+    except ImportError:
+        return
+    path.with_name(path.name + ".br").write_bytes(brotli.compress(data, quality=11))
+
+
+def build(static: Path = STATIC) -> dict:
+    dist = static / "dist"
+    if dist.exists():
+        shutil.rmtree(dist)
+    dist.mkdir()
+    manifest = {}
+    for src in sorted(static.rglob("*")):
+        rel = src.relative_to(static).as_posix()
+        if not src.is_file() or rel.startswith("dist/"):
+            continue
+        target = dist / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if src.suffix not in (".css", ".js"):
+            # fontes/imagens: mesmo caminho relativo (o CSS do vendor aponta para elas)
+            shutil.copyfile(src, target)
+            continue
+        text = src.read_text(encoding="utf-8")
+        if ".min." not in src.name:
+            text = minify_css(text) if src.suffix == ".css" else minify_js(text)
+        data = text.encode("utf-8")
+        out_rel = _fingerprinted(rel, data)
+        out = dist / out_rel
+        out.write_bytes(data)
+        _precompress(out)
+        manifest[rel] = out_rel
+    (dist / "manifest.json").write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    return manifest
+
+
+def vendor(static: Path = STATIC):
+    for rel, url in VENDOR.items():
+        target = static / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with urllib.request.urlopen(url, timeout=30) as resp:
+            target.write_bytes(resp.read())
+        print(f"{rel} <- {url}")
+
+
+# ---------------- Flask ----------------
+_manifest = None
+
+
+def _load_manifest() -> dict:
+    global _manifest
+    if _manifest is None or current_app.debug:
+        try:
+            _manifest = json.loads(MANIFEST.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def asset_url(name: str, fallback: str = None):
+    """URL do arquivo versionado; sem build usa o original, ou `fallback` (CDN)."""
+    built = _load_manifest().get(name)
+    if built:
+        return url_for("assets_dist", filename=built)
+    if (STATIC / name).is_file():
+        return url_for("static", filename=name)
+    return fallback
+
+
+def precache_urls() -> list:
+    """URLs (versionadas, se houver build) do PRECACHE que existem localmente."""
+    return [url for url in (asset_url(name) for name in PRECACHE) if url]
+
+
+def precache_version(urls: list) -> str:
+    """Muda quando muda alguma URL versionada: o navegador instala o worker de novo."""
+    return "v3-" + hashlib.sha256("\n".join(urls).encode()).hexdigest()[:8]
+
+
+def serve_dist(filename: str):
+    """Arquivo do build: nome com hash, cache eterno e versão .br/.gz se aceita."""
+    accept = request.headers.get("Accept-Encoding", "")
+    for enc, ext in (("br", ".br"), ("gzip", ".gz")):
+        if enc in accept and (DIST / (filename + ext)).is_file():
+            resp = send_from_directory(DIST, filename + ext, mimetype=_mimetype(filename))
+            resp.headers["Content-Encoding"] = enc
+            break
+    else:
+        resp = send_from_directory(DIST, filename)
+    resp.headers["Cache-Control"] = IMMUTABLE
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
+
+def _mimetype(filename: str) -> str:
+    if filename.endswith(".css"):
+        return "text/css"
+    if filename.endswith(".js"):
+        return "application/javascript"
+    return "application/octet-stream"
+
+
+def init_app(app):
+    app.add_url_rule("/static/dist/<path:filename>", "assets_dist", serve_dist)
+    app.jinja_env.globals["asset_url"] = asset_url
+
+
+def main(argv=None):
+    cmd = (argv or sys.argv[1:] or ["build"])[0]
+    if cmd == "vendor":
+        vendor()
+    elif cmd == "build":
+        manifest = build()
+        print(f"{len(manifest)} arquivos em {DIST}")
+    else:
+        raise SystemExit("uso: python -m app.assets [vendor|build]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Auditoria de lançamentos: histórico só de inclusão em transaction_events.
+
+Cada flush que cria, edita ou apaga lançamentos grava os eventos na mesma
+transação (evento after_flush), num único INSERT em lote. Edições guardam
+só os campos que mudaram, como [antes, depois]; exclusões guardam o
+lançamento inteiro, para dar para reconstituir o que "sumiu". O rateio
+entra como "splits": [[categoria, valor], ...] (no diff, quando as linhas
+mudam; no retrato, quando o lançamento é dividido). Leituras não passam
+por aqui.
+
+A tabela é só de inclusão: o app nunca altera nem apaga eventos (um flush
+que tente isso é recusado). Linha do tempo em /admin/auditoria.
+"""
+import json
+from datetime import date, datetime
+
+from flask import has_request_context, session as web_session
+from sqlalchemy import Integer, event, insert, inspect, literal, select
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import Transaction, TransactionEvent
+from .splits import flush_lines
+
+FIELDS = (
+    "txn_date", "txn_type", "category_id", "account_id", "to_account_id",
+    "amount", "currency", "description", "receipt_filename", "is_split",
+)
+FIELD_LABELS = {
+    "txn_date": "Data", "txn_type": "Tipo", "category_id": "Categoria", "account_id": "Conta",
+    "to_account_id": "Conta destino", "amount": "Valor", "currency": "Moeda",
+    "description": "Descrição", "receipt_filename": "Comprovante", "is_split": "Dividido",
+    "splits": "Rateio", "source": "Origem",
+}
+
+
+def _json_value(v):
+    return v.isoformat() if isinstance(v, (date, datetime)) else v
+
+
+def _dumps(d: dict) -> str:
+    return json.dumps(d, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _current_user_id():
+    return web_session.get("user_id") if has_request_context() else None
+
+
+def _diff(state) -> dict:
+    out = {}
+    for f in FIELDS:
+        hist = state.attrs[f].history
+        if not hist.has_changes():
+            continue
+        old = hist.deleted[0] if hist.deleted else None
+        new = hist.added[0] if hist.added else None
+        if old != new:
+            out[f] = [_json_value(old), _json_value(new)]
+    if state.attrs.splits.history.has_changes():
+        old, new = _lines(state, before=True), _lines(state)
+        if old != new:
+            out["splits"] = [old, new]
+    return out
+
+
+def _lines(state, before: bool = False) -> list:
+    return sorted([cid, amount] for cid, amount in flush_lines(state, before))
+
+
+def _snapshot(state, before: bool = False) -> dict:
+    # colunas: só o que já está carregado (o objeto apagado não pode mais ir ao
+    # banco); as linhas do rateio ainda estão lá neste after_flush
+    out = {f: _json_value(state.dict[f]) for f in FIELDS if state.dict.get(f) not in (None, "")}
+    if state.dict.get("is_split"):
+        out["splits"] = _lines(state, before)
+    return out
+
+
+def _record_events(session, flush_context):
+    rows = []
+    user_id = None
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Transaction):
+            continue
+        state = inspect(obj)
+        if obj in session.deleted:
+            action, changes = "delete", _snapshot(state, before=True)
+        elif obj in session.new:
+            action, changes = "create", _snapshot(state)
+        else:
+            action, changes = "update", _diff(state)
+            if not changes:
+                continue  # só updated_at/client_id, nada que valha registrar
+        if user_id is None:
+            user_id = _current_user_id()
+        rows.append({
+            "household_id": obj.household_id, "entity_id": obj.id, "action": action,
+            "user_id": user_id, "changes": _dumps(changes), "ts": datetime.utcnow(),
+        })
+    if rows:
+        session.connection().execute(insert(TransactionEvent.__table__), rows)
+
+
+def _append_only(session, flush_context, instances):
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, TransactionEvent):
+            raise RuntimeError("transaction_events é só de inclusão.")
+
+
+def record_inserted(household_id: int, ids: list, source: str) -> int:
+    """Eventos de criação dos lançamentos inseridos em lote (os `ids` devolvidos pelo INSERT). Não faz commit.
+
+    Um INSERT ... SELECT; o detalhe de cada linha fica no próprio lançamento.
+    """
+    t = Transaction.__table__
+    e = TransactionEvent.__table__
+    source_rows = select(
+        t.c.household_id, t.c.id, literal(datetime.utcnow()), literal("create"),
+        literal(_current_user_id(), Integer), literal(_dumps({"source": source})),
+    ).where(t.c.household_id == household_id, t.c.id.in_(ids))
+    stmt = insert(e).from_select(
+        ["household_id", "entity_id", "ts", "action", "user_id", "changes"], source_rows
+    )
+    return db.session.connection().execute(stmt).rowcount
+
+
+def timeline(entity_id: int = None, before_id: int = None, limit: int = 100) -> list:
+    """Eventos mais recentes primeiro (de um lançamento, ou da casa toda)."""
+    stmt = select(TransactionEvent).order_by(TransactionEvent.id.desc()).limit(limit)
+    if entity_id is not None:
+        stmt = stmt.where(TransactionEvent.entity_id == entity_id)
+    if before_id is not None:
+        stmt = stmt.where(TransactionEvent.id < before_id)
+    out = []
+    for e in db.session.execute(stmt).scalars():
+        out.append({
+            "id": e.id, "entity_id": e.entity_id, "ts": e.ts, "action": e.action,
+            "user_id": e.user_id, "changes": json.loads(e.changes or "{}"),
+        })
+    return out
+
+
+def init_app(app):
+    if not event.contains(Session, "after_flush", _record_events):
+        event.listen(Session, "after_flush", _record_events)
+        event.listen(Session, "before_flush", _append_only)
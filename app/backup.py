@@ -0,0 +1,506 @@
+"""Backup e restauração do banco inteiro (todas as casas), em fluxo.
+
+    flask backup                          # completo, em BACKUP_FOLDER/<data-hora>/
+    flask backup --since backups/20261001_0300   # só o que mudou desde aquele
+    flask restore backups/20261001_0300 backups/20261008_0300 [--replace]
+
+Um backup é uma pasta com manifest.json e, por tabela, arquivos
+`<tabela>.<n>.jsonl.gz` de até CHUNK_ROWS linhas cada. Cada linha é uma
+lista de valores na ordem de `columns` do manifesto, e cada arquivo tem o
+seu sha256 no manifesto (conferido antes de restaurar). As linhas vêm do
+banco por cursor no servidor (stream_results) e são gravadas lote a lote,
+então a memória não cresce com o tamanho da tabela.
+
+Incremental (--since): o manifesto anterior traz as marcas d'água.
+- Tabelas com updated_at (transactions) levam as linhas com updated_at >=
+  a marca menos BACKUP_OVERLAP segundos: updated_at é o horário do flush,
+  e um lançamento que ainda não tinha feito commit quando o backup anterior
+  leu chega depois com updated_at abaixo da marca. As linhas relidas vão
+  de novo e a restauração as aplica por upsert (id). Exclusões chegam por
+  transaction_tombstones.
+- Linhas filhas de lançamentos (TRANSACTION_CHILDREN: rateio, etiquetas)
+  vão só as dos lançamentos que entraram no incremental, todas elas.
+- Tabelas só de inclusão (INCREMENTAL_BY_ID) levam id > marca.
+- postings é derivada e fica de fora; a restauração a refaz (ledger).
+- As demais (categorias, contas, orçamentos...) são pequenas e vão inteiras.
+
+A restauração aplica os backups em ordem. O completo é inserido em lote
+(COPY no Postgres), com as tabelas sem dependência entre si carregadas em
+paralelo (--jobs, no Postgres), cada uma na sua transação. Cada incremental
+é aplicado numa transação só: upsert pela chave primária (mães antes das
+filhas), exclusões dos tombstones, troca do conjunto de linhas filhas de
+cada lançamento alterado ou apagado e, por fim, nas tabelas que vão
+inteiras, exclusão das linhas que não estão mais no backup (filhas antes
+das mães). Assim o que foi apagado entre um backup e outro não volta.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import Date, DateTime, delete, func, insert, select, text, tuple_, type_coerce
+from sqlalchemy.types import NullType
+
+from . import db
+from .bootstrap import schema_hash
+from .dbutil import is_postgres, upsert
+
+FORMAT = "financas-casa-backup"
+VERSION = 1
+CHUNK_ROWS = int(os.getenv("BACKUP_CHUNK_ROWS", "50000"))
+OVERLAP = timedelta(seconds=int(os.getenv("BACKUP_OVERLAP", "300")))
+INSERT_BATCH = 5000
+EXCLUDED = {"app_meta"}  # controle do bootstrap, não é dado
+DERIVED = {"postings", "category_spend", "category_closure"}  # refeitas (rebuild_postings, rebuild_spend, rebuild_closure)
+INCREMENTAL_BY_ID = {"transaction_events", "transaction_tombstones"}
+TRANSACTION_CHILDREN = {"transaction_splits", "transaction_tags"}  # trocadas por lançamento
+
+
+class BackupError(RuntimeError):
+    pass
+
+
+def backup_folder() -> Path:
+    return Path(os.getenv("BACKUP_FOLDER") or Path(current_app.config["BASE_DIR"]) / "backups")
+
+
+def _tables():
+    return [t for t in db.metadata.sorted_tables if t.name not in EXCLUDED]
+
+
+def _json_value(v):
+    return v.isoformat() if isinstance(v, (date, datetime)) else v
+
+
+class _HashingWriter:
+    """Arquivo que calcula o sha256 do que é gravado (já comprimido)."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha = hashlib.sha256()
+
+    def write(self, data):
+        self.sha.update(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+
+def _json_default(v):
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    raise TypeError(f"{type(v).__name__} não serializável")
+
+
+# o encoder em C só chama _json_default para datas; o resto não passa por Python
+_encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_json_default).encode
+
+
+def _write_chunk(path: Path, rows) -> str:
+    data = "\n".join(map(_encode, map(tuple, rows))) + "\n"
+    with open(path, "wb") as raw:
+        out = _HashingWriter(raw)
+        # compresslevel 3: bem mais rápido que o padrão (9) e quase o mesmo tamanho em JSON
+        with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=3, mtime=0) as gz:
+            gz.write(data.encode())
+    return out.sha.hexdigest()
+
+
+def _watermark_filter(table, previous: dict):
+    """(condição WHERE, coluna da nova marca d'água) da tabela no modo incremental."""
+    mark = (previous or {}).get(table.name)
+    if table.name in TRANSACTION_CHILDREN:
+        # todas as linhas dos lançamentos que entram no incremental (mesma marca)
+        tx = db.metadata.tables["transactions"]
+        changed, _ = _watermark_filter(tx, previous)
+        if changed is None:
+            return None, None
+        return table.c.transaction_id.in_(select(tx.c.id).where(changed)), None
+    if "updated_at" in table.c:
+        col = table.c.updated_at
+        # relê a janela antes da marca: gravações que fizeram commit depois da leitura (upsert)
+        value = datetime.fromisoformat(mark) - OVERLAP if mark else None
+        return (col >= value if value is not None else None), col
+    if table.name in INCREMENTAL_BY_ID:
+        return (table.c.id > mark if mark is not None else None), table.c.id
+    return None, None
+
+
+def backup(out: Path, since: Path = None, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Grava o backup em `out` e devolve o manifesto."""
+    previous = _read_manifest(since) if since else None
+    out.mkdir(parents=True, exist_ok=False)
+    manifest = {
+        "format": FORMAT,
+        "version": VERSION,
+        "schema_hash": schema_hash(),
+        "dialect": db.engine.dialect.name,
+        "created_at": datetime.utcnow().isoformat(),
+        "mode": "incremental" if previous else "full",
+        "base": previous["created_at"] if previous else None,
+        "watermarks": {},
+        "tables": {},
+    }
+    options = {"isolation_level": "REPEATABLE READ"} if is_postgres() else {}
+    # Postgres: uma transação REPEATABLE READ = todas as tabelas no mesmo instante
+    with db.engine.connect().execution_options(**options) as conn:
+        for table in _tables():
+            if previous and table.name in DERIVED:
+                continue
+            cond, mark_col = _watermark_filter(table, previous["watermarks"] if previous else None)
+            # sem conversão de tipo no resultado: no SQLite datas já vêm como texto ISO
+            stmt = select(*[type_coerce(c, NullType()).label(c.name) for c in table.columns]).select_from(table)
+            stmt = stmt.order_by(*table.primary_key.columns)
+            if previous and cond is not None:
+                stmt = stmt.where(cond)
+            columns = [c.name for c in table.columns]
+            mark_idx = columns.index(mark_col.name) if mark_col is not None else None
+            mark = (previous or {}).get("watermarks", {}).get(table.name)
+            chunks = []
+            result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(stmt)
+            for n, part in enumerate(result.partitions(chunk_rows), start=1):
+                name = f"{table.name}.{n:05d}.jsonl.gz"
+                sha = _write_chunk(out / name, part)
+                chunks.append({"file": name, "rows": len(part), "sha256": sha})
+                if mark_idx is not None:
+                    top = max(r[mark_idx] for r in part)
+                    top = _json_value(top)
+                    mark = top if mark is None or top > mark else mark
+            manifest["tables"][table.name] = {"columns": columns, "chunks": chunks}
+            if mark_col is not None:
+                manifest["watermarks"][table.name] = mark
+    # manifesto por último: uma pasta sem ele é um backup incompleto
+    (out / "manifest.json").write_text(json.dumps(manifest, indent=1))
+    return manifest
+
+
+def _read_manifest(folder: Path) -> dict:
+    path = Path(folder) / "manifest.json"
+    if not path.exists():
+        raise BackupError(f"{folder}: sem manifest.json (backup incompleto?)")
+    manifest = json.loads(path.read_text())
+    if manifest.get("format") != FORMAT or manifest.get("version", 0) > VERSION:
+        raise BackupError(f"{folder}: formato {manifest.get('format')} v{manifest.get('version')} não suportado")
+    return manifest
+
+
+def verify(folder: Path) -> dict:
+    """Confere o sha256 de todos os arquivos; devolve o manifesto."""
+    manifest = _read_manifest(folder)
+    for name, info in manifest["tables"].items():
+        for chunk in info["chunks"]:
+            sha = hashlib.sha256()
+            with open(Path(folder) / chunk["file"], "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(block)
+            if sha.hexdigest() != chunk["sha256"]:
+                raise BackupError(f"{chunk['file']}: checksum não confere")
+    return manifest
+
+
+def _converters(table, columns):
+    """([(coluna, conversor)] das datas, [colunas que não existem mais no modelo])."""
+    convert, dropped = [], []
+    for name in columns:
+        col = table.c.get(name)
+        if col is None:
+            dropped.append(name)
+        elif isinstance(col.type, DateTime):
+            convert.append((name, datetime.fromisoformat))
+        elif isinstance(col.type, Date):
+            convert.append((name, date.fromisoformat))
+    return convert, dropped
+
+
+_decode = json.JSONDecoder().decode
+
+
+def _read_rows(path: Path, columns, converters):
+    convert, dropped = converters
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            row = dict(zip(columns, _decode(line)))
+            for name, fn in convert:
+                if row[name] is not None:
+                    row[name] = fn(row[name])
+            for name in dropped:
+                del row[name]
+            yield row
+
+
+_COPY_ESCAPE = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_chunk(conn, table, path: Path, columns) -> int:
+    """Postgres: COPY ... FROM STDIN do arquivo inteiro (datas ISO e booleanos vão como texto)."""
+    keep = [i for i, c in enumerate(columns) if c in table.c]
+    pick = None if len(keep) == len(columns) else keep
+    buf = io.StringIO()
+    n = 0
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            values = _decode(line)
+            if pick:
+                values = [values[i] for i in pick]
+            buf.write("\t".join([
+                "\\N" if v is None else v.translate(_COPY_ESCAPE) if type(v) is str else str(v)
+                for v in values
+            ]))
+            buf.write("\n")
+            n += 1
+    buf.seek(0)
+    cols = ", ".join(f'"{columns[i]}"' for i in keep)
+    with conn.connection.cursor() as cur:
+        cur.copy_expert(f'COPY "{table.name}" ({cols}) FROM STDIN', buf)
+    return n
+
+
+def _copied_whole(table) -> bool:
+    """Tabela que vai inteira em todo backup (sem marca d'água)."""
+    return (
+        table.name not in DERIVED and table.name not in TRANSACTION_CHILDREN
+        and table.name not in INCREMENTAL_BY_ID and "updated_at" not in table.c
+    )
+
+
+def _restore_table(table, folder: Path, info: dict) -> int:
+    """Carga de uma tabela do backup completo, na sua própria transação."""
+    with db.engine.begin() as conn:
+        total = _load_table(conn, table, folder, info, merge=False)
+        _reset_sequence(conn, table)
+    return total
+
+
+def _reset_sequence(conn, table):
+    if is_postgres() and "id" in table.c:
+        # ids vieram do backup: o sequence precisa continuar depois deles
+        # (setval é strict: tabela sem sequence recebe NULL e não faz nada)
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), COALESCE(MAX(id), 0) + 1, false) "
+            f"FROM {table.name}"
+        ))
+
+
+def _load_table(conn, table, folder: Path, info: dict, merge: bool, keys: set = None) -> int:
+    """Insere (ou, com `merge`, faz upsert das) linhas da tabela; guarda as chaves em `keys`."""
+    converters = _converters(table, info["columns"])
+    pk = [c.name for c in table.primary_key.columns]
+    # transactions particionada tem PK (id, txn_date): se a data mudou, o upsert
+    # criaria uma segunda linha com o mesmo id; então apaga pelo id e insere
+    replace_by_id = merge and len(pk) > 1 and "id" in table.c
+    if merge and not replace_by_id:
+        stmt = upsert(table)
+        updatable = [c for c in info["columns"] if c in table.c and c not in pk]
+        if updatable:
+            stmt = stmt.on_conflict_do_update(index_elements=pk, set_={c: stmt.excluded[c] for c in updatable})
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=pk)
+    else:
+        stmt = insert(table)
+
+    def flush(batch):
+        if replace_by_id:
+            conn.execute(delete(table).where(table.c.id.in_([r["id"] for r in batch])))
+        conn.execute(stmt, batch)
+        if keys is not None:
+            keys.update(tuple(r[c] for c in pk) for r in batch)
+        return len(batch)
+
+    total = 0
+    for chunk in info["chunks"]:
+        if is_postgres() and not merge:
+            total += _copy_chunk(conn, table, folder / chunk["file"], info["columns"])
+            continue
+        batch = []
+        for row in _read_rows(folder / chunk["file"], info["columns"], converters):
+            batch.append(row)
+            if len(batch) >= INSERT_BATCH:
+                total += flush(batch)
+                batch = []
+        if batch:
+            total += flush(batch)
+    return total
+
+
+def _levels(tables) -> list:
+    """Tabelas agrupadas por nível de dependência (FK): cada nível pode ir em paralelo."""
+    level = {}
+    for t in tables:  # sorted_tables: dependências sempre antes
+        deps = [level[fk.column.table.name] for fk in t.foreign_keys if fk.column.table.name in level and fk.column.table is not t]
+        level[t.name] = max(deps, default=-1) + 1
+    out = [[] for _ in range(max(level.values(), default=-1) + 1)]
+    for t in tables:
+        out[level[t.name]].append(t)
+    return out
+
+
+def _column_values(folder: Path, info: dict, column: str) -> set:
+    """Valores de uma coluna em todos os arquivos de uma tabela do backup."""
+    if not info or column not in info["columns"]:
+        return set()
+    idx = info["columns"].index(column)
+    out = set()
+    for chunk in info["chunks"]:
+        with gzip.open(folder / chunk["file"], "rb") as f:
+            for line in f:
+                out.add(_decode(line.decode())[idx])
+    return out
+
+
+def _delete_in(conn, column, values):
+    values = list(values)
+    for i in range(0, len(values), INSERT_BATCH):
+        conn.execute(delete(column.table).where(column.in_(values[i:i + INSERT_BATCH])))
+
+
+def _delete_missing(conn, table, keys: set):
+    """Apaga as linhas cuja chave não está no backup (a tabela foi copiada inteira)."""
+    pk = list(table.primary_key.columns)
+    gone = [k for k in map(tuple, conn.execute(select(*pk))) if k not in keys]
+    if not gone:
+        return
+    if len(pk) == 1:
+        _delete_in(conn, pk[0], [k[0] for k in gone])
+        return
+    for i in range(0, len(gone), INSERT_BATCH):
+        conn.execute(delete(table).where(tuple_(*pk).in_(gone[i:i + INSERT_BATCH])))
+
+
+def _apply_incremental(conn, folder: Path, manifest: dict, tables) -> dict:
+    """Aplica um backup incremental numa transação só (ver docstring do módulo)."""
+    infos = manifest["tables"]
+    tx = db.metadata.tables["transactions"]
+    changed = _column_values(folder, infos.get("transactions"), "id")
+    gone = _column_values(folder, infos.get("transaction_tombstones"), "transaction_id")
+    counts, snapshots = {}, []
+    for t in tables:  # sorted_tables: mães antes das filhas
+        info = infos[t.name]
+        if t.name in TRANSACTION_CHILDREN:
+            # conjunto inteiro por lançamento: apaga as linhas antigas e insere as do backup
+            # (backups antigos trazem a tabela inteira: os ids dela entram na troca)
+            owners = changed | gone | _column_values(folder, info, "transaction_id")
+            _delete_in(conn, t.c.transaction_id, owners)
+            counts[t.name] = _load_table(conn, t, folder, info, merge=False)
+        elif _copied_whole(t):
+            keys = set()
+            counts[t.name] = _load_table(conn, t, folder, info, merge=True, keys=keys)
+            snapshots.append((t, keys))
+        else:
+            counts[t.name] = _load_table(conn, t, folder, info, merge=True)
+    for name in TRANSACTION_CHILDREN - set(infos):
+        _delete_in(conn, db.metadata.tables[name].c.transaction_id, gone)
+    # lançamentos apagados depois do backup anterior saem também na restauração
+    _delete_in(conn, tx.c.id, gone)
+    for t, keys in reversed(snapshots):  # filhas antes das mães
+        _delete_missing(conn, t, keys)
+    for t in tables:
+        _reset_sequence(conn, t)
+    return counts
+
+
+def restore(folders: list, replace: bool = False, jobs: int = 4, log=print) -> dict:
+    """Restaura um backup completo seguido de incrementais, em ordem."""
+    manifests = [verify(Path(f)) for f in folders]
+    if manifests[0]["mode"] != "full":
+        raise BackupError("o primeiro backup da lista precisa ser completo")
+    if any(m["mode"] != "incremental" for m in manifests[1:]):
+        raise BackupError("depois do completo, só backups incrementais")
+    if manifests[0]["schema_hash"] != schema_hash():
+        log("Aviso: backup de outra versão do schema; colunas são casadas por nome.")
+
+    tables = _tables()
+    if replace:
+        with db.engine.begin() as conn:
+            for t in reversed(db.metadata.sorted_tables):
+                if t.name not in EXCLUDED:
+                    conn.execute(delete(t))
+    else:
+        with db.engine.connect() as conn:
+            has_data = conn.execute(select(func.count()).select_from(db.metadata.tables["transactions"])).scalar()
+        if has_data:
+            raise BackupError("o banco já tem lançamentos; use --replace para substituir tudo")
+
+    if not is_postgres():
+        jobs = 1  # SQLite só tem um escritor por vez
+    counts = {}
+    for i, (folder, manifest) in enumerate(zip(folders, manifests)):
+        folder = Path(folder)
+        present = [t for t in tables if t.name in manifest["tables"]]
+        if i > 0:
+            with db.engine.begin() as conn:
+                for name, n in _apply_incremental(conn, folder, manifest, present).items():
+                    counts[name] = counts.get(name, 0) + n
+            log(f"{folder.name}: {manifest['mode']} aplicado.")
+            continue
+        for level in _levels(present):
+            if jobs <= 1:
+                for t in level:
+                    counts[t.name] = counts.get(t.name, 0) + _restore_table(t, folder, manifest["tables"][t.name])
+                continue
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                futures = {
+                    t.name: pool.submit(_restore_app_context, current_app._get_current_object(),
+                                        t, folder, manifest["tables"][t.name])
+                    for t in level
+                }
+                for name, fut in futures.items():
+                    counts[name] = counts.get(name, 0) + fut.result()
+        log(f"{folder.name}: {manifest['mode']} aplicado.")
+
+    if len(folders) > 1:
+        from .alerts import rebuild_spend
+        from .categories import rebuild_closure
+        from .ledger import rebuild_postings
+        counts["postings"] = rebuild_postings()
+        counts["category_closure"] = rebuild_closure()
+        counts["category_spend"] = rebuild_spend()
+        db.session.commit()
+    return counts
+
+
+def _restore_app_context(app, *args):
+    with app.app_context():
+        return _restore_table(*args)
+
+
+@click.command("backup")
+@click.option("--out", type=click.Path(file_okay=False), help="Pasta do backup (padrão: BACKUP_FOLDER/<data-hora>).")
+@click.option("--since", type=click.Path(exists=True, file_okay=False), help="Backup anterior: grava só o que mudou.")
+@click.option("--chunk-rows", type=int, default=CHUNK_ROWS, show_default=True)
+@with_appcontext
+def backup_command(out, since, chunk_rows):
+    """Backup comprimido, em blocos com checksum, de todas as tabelas."""
+    out = Path(out) if out else backup_folder() / datetime.now().strftime("%Y%m%d_%H%M%S")
+    started = datetime.now()
+    manifest = backup(out, Path(since) if since else None, chunk_rows)
+    rows = sum(c["rows"] for t in manifest["tables"].values() for c in t["chunks"])
+    secs = (datetime.now() - started).total_seconds()
+    click.echo(f"Backup {manifest['mode']}: {rows} linhas em {secs:.1f}s -> {out}")
+
+
+@click.command("restore")
+@click.argument("folders", nargs=-1, required=True, type=click.Path(exists=True, file_okay=False))
+@click.option("--replace", is_flag=True, help="Apaga os dados atuais antes de restaurar.")
+@click.option("--jobs", type=int, default=4, show_default=True, help="Tabelas carregadas em paralelo (Postgres).")
+@with_appcontext
+def restore_command(folders, replace, jobs):
+    """Restaura um backup completo e, em seguida, os incrementais informados."""
+    try:
+        counts = restore(list(folders), replace=replace, jobs=jobs, log=click.echo)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    for name, n in counts.items():
+        click.echo(f"  {name}: {n}")
+
+
+def init_app(app):
+    app.cli.add_command(backup_command)
+    app.cli.add_command(restore_command)
@@ -0,0 +1,117 @@
+"""Criação/atualização do schema e seed, uma vez só por versão do schema.
+
+Antes cada worker rodava create_all + upgrade_schema + seed a cada boot.
+Agora o hash dos modelos (tabelas, colunas, índices) fica gravado em
+app_meta; se o banco já está nessa versão, o boot custa um único SELECT.
+Quando não está, o primeiro worker a pegar o lock (advisory lock no
+Postgres, lock de arquivo no SQLite) aplica e os outros só conferem.
+
+DB_INIT=auto (padrão) faz isso no boot; DB_INIT=skip não toca no schema,
+e a atualização roda no deploy com `flask init-db`.
+"""
+import hashlib
+import os
+from contextlib import contextmanager
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from . import alerts, categories, db, ledger, tags
+from .dbutil import is_postgres
+from .models import AppMeta, seed_if_empty
+from .schema import upgrade_schema
+
+SCHEMA_KEY = "schema_hash"
+LOCK_ID = 7241_0035  # chave do pg_advisory_lock
+
+
+def schema_hash() -> str:
+    h = hashlib.sha256()
+    for table in db.metadata.sorted_tables:
+        h.update(table.name.encode())
+        for c in table.columns:
+            default = c.server_default.arg if c.server_default is not None else None
+            h.update(f"|{c.name}:{c.type!r}:{c.nullable}:{default}".encode())
+        for ix in sorted(table.indexes, key=lambda i: i.name):
+            h.update(f"|{ix.name}:{[c.name for c in ix.columns]}:{ix.unique}".encode())
+    return h.hexdigest()[:16]
+
+
+def applied_hash():
+    try:
+        return db.session.execute(select(AppMeta.value).where(AppMeta.key == SCHEMA_KEY)).scalar()
+    except (OperationalError, ProgrammingError):
+        # banco novo: app_meta ainda não existe
+        db.session.rollback()
+        return None
+
+
+@contextmanager
+def init_lock():
+    """Lock entre processos das tarefas de boot (schema e seed, partições)."""
+    if is_postgres():
+        with db.engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": LOCK_ID})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LOCK_ID})
+        return
+    database = db.engine.url.database
+    try:
+        import fcntl
+    except ImportError:  # Windows: sem lock entre processos (uso local)
+        fcntl = None
+    if fcntl is None or not database or database == ":memory:":
+        yield
+        return
+    with open(database + ".init.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def init_database(force: bool = False) -> bool:
+    """Aplica schema + seed se o banco não estiver na versão atual. True se aplicou."""
+    target = schema_hash()
+    if not force and applied_hash() == target:
+        return False
+    with init_lock():
+        # outro worker pode ter aplicado enquanto esperávamos o lock
+        if not force and applied_hash() == target:
+            return False
+        db.create_all()
+        upgrade_schema()
+        seed_if_empty()
+        ledger.rebuild_if_empty()
+        categories.rebuild_if_empty()
+        alerts.rebuild_if_empty()
+        tags.rebuild_if_empty()
+        meta = db.session.get(AppMeta, SCHEMA_KEY) or AppMeta(key=SCHEMA_KEY)
+        meta.value = target
+        db.session.add(meta)
+        db.session.commit()
+    return True
+
+
+@click.command("init-db")
+@click.option("--force", is_flag=True, help="Reaplica mesmo se o schema já estiver atualizado.")
+@with_appcontext
+def init_db_command(force):
+    """Cria/atualiza tabelas e dados padrão (rodar no deploy com DB_INIT=skip)."""
+    applied = init_database(force=force)
+    click.echo("Schema atualizado." if applied else "Schema já estava atualizado.")
+
+
+def init_app(app):
+    app.cli.add_command(init_db_command)
+    if os.getenv("DB_INIT", "auto").lower() == "skip":
+        return
+    with app.app_context():
+        if init_database():
+            current_app.logger.info("Schema/seed aplicados (%s).", schema_hash())
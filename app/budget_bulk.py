@@ -0,0 +1,170 @@
+"""Edição de orçamentos em lote: matriz categoria x mês e cópia de meses.
+
+Tudo roda em uma única transação e grava com INSERT ... ON CONFLICT
+(month, category_id) DO UPDATE, sem ler as linhas antes.
+"""
+import re
+
+from sqlalchemy import func, literal, or_, select, true, union_all
+
+from . import db
+from .budget_engine import month_list
+from .dbutil import upsert
+from .models import Budget, BudgetTemplate, Category
+from .tenancy import household_for_insert
+
+MONTH_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+MAX_CELLS = 5000
+CHUNK = 500  # linhas por INSERT (limite de parâmetros do SQLite)
+
+
+class BulkBudgetError(ValueError):
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def _check_month(value, field: str, errors: list):
+    if not isinstance(value, str) or not MONTH_RE.match(value):
+        errors.append(f"{field}: mês inválido ({value!r}), use YYYY-MM.")
+        return None
+    return value
+
+
+def parse_cells(payload: dict) -> list:
+    """Normaliza o corpo da requisição em [(month, category_id, amount)].
+
+    Aceita {"cells": [{"month", "category_id", "amount"}, ...]}
+    ou {"matrix": {"<category_id>": {"YYYY-MM": amount, ...}, ...}}.
+    """
+    errors = []
+    raw = []
+    if isinstance(payload.get("cells"), list):
+        for i, c in enumerate(payload["cells"]):
+            if not isinstance(c, dict):
+                errors.append(f"cells[{i}]: objeto esperado.")
+                continue
+            raw.append((f"cells[{i}]", c.get("month"), c.get("category_id"), c.get("amount")))
+    elif isinstance(payload.get("matrix"), dict):
+        for cid, months in payload["matrix"].items():
+            if not isinstance(months, dict):
+                errors.append(f"matrix[{cid}]: objeto mês -> valor esperado.")
+                continue
+            for ym, amount in months.items():
+                raw.append((f"matrix[{cid}][{ym}]", ym, cid, amount))
+    else:
+        raise BulkBudgetError(["Envie 'cells' (lista) ou 'matrix' (categoria -> mês -> valor)."])
+
+    if len(raw) > MAX_CELLS:
+        raise BulkBudgetError([f"Máximo de {MAX_CELLS} células por requisição."])
+
+    cells = {}
+    for where, ym, cid, amount in raw:
+        ym = _check_month(ym, where, errors)
+        try:
+            cid = int(cid)
+        except (TypeError, ValueError):
+            errors.append(f"{where}: category_id inválido ({cid!r}).")
+            continue
+        try:
+            amount = round(float(amount), 2)
+        except (TypeError, ValueError):
+            errors.append(f"{where}: valor inválido ({amount!r}).")
+            continue
+        if amount < 0:
+            errors.append(f"{where}: valor não pode ser negativo.")
+            continue
+        if ym:
+            cells[(ym, cid)] = amount  # a última ocorrência vence
+
+    ids = {cid for _, cid in cells}
+    if ids:
+        valid = set(db.session.execute(
+            select(Category.id).where(Category.id.in_(ids), Category.kind == "expense")
+        ).scalars())
+        for cid in sorted(ids - valid):
+            errors.append(f"Categoria {cid} não existe ou não é de despesa.")
+
+    if errors:
+        raise BulkBudgetError(errors)
+    return [(ym, cid, amount) for (ym, cid), amount in cells.items()]
+
+
+def upsert_cells(cells: list) -> int:
+    """Grava as exceções; não faz commit."""
+    hid = household_for_insert()
+    for i in range(0, len(cells), CHUNK):
+        values = [
+            {"household_id": hid, "month": m, "category_id": c, "planned_amount": a}
+            for m, c, a in cells[i:i + CHUNK]
+        ]
+        stmt = upsert(Budget).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Budget.month, Budget.category_id],
+            set_={"planned_amount": stmt.excluded.planned_amount},
+        )
+        db.session.execute(stmt)
+    return len(cells)
+
+
+def clone_month(source: str, start: str, end: str = None, scale: float = 1.0, effective: bool = False) -> int:
+    """Copia as exceções de `source` para cada mês de start..end (multiplicadas por `scale`).
+
+    Com effective=True copia o orçamento efetivo (padrão + exceção) de todas as
+    categorias orçadas, útil para "congelar" um ano novo a partir de um mês.
+    Não faz commit. Retorna quantas linhas foram gravadas.
+    """
+    errors = []
+    _check_month(source, "source", errors)
+    _check_month(start, "start", errors)
+    if end is not None:
+        _check_month(end, "end", errors)
+    try:
+        scale = float(scale)
+        if scale < 0:
+            errors.append("scale não pode ser negativo.")
+    except (TypeError, ValueError):
+        errors.append(f"scale inválido ({scale!r}).")
+    if errors:
+        raise BulkBudgetError(errors)
+    targets = [m for m in month_list(start, end) if m != source]
+    if not targets:
+        raise BulkBudgetError(["Intervalo de destino vazio."])
+    if len(targets) > 120:
+        raise BulkBudgetError(["Intervalo de destino maior que 10 anos."])
+
+    months = union_all(*[select(literal(m).label("month")) for m in targets]).subquery("targets")
+
+    # INSERT ... SELECT não passa pelo filtro automático de tenancy: filtra aqui
+    hid = household_for_insert()
+    if effective:
+        amount = func.coalesce(Budget.planned_amount, BudgetTemplate.planned_amount)
+        source_rows = (
+            select(Category.id.label("category_id"), amount.label("amount"))
+            .outerjoin(BudgetTemplate, BudgetTemplate.category_id == Category.id)
+            .outerjoin(Budget, (Budget.category_id == Category.id) & (Budget.month == source))
+            .where(Category.household_id == hid)
+            .where(or_(BudgetTemplate.id.isnot(None), Budget.id.isnot(None)))
+            .subquery("src")
+        )
+    else:
+        source_rows = (
+            select(Budget.category_id, Budget.planned_amount.label("amount"))
+            .where(Budget.household_id == hid, Budget.month == source)
+            .subquery("src")
+        )
+
+    sel = (
+        select(literal(hid), months.c.month, source_rows.c.category_id, source_rows.c.amount * scale)
+        .select_from(months)
+        .join(source_rows, true())
+        # o WHERE evita a ambiguidade de INSERT ... SELECT ... ON CONFLICT no SQLite
+        .where(source_rows.c.category_id.isnot(None))
+    )
+    stmt = upsert(Budget).from_select(["household_id", "month", "category_id", "planned_amount"], sel)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Budget.month, Budget.category_id],
+        set_={"planned_amount": stmt.excluded.planned_amount},
+    )
+    result = db.session.execute(stmt)
+    return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else 0
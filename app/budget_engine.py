@@ -0,0 +1,184 @@
+"""Orçamento x realizado por categoria (chave = category_id, não o nome).
+
+Uma única query resolve, para cada categoria, o orçamento efetivo do
+período: meses sem exceção usam o padrão (BudgetTemplate) e meses com
+exceção (Budget) usam o valor do mês. No mesmo SELECT entra o gasto real,
+convertido para a moeda dos relatórios (ver currency.py), somando as
+subcategorias (JOIN em category_closure, ver categories.py): orçamento de
+Moradia cobre Aluguel, Condomínio e Luz. Lançamento dividido conta cada
+linha na sua categoria (ver splits.py).
+
+    planejado = padrão * (meses - meses_com_exceção) + soma(exceções)
+
+Funciona para um mês, um trimestre ou um ano inteiro (`period_months`, o
+`period=` do dashboard e de /budgets), e o resultado fica em cache por
+período + versão dos dados + impressão digital dos lançamentos do período
+(gravações feitas em outro worker também invalidam; ver cache.py).
+"""
+import re
+
+from sqlalchemy import func, or_, select
+
+from . import db
+from .cache import cached, transactions_fingerprint
+from .categories import paths
+from .currency import converted
+from .models import Budget, BudgetTemplate, Category, CategoryClosure, Transaction
+from .splits import line_columns
+from .utils import month_first_day, next_month_first_day
+
+
+def month_list(start_ym: str, end_ym: str = None) -> list:
+    """['2025-11', '2025-12', '2026-01'] para start='2025-11', end='2026-01'."""
+    end_ym = end_ym or start_ym
+    y, m = map(int, start_ym.split("-"))
+    out = []
+    while f"{y:04d}-{m:02d}" <= end_ym:
+        out.append(f"{y:04d}-{m:02d}")
+        m += 1
+        if m == 13:
+            y, m = y + 1, 1
+    return out
+
+
+def period_months(period: str) -> list:
+    """Aceita 'YYYY-MM', 'YYYY-Qn' (trimestre, n de 1 a 4) ou 'YYYY' (ano).
+
+    Qualquer outra coisa (ex.: '2025-Q5', '2025-13') é ValueError.
+    """
+    period = (period or "").strip().upper()
+    match = re.fullmatch(r"(\d{4})(?:-Q([1-4])|-(\d{2}))?", period)
+    if not match or (match.group(3) and not 1 <= int(match.group(3)) <= 12):
+        raise ValueError("Período inválido: use YYYY-MM, YYYY-Qn (trimestre de 1 a 4) ou YYYY.")
+    year, quarter, month = match.groups()
+    if month:
+        return [period]
+    if quarter:
+        first = (int(quarter) - 1) * 3 + 1
+        return month_list(f"{year}-{first:02d}", f"{year}-{first + 2:02d}")
+    return month_list(f"{year}-01", f"{year}-12")
+
+
+def budget_vs_actual(start_ym: str, end_ym: str = None) -> list:
+    """Linhas {category_id, category, planned, spent, remaining, nested, ...} do período.
+
+    Só entram categorias com orçamento (padrão ou exceção em algum mês).
+    `category` é o caminho ("Moradia › Aluguel"); `nested` marca as que estão
+    dentro de outra categoria com orçamento (não somar as duas no total).
+    Ordenadas pelo saldo (quem estourou primeiro), como no dashboard.
+    """
+    months = month_list(start_ym, end_ym)
+    version = transactions_fingerprint(month_first_day(months[0]), next_month_first_day(months[-1]))
+    return cached(("budget_vs_actual", months[0], months[-1], version), lambda: _compute(months))
+
+
+def _compute(months: list) -> list:
+    start = month_first_day(months[0])
+    end = next_month_first_day(months[-1])
+
+    overrides = (
+        select(
+            Budget.category_id,
+            func.count(Budget.id).label("n"),
+            func.sum(Budget.planned_amount).label("total"),
+        )
+        .where(Budget.month.in_(months))
+        .group_by(Budget.category_id)
+        .subquery()
+    )
+    category, line_amount, with_lines = line_columns()
+    amount, with_rates = converted(line_amount, Transaction.currency, Transaction.txn_date, start, end)
+    spent = (
+        with_rates(
+            with_lines(select(CategoryClosure.ancestor_id.label("category_id"), func.sum(amount).label("amount"))
+                       .select_from(Transaction))
+            .join(CategoryClosure, CategoryClosure.descendant_id == category)
+        )
+        .where(
+            Transaction.txn_type == "expense",
+            Transaction.txn_date >= start,
+            Transaction.txn_date < end,
+        )
+        .group_by(CategoryClosure.ancestor_id)
+        .subquery()
+    )
+
+    template_amount = func.coalesce(BudgetTemplate.planned_amount, 0)
+    n_overrides = func.coalesce(overrides.c.n, 0)
+    planned = template_amount * (len(months) - n_overrides) + func.coalesce(overrides.c.total, 0)
+
+    stmt = (
+        select(
+            Category.id,
+            Category.name,
+            template_amount.label("template_amount"),
+            n_overrides.label("n_overrides"),
+            overrides.c.total,
+            planned.label("planned"),
+            func.coalesce(spent.c.amount, 0).label("spent"),
+        )
+        .outerjoin(BudgetTemplate, BudgetTemplate.category_id == Category.id)
+        .outerjoin(overrides, overrides.c.category_id == Category.id)
+        .outerjoin(spent, spent.c.category_id == Category.id)
+        .where(or_(BudgetTemplate.id.isnot(None), overrides.c.category_id.isnot(None)))
+    )
+
+    names = paths()
+    rows = []
+    for r in db.session.execute(stmt):
+        planned_f = float(r.planned or 0)
+        spent_f = float(r.spent or 0)
+        has_override = bool(r.n_overrides)
+        rows.append({
+            "category_id": r.id,
+            "category": names.get(r.id, r.name),
+            "template_amount": float(r.template_amount or 0),
+            # valor da exceção só faz sentido quando o período é um mês
+            "month_amount": float(r.total) if has_override and len(months) == 1 else None,
+            "has_override": has_override,
+            "planned": planned_f,
+            "spent": spent_f,
+            "remaining": planned_f - spent_f,
+        })
+    _mark_nested(rows)
+    rows.sort(key=lambda r: r["remaining"])
+    return rows
+
+
+def _mark_nested(rows: list):
+    ids = [r["category_id"] for r in rows]
+    nested = set()
+    if len(ids) > 1:
+        nested = set(db.session.execute(
+            select(CategoryClosure.descendant_id).where(
+                CategoryClosure.descendant_id.in_(ids),
+                CategoryClosure.ancestor_id.in_(ids),
+                CategoryClosure.depth > 0,
+            )
+        ).scalars())
+    for r in rows:
+        r["nested"] = r["category_id"] in nested
+
+
+def period_totals(start_ym: str, end_ym: str = None) -> dict:
+    """{'income': x, 'expense': y} do período na moeda dos relatórios, agregado no banco (sem transferências)."""
+    months = month_list(start_ym, end_ym)
+    start, end = month_first_day(months[0]), next_month_first_day(months[-1])
+
+    def compute():
+        amount, with_rates = converted(Transaction.amount, Transaction.currency, Transaction.txn_date, start, end)
+        rows = db.session.execute(
+            with_rates(select(Transaction.txn_type, func.sum(amount)))
+            .where(
+                Transaction.txn_type != "transfer",
+                Transaction.txn_date >= start,
+                Transaction.txn_date < end,
+            )
+            .group_by(Transaction.txn_type)
+        ).all()
+        totals = {"income": 0.0, "expense": 0.0}
+        for txn_type, amount in rows:
+            totals[txn_type] = float(amount or 0)
+        return totals
+
+    return cached(("period_totals", months[0], months[-1], transactions_fingerprint(start, end)), compute)
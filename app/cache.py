@@ -0,0 +1,115 @@
+"""Cache em memória (por processo) invalidado pela versão dos dados.
+
+Todo commit que grava algo incrementa `data_version()`, o que invalida as
+entradas deste processo na hora. Outros workers do gunicorn não ficam
+sabendo do commit, então cada entrada também expira após `CACHE_TTL`
+segundos: esse é o atraso máximo entre workers.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import singleflight
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", "30"))
+
+_lock = threading.Lock()
+_version = 0
+_store = {}  # key -> (expira_em, versão, valor)
+
+
+def data_version() -> int:
+    return _version
+
+
+def bump_data_version():
+    global _version
+    with _lock:
+        _version += 1
+        _store.clear()
+
+
+def cached(key, fn, ttl: int = None):
+    """Retorna o valor em cache para `key` ou calcula com `fn()`.
+
+    A chave sempre inclui a casa (household) da requisição atual.
+    """
+    from .tenancy import current_household_id
+    key = (current_household_id(), key)
+    now = time.monotonic()
+    hit = _store.get(key)
+    if hit and hit[0] > now and hit[1] == _version:
+        return hit[2]
+    version = _version
+    # pedidos simultâneos com a mesma chave calculam uma vez só
+    value = singleflight.do(("cached", key, version), fn)
+    _store[key] = (now + (CACHE_TTL if ttl is None else ttl), version, value)
+    return value
+
+
+def transactions_fingerprint(start, end) -> tuple:
+    """(quantidade, maior updated_at, maior id) dos lançamentos em [start, end).
+
+    Uma consulta agregada barata que muda a cada inclusão, edição ou exclusão
+    no período, inclusive quando feita em outro worker: serve de chave de
+    cache entre processos. Etiquetas e linhas do rateio ficam em outras
+    tabelas; tags.set_tags e splits.apply tocam o updated_at do lançamento
+    para que a troca delas também mude a impressão digital.
+    """
+    from sqlalchemy import func
+    from . import db
+    from .models import Transaction
+    return tuple(db.session.query(
+        func.count(Transaction.id), func.max(Transaction.updated_at), func.max(Transaction.id)
+    ).filter(Transaction.txn_date >= start, Transaction.txn_date < end).one())
+
+
+def reference_fingerprint() -> str:
+    """Hash das categorias e contas da casa e das cotações carregadas.
+
+    Renomear/mover uma categoria, renomear uma conta ou carregar cotações não
+    mexe nos lançamentos (transactions_fingerprint fica igual), mas muda o
+    que sai nas exportações. As tabelas são pequenas: duas consultas curtas
+    e um agregado em exchange_rates.
+    """
+    import hashlib
+    from sqlalchemy import func, select
+    from . import db
+    from .currency import rates_fingerprint
+    from .models import Account, Category
+    categories = db.session.execute(
+        select(Category.id, Category.name, Category.parent_id, Category.kind).order_by(Category.id)
+    ).all()
+    accounts = db.session.execute(select(Account.id, Account.name, Account.currency).order_by(Account.id)).all()
+    return hashlib.sha1(repr((categories, accounts, rates_fingerprint())).encode()).hexdigest()[:16]
+
+
+def _mark_dirty(session, *args):
+    session.info["data_changed"] = True
+
+
+def _on_orm_execute(state):
+    # insert()/update()/delete() em lote via session.execute não passam pelo flush
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["data_changed"] = True
+
+
+def _after_commit(session):
+    if session.info.pop("data_changed", False):
+        bump_data_version()
+
+
+def _after_rollback(session):
+    session.info.pop("data_changed", None)
+
+
+def register_listeners():
+    if event.contains(Session, "after_commit", _after_commit):
+        return
+    event.listen(Session, "after_flush", _mark_dirty)
+    event.listen(Session, "do_orm_execute", _on_orm_execute)
+    event.listen(Session, "after_commit", _after_commit)
+    event.listen(Session, "after_rollback", _after_rollback)
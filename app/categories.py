@@ -0,0 +1,307 @@
+"""Categorias em árvore (Moradia -> Aluguel, Condomínio, Luz).
+
+Category.parent_id guarda o pai; category_closure guarda a árvore inteira,
+uma linha (ancestral, descendente, distância) por caminho, incluindo a
+própria categoria com distância 0. Assim "total de Moradia com as
+subcategorias" é um JOIN e um GROUP BY, sem consulta recursiva nem
+percorrer a árvore em Python:
+
+    SELECT c.ancestor_id, SUM(t.amount)
+      FROM transactions t JOIN category_closure c ON c.descendant_id = t.category_id
+     WHERE c.ancestor_id IN (...)
+     GROUP BY c.ancestor_id
+
+A tabela é mantida no mesmo flush que cria ou move a categoria (evento
+after_flush): criar liga a categoria aos ancestrais do pai; mover apaga os
+caminhos que entravam na subárvore por fora dela e liga a subárvore aos
+ancestrais do novo pai. `flask categories-rebuild` refaz tudo a partir de
+parent_id.
+
+Orçamentos (padrão e exceções) valem em qualquer nível: o gasto de uma
+categoria inclui o das subcategorias (budget_engine, alerts). Relatórios
+agrupam por nível e descem na árvore (`rollup`).
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, delete, event, func, insert, inspect, literal, or_, select, true
+from sqlalchemy.orm import Session, aliased
+
+from . import db
+from .cache import cached
+from .currency import convert, converted
+from .ledger import TRANSFER, TXN_TYPES
+from .models import Category, CategoryClosure, Transaction
+from .partitioning import archived_transactions
+from .splits import line_columns
+from .tags import condition
+
+SEPARATOR = " › "
+CLOSURE_COLUMNS = ["household_id", "ancestor_id", "descendant_id", "depth"]
+
+
+class CategoryTreeError(ValueError):
+    pass
+
+
+# ---------------- manutenção da closure ----------------
+def _link(conn, household_id: int, category_id: int, parent_id):
+    """Categoria nova: ela mesma (depth 0) e os ancestrais do pai."""
+    cc = CategoryClosure.__table__
+    conn.execute(insert(cc).values(household_id=household_id, ancestor_id=category_id,
+                                   descendant_id=category_id, depth=0))
+    if parent_id is not None:
+        conn.execute(insert(cc).from_select(CLOSURE_COLUMNS, select(
+            cc.c.household_id, cc.c.ancestor_id, literal(category_id), cc.c.depth + 1,
+        ).where(cc.c.descendant_id == parent_id)))
+
+
+def _move(conn, category_id: int, parent_id):
+    """Subárvore de `category_id` passa a ficar embaixo de `parent_id` (ou na raiz)."""
+    cc = CategoryClosure.__table__
+    inside = cc.alias("inside")
+    subtree = select(inside.c.descendant_id).where(inside.c.ancestor_id == category_id)
+    conn.execute(delete(cc).where(cc.c.descendant_id.in_(subtree), cc.c.ancestor_id.not_in(subtree)))
+    if parent_id is not None:
+        up, sub = cc.alias("up"), cc.alias("sub")
+        conn.execute(insert(cc).from_select(CLOSURE_COLUMNS, select(
+            up.c.household_id, up.c.ancestor_id, sub.c.descendant_id, up.c.depth + sub.c.depth + 1,
+        ).select_from(up.join(sub, true()))  # produto: ancestrais do pai x subárvore
+         .where(up.c.descendant_id == parent_id, sub.c.ancestor_id == category_id)))
+
+
+def _sync_closure(session, flush_context):
+    new = sorted((o for o in session.new if isinstance(o, Category)), key=lambda c: c.id)
+    moved = [
+        o for o in session.dirty
+        if isinstance(o, Category) and inspect(o).attrs.parent_id.history.has_changes()
+    ]
+    if not new and not moved:
+        return
+    conn = session.connection()
+    for c in new:  # pai antes do filho: ids crescentes
+        _link(conn, c.household_id, c.id, c.parent_id)
+    for c in moved:
+        _move(conn, c.id, c.parent_id)
+    if moved:
+        # o gasto acumulado por categoria (alerts) soma as subcategorias: refaz a casa
+        from .alerts import rebuild_spend
+        for household_id in {c.household_id for c in moved}:
+            rebuild_spend(household_id)
+
+
+def rebuild_closure(household_id: int = None) -> int:
+    """Refaz category_closure a partir de parent_id (todas as casas por padrão). Não faz commit."""
+    c = Category.__table__
+    cc = CategoryClosure.__table__
+    conn = db.session.connection()
+    stmt = select(c.c.id, c.c.parent_id, c.c.household_id)
+    del_stmt = delete(cc)
+    if household_id is not None:
+        stmt = stmt.where(c.c.household_id == household_id)
+        del_stmt = del_stmt.where(cc.c.household_id == household_id)
+    parents = {}
+    households = {}
+    for cid, parent_id, hid in conn.execute(stmt):
+        parents[cid] = parent_id
+        households[cid] = hid
+    conn.execute(del_stmt)
+
+    rows = []
+    for cid in parents:
+        node, depth, seen = cid, 0, set()
+        while node is not None and node not in seen:  # ciclo em dado antigo: para no repetido
+            seen.add(node)
+            rows.append({"household_id": households[cid], "ancestor_id": node, "descendant_id": cid, "depth": depth})
+            node, depth = parents.get(node), depth + 1
+    if rows:
+        conn.execute(insert(cc), rows)
+    return len(rows)
+
+
+def rebuild_if_empty():
+    """Primeira subida com a árvore: cada categoria existente vira raiz de si mesma."""
+    has_closure = db.session.execute(select(literal(1)).select_from(CategoryClosure).limit(1)).first()
+    has_categories = db.session.execute(select(literal(1)).select_from(Category).limit(1)).first()
+    if has_categories and not has_closure:
+        rebuild_closure()
+        db.session.commit()
+
+
+# ---------------- consultas ----------------
+def validate_parent(category, parent_id):
+    """Pai aceito para `category` (None = raiz); CategoryTreeError se não servir."""
+    if not parent_id:
+        return None
+    parent = db.session.get(Category, int(parent_id))
+    if parent is None:
+        raise CategoryTreeError("Categoria pai não encontrada.")
+    if parent.kind != category.kind:
+        raise CategoryTreeError("A categoria pai precisa ser do mesmo tipo (receita/despesa).")
+    if category.id is not None:
+        # o novo pai não pode estar dentro da própria subárvore
+        loop = db.session.execute(select(CategoryClosure.depth).where(
+            CategoryClosure.ancestor_id == category.id, CategoryClosure.descendant_id == parent.id,
+        )).first()
+        if loop is not None:
+            raise CategoryTreeError("Uma categoria não pode ficar dentro de si mesma ou de uma subcategoria.")
+    return parent
+
+
+def descendants(category_ids) -> list:
+    """Ids das categorias e de todas as subcategorias (filtros de relatório)."""
+    if not category_ids:
+        return []
+    return list(db.session.execute(
+        select(CategoryClosure.descendant_id).where(CategoryClosure.ancestor_id.in_(category_ids)).distinct()
+    ).scalars())
+
+
+def paths() -> dict:
+    """{id: "Moradia › Aluguel"} de todas as categorias da casa."""
+    def compute():
+        anc = aliased(Category)
+        out = {}
+        rows = db.session.execute(
+            select(CategoryClosure.descendant_id, anc.name)
+            .join(anc, anc.id == CategoryClosure.ancestor_id)
+            .order_by(CategoryClosure.descendant_id, CategoryClosure.depth.desc())
+        )
+        for cid, name in rows:
+            out[cid] = out[cid] + SEPARATOR + name if cid in out else name
+        return out
+    return cached(("category_paths",), compute)
+
+
+def tree(kind: str = None, active_only: bool = True) -> list:
+    """[(categoria, profundidade)] em ordem de árvore (pai seguido dos filhos), por nome."""
+    q = Category.query
+    if kind:
+        q = q.filter_by(kind=kind)
+    if active_only:
+        q = q.filter_by(is_active=True)
+    cats = q.order_by(Category.name.asc()).all()
+    ids = {c.id for c in cats}
+    children = {}
+    for c in cats:
+        # pai inativo/fora do filtro: a subcategoria aparece como raiz
+        children.setdefault(c.parent_id if c.parent_id in ids else None, []).append(c)
+    out = []
+
+    def walk(parent_id, depth):
+        for c in children.get(parent_id, []):
+            out.append((c, depth))
+            walk(c.id, depth + 1)
+    walk(None, 0)
+    return out
+
+
+def breadcrumb(category_id) -> list:
+    """Categorias da raiz até `category_id` (inclusive)."""
+    if not category_id:
+        return []
+    anc = aliased(Category)
+    return list(db.session.execute(
+        select(anc)
+        .join(CategoryClosure, CategoryClosure.ancestor_id == anc.id)
+        .where(CategoryClosure.descendant_id == category_id)
+        .order_by(CategoryClosure.depth.desc())
+    ).scalars())
+
+
+def rollup(start, end, txn_type=None, account_id=None, category_ids=None, parent_id=None, tag_filter=None) -> list:
+    """Totais por categoria de um nível da árvore, somando as subcategorias.
+
+    Sem `parent_id`, as categorias raiz; com ele, os filhos diretos e uma
+    linha `own` com o que foi lançado na própria categoria pai. Linhas
+    {id, name, txn_type, total, has_children, own}, por tipo e maior total.
+    `category_ids` já vem expandido (ver `descendants`); `tag_filter` é um
+    tags.TagFilter.
+    """
+    key = ("category_rollup", start, end, txn_type, account_id, tuple(sorted(category_ids or ())), parent_id, tag_filter)
+    return cached(key, lambda: _rollup(start, end, txn_type, account_id, category_ids, parent_id, tag_filter))
+
+
+def _rollup(start, end, txn_type, account_id, category_ids, parent_id, tag_filter) -> list:
+    level_q = Category.query.filter(
+        Category.parent_id.is_(None) if parent_id is None
+        else or_(Category.parent_id == parent_id, Category.id == parent_id)
+    )
+    level = {c.id: c for c in level_q}
+    if not level:
+        return []
+    cc = CategoryClosure
+    # o pai entra só com os próprios lançamentos (depth 0); os filhos, com a subárvore
+    in_level = cc.ancestor_id.in_([cid for cid in level if cid != parent_id])
+    if parent_id is not None and parent_id in level:
+        in_level = or_(in_level, and_(cc.ancestor_id == parent_id, cc.depth == 0))
+
+    # dividido: cada linha na sua categoria (splits.py)
+    category, line_amount, with_lines = line_columns()
+    amount, with_rates = converted(line_amount, Transaction.currency, Transaction.txn_date, start, end)
+    stmt = with_rates(
+        with_lines(select(cc.ancestor_id, Transaction.txn_type, func.sum(amount)).select_from(Transaction))
+        .join(cc, cc.descendant_id == category)
+    ).where(in_level, Transaction.txn_date >= start, Transaction.txn_date < end)
+    if txn_type in TXN_TYPES:
+        stmt = stmt.where(Transaction.txn_type == txn_type)
+    else:
+        stmt = stmt.where(Transaction.txn_type != TRANSFER)
+    if account_id:
+        stmt = stmt.where(Transaction.account_id == account_id)
+    if category_ids:
+        stmt = stmt.where(category.in_(category_ids))
+    if tag_filter:
+        stmt = stmt.where(condition(Transaction.id, tag_filter))
+    stmt = stmt.group_by(cc.ancestor_id, Transaction.txn_type)
+
+    totals = {}
+    for cid, ttype, total in db.session.execute(stmt):
+        totals[(cid, ttype)] = float(total or 0)
+
+    archived = archived_transactions(
+        start, end, txn_type=txn_type if txn_type in TXN_TYPES else None,
+        account_id=account_id, category_ids=category_ids, tag_filter=tag_filter,
+    )
+    if archived:
+        owner = {}
+        for anc, desc, depth in db.session.execute(
+            select(cc.ancestor_id, cc.descendant_id, cc.depth).where(cc.ancestor_id.in_(list(level)))
+        ):
+            if anc == parent_id and depth > 0:
+                continue
+            owner[desc] = anc
+        for t in archived:
+            cid = owner.get(t.category_id)
+            value = convert(t.amount, getattr(t, "currency", None), t.txn_date)
+            if cid is not None and value is not None:
+                k = (cid, t.txn_type)
+                totals[k] = totals.get(k, 0.0) + value
+
+    with_children = set(db.session.execute(
+        select(Category.parent_id).where(Category.parent_id.isnot(None)).distinct()
+    ).scalars())
+    rows = [
+        {
+            "id": cid, "name": level[cid].name, "txn_type": ttype, "total": total,
+            "has_children": cid in with_children and cid != parent_id, "own": cid == parent_id,
+        }
+        for (cid, ttype), total in totals.items()
+    ]
+    rows.sort(key=lambda r: (r["txn_type"], -r["total"]))
+    return rows
+
+
+@click.command("categories-rebuild")
+@click.option("--household", type=int, help="Só esta casa (padrão: todas).")
+@with_appcontext
+def categories_rebuild_command(household):
+    """Recalcula a árvore de categorias (category_closure) a partir de parent_id."""
+    n = rebuild_closure(household)
+    db.session.commit()
+    click.echo(f"{n} caminhos de categoria gerados.")
+
+
+def init_app(app):
+    app.cli.add_command(categories_rebuild_command)
+    if not event.contains(Session, "after_flush", _sync_closure):
+        event.listen(Session, "after_flush", _sync_closure)
@@ -0,0 +1,191 @@
+"""Exportação colunar (Parquet e Arrow IPC) dos lançamentos, para análise externa.
+
+CSV vira texto e precisa ser interpretado de novo no notebook; aqui os
+lançamentos saem tipados (datas, números) e em colunas. O cursor do banco é
+lido em blocos de CHUNK linhas (yield_per: cursor do lado do servidor no
+Postgres), cada bloco vira um RecordBatch do Arrow, e os batches vão para:
+
+- `write_parquet(path, batches)`: arquivo Parquet (zstd), um row group por
+  batch; usado por /reports/export/parquet.
+- `ipc_stream(batches)`: bytes do formato de streaming do Arrow, enviados
+  conforme são gerados; usado por /api/export/transactions.arrow.
+
+Tipo, categoria, conta e moeda são colunas de dicionário: cada linha guarda
+só um índice, e o dicionário (todas as categorias/contas da casa) é o mesmo
+em todos os batches. Os valores saem na moeda original e convertidos para a
+moeda dos relatórios (ver currency.converted). Lançamento dividido
+(splits.py) sai como uma linha por categoria, com o mesmo id. Anos
+arquivados (partitioning.py) entram no fim, como nos outros relatórios.
+
+Requer o pacote pyarrow (no requirements.txt); numa instalação sem ele,
+`available()` é False e as rotas avisam em vez de falhar.
+"""
+from sqlalchemy import select
+
+from . import db
+from .currency import CURRENCIES, convert, converted, report_currency
+from .ledger import TRANSFER, TXN_TYPES
+from .models import Account, Category, Transaction
+from .partitioning import archived_transactions
+from .splits import line_columns
+from .tags import condition
+
+CHUNK = 10000
+MIME_ARROW = "application/vnd.apache.arrow.stream"
+COLUMNS = (
+    "id", "txn_date", "txn_type", "category", "account", "to_account",
+    "description", "currency", "amount", "amount_converted",
+)
+
+
+def available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def schema():
+    import pyarrow as pa
+    label = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("id", pa.int64()),
+        ("txn_date", pa.date32()),
+        ("txn_type", pa.dictionary(pa.int8(), pa.string())),
+        ("category", label),
+        ("account", label),
+        ("to_account", label),
+        ("description", pa.string()),
+        ("currency", pa.dictionary(pa.int8(), pa.string())),
+        ("amount", pa.float64()),
+        ("amount_converted", pa.float64()),
+    ], metadata={"report_currency": report_currency()})
+
+
+class _Dictionary:
+    """Valores fixos de uma coluna de dicionário e o índice de cada chave."""
+
+    def __init__(self, items):
+        self.values = []
+        self.index = {}
+        for key, value in items:
+            self.index[key] = len(self.values)
+            self.values.append(value)
+
+    def lookup(self, key):
+        i = self.index.get(key)
+        if i is None and key is not None:
+            # valor fora do dicionário (ex.: moeda nova): acrescenta no fim
+            i = self.index[key] = len(self.values)
+            self.values.append(str(key))
+        return i
+
+
+def _dictionaries() -> dict:
+    accounts = [(a.id, a.name) for a in Account.query.order_by(Account.id)]
+    return {
+        "txn_type": _Dictionary((t, t) for t in TXN_TYPES),
+        "category": _Dictionary((c.id, c.name) for c in Category.query.order_by(Category.id)),
+        "account": _Dictionary(accounts),
+        "to_account": _Dictionary(accounts),
+        "currency": _Dictionary((c, c) for c in CURRENCIES),
+    }
+
+
+def _batch(rows: list, dicts: dict, sch):
+    """Linhas (na ordem de COLUMNS, com ids nas colunas de dicionário) -> RecordBatch."""
+    import pyarrow as pa
+    cols = list(zip(*rows))
+    arrays = []
+    for name, values in zip(COLUMNS, cols):
+        field = sch.field(name)
+        if name in dicts:
+            d = dicts[name]
+            indices = pa.array([d.lookup(v) for v in values], type=field.type.index_type)
+            arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(d.values, pa.string())))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=sch)
+
+
+def record_batches(start, end, txn_type="all", account_id=None, category_ids=None, chunk: int = None,
+                   tag_filter=None):
+    """RecordBatches dos lançamentos em [start, end), com os filtros dos relatórios.
+
+    Sem `txn_type` válido, transferências ficam de fora (como nos relatórios).
+    O dicionário de cada coluna é fixo para o export todo.
+    """
+    t = Transaction
+    category, line_amount, with_lines = line_columns()
+    amount, with_rates = converted(line_amount, t.currency, t.txn_date, start, end)
+    stmt = with_rates(with_lines(select(
+        t.id, t.txn_date, t.txn_type, category, t.account_id, t.to_account_id,
+        t.description, t.currency, line_amount, amount,
+    ).select_from(t))).where(t.txn_date >= start, t.txn_date < end)
+    if txn_type in TXN_TYPES:
+        stmt = stmt.where(t.txn_type == txn_type)
+    else:
+        stmt = stmt.where(t.txn_type != TRANSFER)
+    if account_id:
+        stmt = stmt.where(t.account_id == account_id)
+    if category_ids:
+        stmt = stmt.where(category.in_(category_ids))
+    if tag_filter:
+        stmt = stmt.where(condition(t.id, tag_filter))
+    stmt = stmt.order_by(t.txn_date, t.id)
+
+    chunk = chunk or CHUNK
+    dicts = _dictionaries()
+    sch = schema()
+    result = db.session.execute(stmt, execution_options={"yield_per": chunk})
+    for rows in result.partitions():
+        yield _batch(rows, dicts, sch)
+
+    archived = archived_transactions(
+        start, end,
+        txn_type=txn_type if txn_type in TXN_TYPES else None,
+        account_id=account_id,
+        category_ids=category_ids,
+        tag_filter=tag_filter,
+    )
+    for i in range(0, len(archived), chunk):
+        yield _batch([
+            (a.id, a.txn_date, a.txn_type, a.category_id, a.account_id, a.to_account_id,
+             a.description, getattr(a, "currency", None), a.amount,
+             convert(a.amount, getattr(a, "currency", None), a.txn_date))
+            for a in archived[i:i + chunk]
+        ], dicts, sch)
+
+
+def write_parquet(path, batches) -> int:
+    """Grava os batches num arquivo Parquet; devolve o número de linhas."""
+    import pyarrow.parquet as pq
+    n = 0
+    with pq.ParquetWriter(str(path), schema(), compression="zstd", use_dictionary=True) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            n += batch.num_rows
+    return n
+
+
+def ipc_stream(batches):
+    """Bytes do formato de streaming Arrow IPC, um pedaço por batch."""
+    import io
+
+    import pyarrow as pa
+    buf = io.BytesIO()
+    writer = pa.ipc.new_stream(buf, schema())
+
+    def take():
+        data = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return data
+
+    yield take()  # esquema
+    for batch in batches:
+        writer.write_batch(batch)
+        yield take()
+    writer.close()
+    yield take()  # fim do stream
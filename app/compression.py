@@ -0,0 +1,77 @@
+"""Compressão gzip das respostas (HTML, JSON, CSV...).
+
+Respostas menores que COMPRESS_MIN_SIZE bytes saem como estão. Respostas em
+streaming (e arquivos enviados com send_file) são comprimidas pedaço a
+pedaço, sem carregar tudo em memória. Arquivos do build de assets já vêm
+pré-comprimidos (Content-Encoding definido) e são ignorados aqui.
+"""
+import gzip
+import os
+import zlib
+
+from flask import request
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/csv",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "image/svg+xml",
+}
+
+
+def _stream(chunks, close):
+    comp = zlib.compressobj(LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # formato gzip
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = comp.compress(chunk)
+            if data:
+                yield data
+        yield comp.flush()
+    finally:
+        if close is not None:
+            close()
+
+
+def compress_response(response):
+    if (
+        request.method == "HEAD"
+        or response.status_code != 200
+        or "gzip" not in request.headers.get("Accept-Encoding", "")
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in MIMETYPES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+
+    if response.is_streamed or response.direct_passthrough:
+        length = response.content_length
+        if length is not None and length < MIN_SIZE:
+            return response
+        body = response.response
+        response.response = _stream(body, getattr(body, "close", None))
+        response.direct_passthrough = False
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    # ETag do conteúdo original não vale para o comprimido
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
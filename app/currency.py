@@ -0,0 +1,296 @@
+"""Várias moedas: cotações locais e conversão para a moeda dos relatórios.
+
+Cada conta tem uma moeda (ISO 4217) e cada lançamento herda a da conta. As
+cotações ficam em exchange_rates, carregadas de arquivo:
+
+    flask rates-load cotacoes.csv          # data;moeda;cotacao  (ex.: 2026-10-01;USD;5,43 ou 1.234,56)
+    flask rates-load ptax.csv --quote BRL
+
+A cotação de um dia é a última publicada até ele (fins de semana e
+feriados usam a anterior). Todas as cotações ficam em memória, por par,
+em listas ordenadas de datas; a busca é um bisect. A tabela é recarregada
+quando muda a impressão digital de exchange_rates (`rates_fingerprint`,
+consultada no máximo a cada CACHE_TTL segundos), então uma carga feita
+em outro worker aparece no mesmo prazo que o resto do cache.
+
+Para somas no banco, `converted(amount, currency, date, start, end)` monta
+uma tabela derivada (fx) com as faixas de validade de cada cotação dentro do
+período e faz SUM(valor * cotação) no próprio SELECT. Sem lançamentos em
+outra moeda, a expressão é só o valor: relatório em uma moeda não paga
+nada a mais. Lançamento sem cotação na data fica fora dos totais (nunca
+entra pelo valor de face); `missing_rates` conta quantos são, para o aviso
+nas telas.
+"""
+import csv
+import io
+import os
+from bisect import bisect_right
+from datetime import date
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import Date, Float, String, and_, case, event, func, inspect, literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+from . import db
+from .cache import cached
+from .dbutil import upsert
+from .models import Account, ExchangeRate, Transaction
+from .utils import CURRENCY_FORMATS, parse_amount
+
+DEFAULT_CURRENCY = "BRL"
+CURRENCIES = tuple(CURRENCY_FORMATS)
+
+
+def report_currency() -> str:
+    if has_app_context():
+        return current_app.config.get("REPORT_CURRENCY", DEFAULT_CURRENCY)
+    return DEFAULT_CURRENCY
+
+
+# ---------------- cache de cotações ----------------
+class RateTable:
+    """{(moeda, cotada): (datas ordenadas, cotações)} com busca por bisect."""
+
+    def __init__(self, rows):
+        pairs = {}
+        for rate_date, cur, quote, rate in rows:
+            pairs.setdefault((cur, quote), ([], []))
+            dates, rates = pairs[(cur, quote)]
+            dates.append(rate_date)
+            rates.append(rate)
+        self.pairs = pairs
+
+    def rate(self, cur: str, quote: str, on: date):
+        """Cotação vigente em `on` (última até a data), ou None."""
+        if cur == quote:
+            return 1.0
+        pair = self.pairs.get((cur, quote))
+        if pair:
+            i = bisect_right(pair[0], on) - 1
+            if i >= 0:
+                return pair[1][i]
+        inverse = self.pairs.get((quote, cur))
+        if inverse:
+            i = bisect_right(inverse[0], on) - 1
+            if i >= 0 and inverse[1][i]:
+                return 1.0 / inverse[1][i]
+        return None
+
+    def segments(self, cur: str, quote: str, start: date, end: date) -> list:
+        """[(de, até_exclusivo, cotação)] cobrindo [start, end) para o par."""
+        direct = self.pairs.get((cur, quote))
+        inverse = self.pairs.get((quote, cur)) if direct is None else None
+        pair = direct or inverse
+        if not pair:
+            return []
+        dates, rates = pair
+        # índice da cotação vigente em `start`; antes da primeira cotação não há faixa
+        i = max(bisect_right(dates, start) - 1, 0)
+        out = []
+        while i < len(dates) and dates[i] < end:
+            seg_start = max(dates[i], start)
+            seg_end = min(dates[i + 1], end) if i + 1 < len(dates) else end
+            rate = rates[i] if direct else (1.0 / rates[i] if rates[i] else None)
+            if rate is not None and seg_start < seg_end:
+                out.append((seg_start, seg_end, rate))
+            i += 1
+        return out
+
+
+def rates_fingerprint() -> tuple:
+    """(quantidade, última data, soma das cotações): muda com inclusão e com cotação corrigida."""
+    return tuple(db.session.execute(
+        select(func.count(), func.max(ExchangeRate.rate_date), func.sum(ExchangeRate.rate))
+    ).one())
+
+
+def rate_table() -> RateTable:
+    def load():
+        rows = db.session.execute(
+            select(ExchangeRate.rate_date, ExchangeRate.currency, ExchangeRate.quote, ExchangeRate.rate)
+            .order_by(ExchangeRate.currency, ExchangeRate.quote, ExchangeRate.rate_date)
+        ).all()
+        return RateTable(rows)
+    fingerprint = cached(("exchange_rates_fingerprint",), rates_fingerprint)
+    return cached(("exchange_rates", fingerprint), load, ttl=3600)
+
+
+def convert(amount, cur: str, on: date, to: str = None):
+    """Converte `amount` de `cur` para `to` (padrão: moeda dos relatórios).
+
+    Sem cotação carregada para a data, devolve None: o valor fica fora dos
+    totais (e `missing_rates` avisa na tela), em vez de entrar pelo valor de face.
+    """
+    to = to or report_currency()
+    if not cur or cur == to:
+        return float(amount)
+    rate = rate_table().rate(cur, to, on)
+    return float(amount) * rate if rate is not None else None
+
+
+def foreign_currencies(start: date, end: date) -> list:
+    """Moedas != moeda do relatório usadas por lançamentos no período (consulta filtrada por casa)."""
+    to = report_currency()
+
+    def load():
+        return [c for (c,) in db.session.execute(
+            select(Transaction.currency).distinct()
+            .where(Transaction.txn_date >= start, Transaction.txn_date < end, Transaction.currency != to)
+        )]
+    return cached(("foreign_currencies", start, end, to), load)
+
+
+def _rates_subquery(currencies, start: date, end: date):
+    """Tabela derivada fx (moeda, de, até_exclusivo, cotação) do período, ou None sem cotações."""
+    to = report_currency()
+    table = rate_table()
+    rows = []
+    for cur in currencies:
+        for seg_start, seg_end, rate in table.segments(cur, to, start, end):
+            rows.append((cur, seg_start, seg_end, rate))
+    if not rows:
+        return None
+    # SELECT ... UNION ALL em vez de VALUES: o SQLite não aceita "AS fx (colunas)"
+    return union_all(*[
+        select(
+            literal(cur, String).label("currency"), literal(seg_start, Date).label("valid_from"),
+            literal(seg_end, Date).label("valid_to"), literal(rate, Float).label("rate"),
+        )
+        for cur, seg_start, seg_end, rate in rows
+    ]).subquery("fx")
+
+
+def converted(amount_col, currency_col, date_col, start: date, end: date):
+    """(expressão SQL do valor convertido, função que aplica o JOIN de cotações ao select).
+
+    Uso:
+        amount, join = converted(Transaction.amount, Transaction.currency, Transaction.txn_date, start, end)
+        stmt = join(select(func.sum(amount)).where(...))
+
+    Lançamento sem cotação na data vale NULL: o SUM o deixa de fora.
+    """
+    to = report_currency()
+    foreign = foreign_currencies(start, end)
+    if not foreign:
+        return amount_col, (lambda stmt: stmt)
+
+    rates = _rates_subquery(foreign, start, end)
+    if rates is None:
+        return amount_col * case((currency_col == to, 1.0), else_=null()), (lambda stmt: stmt)
+    expr = amount_col * case((currency_col == to, 1.0), else_=rates.c.rate)
+
+    def join(stmt):
+        return stmt.outerjoin(rates, and_(
+            rates.c.currency == currency_col,
+            date_col >= rates.c.valid_from,
+            date_col < rates.c.valid_to,
+        ))
+    return expr, join
+
+
+def missing_rates(start: date, end: date) -> dict:
+    """{moeda: nº de lançamentos do período sem cotação na data} (consulta filtrada por casa).
+
+    São os lançamentos que `convert`/`converted` deixam fora dos totais.
+    """
+    to = report_currency()
+    foreign = foreign_currencies(start, end)
+    if not foreign:
+        return {}
+
+    def load():
+        stmt = (
+            select(Transaction.currency, func.count())
+            .where(Transaction.txn_date >= start, Transaction.txn_date < end, Transaction.currency.in_(foreign))
+            .group_by(Transaction.currency)
+        )
+        rates = _rates_subquery(foreign, start, end)
+        if rates is not None:
+            stmt = stmt.outerjoin(rates, and_(
+                rates.c.currency == Transaction.currency,
+                Transaction.txn_date >= rates.c.valid_from,
+                Transaction.txn_date < rates.c.valid_to,
+            )).where(rates.c.rate.is_(None))
+        return dict(db.session.execute(stmt).all())
+    return cached(("missing_rates", start, end, to), load)
+
+
+# ---------------- carga de arquivo ----------------
+def parse_rates(text: str, quote: str):
+    """Linhas data;moeda;cotação (ou data,moeda,cotação). Cabeçalho opcional."""
+    sample = text[:2048]
+    delimiter = ";" if sample.count(";") >= sample.count(",") else ","
+    out = []
+    for row in csv.reader(io.StringIO(text), delimiter=delimiter):
+        if len(row) < 3 or not row[0].strip():
+            continue
+        raw_date, cur, raw_rate = row[0].strip(), row[1].strip().upper(), row[2].strip()
+        try:
+            if "/" in raw_date:
+                d, m, y = raw_date.split("/")
+                rate_date = date(int(y), int(m), int(d))
+            else:
+                rate_date = date.fromisoformat(raw_date)
+            rate = parse_amount(raw_rate)
+        except ValueError:
+            continue  # cabeçalho ou linha inválida
+        out.append({"rate_date": rate_date, "currency": cur, "quote": quote, "rate": rate})
+    return out
+
+
+def load_rates(rows: list) -> int:
+    """Upsert em lotes (moeda, cotada, data). Não faz commit."""
+    stmt = upsert(ExchangeRate)
+    for i in range(0, len(rows), 500):
+        chunk = rows[i:i + 500]
+        ins = stmt.values(chunk)
+        db.session.execute(ins.on_conflict_do_update(
+            index_elements=["currency", "quote", "rate_date"], set_={"rate": ins.excluded.rate},
+        ))
+    return len(rows)
+
+
+@click.command("rates-load")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--quote", default=None, help="Moeda cotada (padrão: REPORT_CURRENCY).")
+@with_appcontext
+def rates_load_command(path, quote):
+    """Carrega cotações de um arquivo CSV (data;moeda;cotação)."""
+    with open(path, encoding="utf-8-sig") as f:
+        rows = parse_rates(f.read(), (quote or report_currency()).upper())
+    n = load_rates(rows)
+    db.session.commit()
+    click.echo(f"{n} cotações carregadas.")
+
+
+# ---------------- moeda do lançamento ----------------
+def _account_changed(obj) -> bool:
+    state = inspect(obj)
+    return (state.attrs.account_id.history.has_changes()
+            and not state.attrs.currency.history.has_changes())
+
+
+def _default_currency(session, flush_context, instances):
+    """Novo lançamento herda a moeda da conta; trocar a conta de um lançamento
+    existente troca a moeda junto (a não ser que a moeda também tenha sido
+    alterada na mesma edição)."""
+    for obj in session.new:
+        if isinstance(obj, Transaction) and not obj.currency and obj.account_id:
+            account = session.get(Account, obj.account_id)
+            obj.currency = account.currency if account else DEFAULT_CURRENCY
+    for obj in session.dirty:
+        if isinstance(obj, Transaction) and obj.account_id and _account_changed(obj):
+            account = session.get(Account, obj.account_id)
+            if account:
+                obj.currency = account.currency
+
+
+def init_app(app):
+    app.config.setdefault("REPORT_CURRENCY", os.getenv("REPORT_CURRENCY", DEFAULT_CURRENCY).upper())
+    # padrão do filtro |currency: lido uma vez por template, não por célula
+    app.context_processor(lambda: {"report_currency": report_currency()})
+    app.cli.add_command(rates_load_command)
+    if not event.contains(Session, "before_flush", _default_currency):
+        event.listen(Session, "before_flush", _default_currency)
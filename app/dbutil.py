@@ -0,0 +1,37 @@
+"""Helpers de SQL que dependem do banco (PostgreSQL em produção, SQLite local).
+
+O dialeto é lido uma vez do engine, em vez de tentar a query de um banco e
+cair no outro via try/except (o que deixa a transação do Postgres abortada).
+"""
+from sqlalchemy import func
+
+from . import db
+
+
+def dialect_name() -> str:
+    """'postgresql' ou 'sqlite' (ou outro nome que o SQLAlchemy informar)."""
+    return db.engine.dialect.name
+
+
+def is_postgres() -> bool:
+    return dialect_name() == "postgresql"
+
+
+def is_sqlite() -> bool:
+    return dialect_name() == "sqlite"
+
+
+def month_key(column):
+    """Expressão SQL 'YYYY-MM' para uma coluna de data."""
+    if is_postgres():
+        return func.to_char(column, "YYYY-MM")
+    return func.substr(column, 1, 7)
+
+
+def upsert(model):
+    """insert() com suporte a on_conflict_do_update/do_nothing no dialeto atual."""
+    if is_postgres():
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
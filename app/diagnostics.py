@@ -0,0 +1,279 @@
+"""Coleta de dados para a página de diagnóstico (admin).
+
+Datas, meses e últimos lançamentos são da casa do usuário logado. Com
+uma casa só, contagens, tamanhos das tabelas e pg_stat_statements são do
+banco inteiro. Com mais de uma, esses números mostrariam dados das outras
+casas: as contagens passam a ser da casa (COUNT pelo ORM, com o filtro de
+tenancy) e os painéis de tamanho e de queries lentas não aparecem.
+
+As contagens vêm do catálogo do banco (pg_class.reltuples no Postgres,
+sqlite_stat1 no SQLite), que é instantâneo mesmo com milhões de linhas.
+O modo exato faz um único SELECT com uma subquery COUNT(*) por tabela.
+O resultado fica em cache por alguns segundos (DIAG_CACHE_TTL).
+"""
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import joinedload
+
+from . import db, sqlite_profile
+from .dbutil import dialect_name, is_postgres, is_sqlite, month_key
+from .models import Household, Transaction
+from .tenancy import current_household_id
+
+# tabela -> chave usada no template
+COUNT_TABLES = {
+    "users": "users_total",
+    "transactions": "transactions_total",
+    "budgets": "budgets_total",
+    "budget_templates": "budget_templates_total",
+    "recurring_transactions": "recurring_total",
+    "categories": "categories_total",
+    "accounts": "accounts_total",
+}
+
+CACHE_TTL = int(os.getenv("DIAG_CACHE_TTL", "60"))
+
+_cache = {}  # (household_id, exact) -> (expira_em, payload)
+
+
+def get_diagnostics(exact: bool = False, refresh: bool = False) -> dict:
+    """Retorna o diagnóstico, usando o cache enquanto não expirar."""
+    key = (current_household_id(), exact)
+    now = time.monotonic()
+    hit = _cache.get(key)
+    if hit and not refresh and hit[0] > now:
+        return hit[1]
+    payload = collect_diagnostics(exact=exact)
+    _cache[key] = (now + CACHE_TTL, payload)
+    return payload
+
+
+@contextmanager
+def _section(errors: list, label: str):
+    """Isola uma etapa: se falhar, registra o erro e segue com as demais.
+
+    No Postgres usa SAVEPOINT para não deixar a transação abortada.
+    """
+    nested = db.session.begin_nested() if is_postgres() else None
+    try:
+        yield
+        if nested is not None:
+            nested.commit()
+    except Exception as e:
+        if nested is not None:
+            nested.rollback()
+        else:
+            db.session.rollback()
+        errors.append(f"{label}: {e}")
+
+
+def collect_diagnostics(exact: bool = False) -> dict:
+    errors = []
+    info = {
+        "db_url": None,
+        "db_name": None,
+        "db_user": None,
+        "db_host": None,
+        "db_driver": None,
+        "dialect": dialect_name(),
+        "tables": [],
+        "errors": errors,
+        "shared": False,
+    }
+
+    url_obj = db.engine.url
+    info["db_url"] = url_obj.render_as_string(hide_password=True)
+    info["db_name"] = url_obj.database
+    info["db_user"] = url_obj.username
+    info["db_host"] = url_obj.host
+    info["db_driver"] = url_obj.drivername
+    replica = db.engines.get("replica")
+    info["replica_url"] = replica.url.render_as_string(hide_password=True) if replica is not None else None
+
+    with _section(errors, "casas"):
+        info["shared"] = db.session.execute(select(func.count(Household.id))).scalar() > 1
+
+    sizes = []
+    if not info["shared"]:
+        with _section(errors, "catálogo"):
+            if is_postgres():
+                sizes = _pg_catalog()
+            elif is_sqlite():
+                sizes = _sqlite_catalog()
+    info["tables"] = [s["table"] for s in sizes]
+
+    if is_sqlite():
+        with _section(errors, "pragmas"):
+            info["sqlite"] = sqlite_profile.settings()
+
+    if info["shared"]:
+        by_table = {}
+        with _section(errors, "contagem da casa"):
+            by_table = _household_counts(list(COUNT_TABLES))
+    elif exact:
+        by_table = {}
+        with _section(errors, "contagem exata"):
+            by_table = _exact_counts(list(COUNT_TABLES))
+    else:
+        by_table = {s["table"]: s["rows"] for s in sizes}
+        missing = [t for t in COUNT_TABLES if by_table.get(t) is None]
+        if missing:
+            # sem estatística no catálogo (ex.: SQLite sem ANALYZE): conta só essas
+            with _section(errors, "contagem"):
+                by_table.update(_exact_counts(missing))
+    counts = {key: by_table.get(t) for t, key in COUNT_TABLES.items()}
+
+    stats = {"min_date": None, "max_date": None, "months": []}
+    with _section(errors, "min/max txn_date"):
+        row = db.session.execute(select(func.min(Transaction.txn_date), func.max(Transaction.txn_date))).one()
+        stats["min_date"], stats["max_date"] = row[0], row[1]
+
+    with _section(errors, "months group"):
+        ym = month_key(Transaction.txn_date).label("ym")
+        rows = db.session.execute(
+            select(ym, func.count()).group_by(ym).order_by(ym.desc()).limit(24)
+        ).all()
+        stats["months"] = [{"month": r[0], "count": int(r[1])} for r in rows]
+
+    last_txns = []
+    with _section(errors, "last transactions"):
+        last = (
+            Transaction.query
+            .options(joinedload(Transaction.category), joinedload(Transaction.account))
+            .order_by(Transaction.id.desc())
+            .limit(10)
+            .all()
+        )
+        for t in last:
+            last_txns.append({
+                "id": t.id,
+                "date": t.txn_date.isoformat() if t.txn_date else "",
+                "type": t.txn_type,
+                "amount": float(t.amount) if t.amount is not None else 0,
+                "category": t.category.name if t.category else "",
+                "account": t.account.name if t.account else "",
+                "desc": (t.description or "")[:80],
+            })
+
+    slow_queries = []
+    if is_postgres() and not info["shared"]:
+        with _section(errors, "pg_stat_statements"):
+            slow_queries = _pg_slow_queries()
+
+    return {
+        "info": info,
+        "counts": counts,
+        "counts_estimated": not exact and not info["shared"],
+        "sizes": sizes,
+        "stats": stats,
+        "last_txns": last_txns,
+        "slow_queries": slow_queries,
+        "collected_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def _exact_counts(tables) -> dict:
+    """Um único SELECT com uma subquery COUNT(*) por tabela."""
+    existing = set(db.inspect(db.engine).get_table_names())
+    tables = [t for t in tables if t in existing]
+    if not tables:
+        return {}
+    cols = ", ".join(f"(SELECT COUNT(*) FROM {t}) AS {t}" for t in tables)
+    row = db.session.execute(text(f"SELECT {cols}")).one()
+    return {t: int(n) for t, n in zip(tables, row)}
+
+
+def _household_counts(tables) -> dict:
+    """COUNT(*) de cada tabela pelo ORM, só da casa logada."""
+    models = {m.class_.__tablename__: m.class_ for m in db.Model.registry.mappers}
+    return {
+        t: int(db.session.execute(select(func.count()).select_from(models[t])).scalar())
+        for t in tables if t in models
+    }
+
+
+def _pg_catalog() -> list:
+    rows = db.session.execute(text(
+        """SELECT c.relname,
+                  c.reltuples::bigint,
+                  pg_table_size(c.oid),
+                  pg_indexes_size(c.oid),
+                  pg_total_relation_size(c.oid)
+             FROM pg_class c
+             JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema()
+              AND c.relkind IN ('r', 'p')
+            ORDER BY c.relname"""
+    )).all()
+    return [{
+        "table": r[0],
+        # reltuples = -1: tabela nunca analisada (sem estimativa)
+        "rows": int(r[1]) if r[1] is not None and r[1] >= 0 else None,
+        "table_bytes": int(r[2]),
+        "index_bytes": int(r[3]),
+        "total_bytes": int(r[4]),
+    } for r in rows]
+
+
+def _sqlite_catalog() -> list:
+    objects = db.session.execute(text(
+        "SELECT type, name, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')"
+    )).all()
+    tables = sorted(r[1] for r in objects if r[0] == "table" and not r[1].startswith("sqlite_"))
+    owner = {r[1]: r[2] for r in objects}
+
+    rows = {}
+    if any(r[1] == "sqlite_stat1" for r in objects):
+        for tbl, stat in db.session.execute(text("SELECT tbl, stat FROM sqlite_stat1")).all():
+            try:
+                n = int(str(stat).split()[0])
+            except (ValueError, IndexError):
+                continue
+            rows[tbl] = max(rows.get(tbl, 0), n)
+
+    table_bytes, index_bytes = {}, {}
+    try:
+        # dbstat só existe se o SQLite foi compilado com SQLITE_ENABLE_DBSTAT_VTAB
+        for name, size in db.session.execute(text("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")).all():
+            tbl = owner.get(name, name)
+            target = table_bytes if tbl == name else index_bytes
+            target[tbl] = target.get(tbl, 0) + int(size or 0)
+    except Exception:
+        db.session.rollback()
+
+    return [{
+        "table": t,
+        "rows": rows.get(t),
+        "table_bytes": table_bytes.get(t),
+        "index_bytes": index_bytes.get(t),
+        "total_bytes": (table_bytes[t] + index_bytes.get(t, 0)) if t in table_bytes else None,
+    } for t in tables]
+
+
+def _pg_slow_queries(limit: int = 10) -> list:
+    installed = db.session.execute(text(
+        "SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'"
+    )).first()
+    if not installed:
+        return []
+    version = int(db.session.execute(text("SHOW server_version_num")).scalar())
+    # PostgreSQL 13 renomeou total_time/mean_time para *_exec_time
+    total_col, mean_col = ("total_exec_time", "mean_exec_time") if version >= 130000 else ("total_time", "mean_time")
+    rows = db.session.execute(text(
+        f"""SELECT query, calls, {total_col}, {mean_col}, rows
+              FROM pg_stat_statements
+             WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+             ORDER BY {mean_col} DESC
+             LIMIT :limit"""
+    ), {"limit": limit}).all()
+    return [{
+        "query": (r[0] or "")[:300],
+        "calls": int(r[1]),
+        "total_ms": float(r[2]),
+        "mean_ms": float(r[3]),
+        "rows": int(r[4]),
+    } for r in rows]
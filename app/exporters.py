@@ -1,16 +1,18 @@
 from datetime import datetime
 from pathlib import Path
 
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, numbers
-from openpyxl.utils import get_column_letter
+from .utils import excel_currency_format
 
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+# openpyxl e reportlab são importados só no primeiro uso: juntos custam
+# boa parte do tempo de boot de cada worker e a maioria das requisições
+# não exporta nada.
 
-def export_xlsx_professional(path: Path, rows, headers, title="Relatório", meta=None):
+def export_xlsx_professional(path: Path, rows, headers, title="Relatório", meta=None, currency=None):
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    from openpyxl.utils import get_column_letter
+
+    amount_format = excel_currency_format(currency)
     wb = Workbook()
     ws = wb.active
     ws.title = "Relatorio"
@@ -59,7 +61,7 @@ def export_xlsx_professional(path: Path, rows, headers, title="Relatório", meta
                 cell.number_format = "yyyy-mm-dd"
                 cell.alignment = left
             elif c == 6:  # amount
-                cell.number_format = numbers.FORMAT_CURRENCY_USD_SIMPLE
+                cell.number_format = amount_format
                 cell.alignment = right
             else:
                 cell.alignment = left
@@ -71,13 +73,18 @@ def export_xlsx_professional(path: Path, rows, headers, title="Relatório", meta
             v = ws.cell(row=row, column=col).value
             if v is None:
                 continue
-            max_len = max(max_len, len(str(v))[:50] if isinstance(v, str) else len(str(v)))
+            max_len = max(max_len, min(len(str(v)), 50))
         ws.column_dimensions[get_column_letter(col)].width = min(max_len + 2, 45)
 
     ws.freeze_panes = ws["A" + str(start_data_row)]
     wb.save(path)
 
 def export_pdf_professional(path: Path, title: str, headers, rows, meta=None):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
     doc = SimpleDocTemplate(str(path), pagesize=letter, leftMargin=36, rightMargin=36, topMargin=36, bottomMargin=36)
     styles = getSampleStyleSheet()
     story = []
@@ -115,4 +122,71 @@ def export_csv(path: Path, rows, headers):
         w = csv.writer(f)
         w.writerow(headers)
         for r in rows:
-            w.writerow(r)
\ No newline at end of file
+            w.writerow(r)
+def export_pivot_xlsx(path: Path, pivot, title="Categorias x meses", meta=None, currency=None):
+    """Pivot (ver pivot.py) como planilha: valores nas células, totais como fórmulas SUM."""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    from openpyxl.utils import get_column_letter
+
+    amount_format = excel_currency_format(currency)
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Pivot"
+
+    bold = Font(bold=True)
+    header_fill = PatternFill("solid", fgColor="1F2937")
+    header_font = Font(bold=True, color="FFFFFF")
+    total_fill = PatternFill("solid", fgColor="F3F4F6")
+    thin = Side(style="thin", color="D1D5DB")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    n = len(pivot.months)
+    last_col = n + 2  # categoria + meses + total
+    ws.cell(row=1, column=1, value=title).font = Font(bold=True, size=14)
+    r = 2
+    for k, v in (meta or {}).items():
+        ws.cell(row=r, column=1, value=f"{k}: {v}")
+        r += 1
+    header_row = r + 1
+
+    for c, h in enumerate(["Categoria"] + pivot.months + ["Total"], start=1):
+        cell = ws.cell(row=header_row, column=c, value=h)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = Alignment(horizontal="center")
+        cell.border = border
+
+    first_data = header_row + 1
+    last_data = header_row + len(pivot.categories)
+    first_letter = get_column_letter(2)
+    last_letter = get_column_letter(n + 1)
+    for i, (cat, cells, _) in enumerate(pivot, start=first_data):
+        ws.cell(row=i, column=1, value=cat["name"]).border = border
+        for j, v in enumerate(cells, start=2):
+            cell = ws.cell(row=i, column=j, value=round(v, 2) if v else None)
+            cell.number_format = amount_format
+            cell.border = border
+        cell = ws.cell(row=i, column=last_col, value=f"=SUM({first_letter}{i}:{last_letter}{i})")
+        cell.number_format = amount_format
+        cell.font = bold
+        cell.border = border
+
+    total_row = last_data + 1
+    ws.cell(row=total_row, column=1, value="Total").font = bold
+    for c in range(2, last_col + 1):
+        letter = get_column_letter(c)
+        formula = f"=SUM({letter}{first_data}:{letter}{last_data})" if pivot.categories else 0
+        cell = ws.cell(row=total_row, column=c, value=formula)
+        cell.number_format = amount_format
+        cell.font = bold
+        cell.fill = total_fill
+        cell.border = border
+    ws.cell(row=total_row, column=1).fill = total_fill
+    ws.cell(row=total_row, column=1).border = border
+
+    ws.column_dimensions["A"].width = max([12] + [min(len(c["name"]), 40) + 2 for c in pivot.categories])
+    for c in range(2, last_col + 1):
+        ws.column_dimensions[get_column_letter(c)].width = 14
+    ws.freeze_panes = ws.cell(row=first_data, column=2)
+    wb.save(path)
@@ -1,33 +1,462 @@
+"""Importação de extratos: OFX, QIF, CNAB 240 e CSV de banco.
+
+O arquivo é lido em fluxo (nunca inteiro na memória). Antes de ler, as
+primeiras linhas decidem, uma vez por arquivo:
+
+- a codificação (BOM, UTF-8 válido, dica CHARSET/encoding do OFX, senão cp1252);
+  dica com codificação que o Python não conhece vira ImportFormatError;
+- o formato, perguntando a cada importador registrado (`register_importer`);
+- no CSV e no QIF, o formato das datas e o separador decimal, a partir de
+  uma amostra das primeiras linhas; depois cada linha usa um único parser.
+
+Todo formato gera o mesmo dicionário normalizado:
+
+    {"txn_date": date, "description": str, "amount": float (negativo = saída),
+     "txn_type": "income" | "expense" | None, "category": str | None}
+
+e `import_rows` grava em lotes (executemany + movimentos do razão num
+INSERT ... SELECT), sem passar pelo flush do ORM.
+"""
+import codecs
 import csv
-from datetime import datetime, date
+import html
+import io
+import re
+import unicodedata
+from datetime import date, datetime
+from itertools import chain, islice
+
+HEAD_BYTES = 64 * 1024
+SAMPLE_ROWS = 200
+BATCH_SIZE = 500
+
+IMPORTERS = {}  # nome -> (sniff(head, filename) -> bool, parse(texto) -> iterável de linhas)
+FALLBACK = "csv"
+
+
+class ImportFormatError(ValueError):
+    """Arquivo que nenhum importador consegue ler."""
+
+
+def register_importer(name: str, sniff=None):
+    """Registra `parse(text_stream)` para o formato `name`.
 
-def parse_bank_csv(file_stream):
+    `sniff(head_text, filename)` decide se o arquivo é desse formato; sem
+    sniff o importador só é usado quando escolhido pelo nome (ex.: o CSV,
+    que é o padrão quando ninguém reconhece o arquivo).
     """
-    Import simples:
-      Espera colunas: date, description, amount, type(optional), account(optional), category(optional)
-    - date: YYYY-MM-DD
-    - amount: número (despesa como negativo ou use type=expense)
+    def decorator(parse):
+        IMPORTERS[name] = (sniff, parse)
+        return parse
+    return decorator
+
+
+# ---------------- detecção (uma vez por arquivo) ----------------
+def detect_encoding(head: bytes) -> str:
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    hint = re.search(rb'CHARSET:\s*(\d{3,4})|encoding="([\w-]+)"', head[:2048], re.IGNORECASE)
+    if hint and hint.group(1):
+        return f"cp{hint.group(1).decode()}"
+    if hint and hint.group(2).lower() not in (b"utf-8", b"usascii", b"us-ascii"):
+        return hint.group(2).decode()
+    try:
+        # final=False: um caractere cortado no fim da amostra não conta como erro
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"  # extratos de bancos brasileiros (Windows-1252/Latin-1)
+
+
+def detect_format(head: str, filename: str = "") -> str:
+    for name, (sniff, _parse) in IMPORTERS.items():
+        if sniff and sniff(head, filename.lower()):
+            return name
+    return FALLBACK
+
+
+def _iso(s):
+    return date.fromisoformat(s[:10])
+
+
+def _strptime(fmt):
+    return lambda s: datetime.strptime(s, fmt).date()
+
+
+# ordem = preferência quando a amostra é ambígua (ex.: 01/02/2026)
+DATE_FORMATS = [
+    ("%Y-%m-%d", _iso),
+    ("%m/%d/%Y", _strptime("%m/%d/%Y")),
+    ("%d/%m/%Y", _strptime("%d/%m/%Y")),
+    ("%d/%m/%y", _strptime("%d/%m/%y")),
+    ("%m/%d/%y", _strptime("%m/%d/%y")),
+    ("%d.%m.%Y", _strptime("%d.%m.%Y")),
+    ("%d-%m-%Y", _strptime("%d-%m-%Y")),
+    ("%Y%m%d", _strptime("%Y%m%d")),
+]
+
+
+def detect_date_format(samples: list, day_first: bool = False):
+    """(formato, parser) que lê a maior parte da amostra; empate fica com o primeiro.
+
+    Com `day_first` (arquivo com vírgula decimal, padrão brasileiro),
+    01/02/2026 é lido como 1º de fevereiro.
     """
-    file_stream.seek(0)
-    text = file_stream.read().decode("utf-8", errors="ignore").splitlines()
-    reader = csv.DictReader(text)
-    rows = []
-    for r in reader:
-        rows.append(r)
-    return rows
-
-def coerce_date(s: str) -> date:
-    s = (s or "").strip()
-    for fmt in ("%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y"):
+    formats = sorted(DATE_FORMATS, key=lambda f: not f[0].startswith("%d")) if day_first else DATE_FORMATS
+    best, best_ok = formats[0], -1
+    for fmt, parse in formats:
+        ok = 0
+        for s in samples:
+            try:
+                parse(s)
+                ok += 1
+            except ValueError:
+                pass
+        if ok == len(samples):
+            return fmt, parse
+        if ok > best_ok:
+            best, best_ok = (fmt, parse), ok
+    return best
+
+
+def detect_decimal_comma(samples: list) -> bool:
+    """True para 1.234,56 / -50,00; False para 1,234.56 / -50.00."""
+    comma = dot = 0
+    for s in samples:
+        m = re.search(r"([.,])(\d+)\D*$", s)
+        if not m or len(m.group(2)) == 3:
+            continue  # inteiro ou "1,234" (milhar ou decimal? não dá para saber)
+        if m.group(1) == ",":
+            comma += 1
+        else:
+            dot += 1
+    return comma > dot
+
+
+def amount_parser(decimal_comma: bool):
+    drop, dec = (".", ",") if decimal_comma else (",", ".")
+
+    def parse(s: str) -> float:
+        s = s.strip().replace("R$", "").replace(" ", "").replace("\xa0", "")
+        negative = s.startswith("(") and s.endswith(")") or s.endswith("-")
+        s = s.strip("()-+") if negative else s
+        value = float(s.replace(drop, "").replace(dec, "."))
+        return -value if negative else value
+    return parse
+
+
+def _with_detected_formats(raw_rows, normalize_date=None):
+    """Detecta data e decimal numa amostra das primeiras linhas e converte todas.
+
+    Linhas cruas trazem `txn_date` e `amount` como texto; as que não
+    convertem viram None (contadas como ignoradas pelo Statement).
+    """
+    raw_rows = iter(raw_rows)
+    head = list(islice(raw_rows, SAMPLE_ROWS))
+    if normalize_date:
+        for r in head:
+            r["txn_date"] = normalize_date(r["txn_date"])
+    decimal_comma = detect_decimal_comma([r["amount"] for r in head if r["amount"]])
+    _fmt, parse_date = detect_date_format([r["txn_date"] for r in head if r["txn_date"]], day_first=decimal_comma)
+    parse_amount = amount_parser(decimal_comma)
+    for i, r in enumerate(chain(head, raw_rows)):
         try:
-            return datetime.strptime(s, fmt).date()
+            if normalize_date and i >= len(head):
+                r["txn_date"] = normalize_date(r["txn_date"])
+            r["txn_date"] = parse_date(r["txn_date"])
+            r["amount"] = parse_amount(r["amount"])
+        except (ValueError, TypeError):
+            yield None
+            continue
+        yield r
+
+
+def _row(txn_date, description, amount, txn_type=None, category=None) -> dict:
+    return {
+        "txn_date": txn_date,
+        "description": (description or "").strip()[:200],
+        "amount": amount,
+        "txn_type": txn_type,
+        "category": (category or "").strip() or None,
+    }
+
+
+# ---------------- OFX (SGML 1.x e XML 2.x) ----------------
+def _ofx_tokens(stream, chunk_size=HEAD_BYTES):
+    """("TAG", "valor") de cada elemento, lendo em blocos (OFX SGML pode vir numa linha só)."""
+    buf = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        parts = (buf + chunk).split("<")
+        buf = parts.pop()
+        for part in parts:
+            tag, _, value = part.partition(">")
+            yield tag.strip().upper(), value.strip()
+    if buf:
+        tag, _, value = buf.partition(">")
+        yield tag.strip().upper(), value.strip()
+
+
+@register_importer("ofx", sniff=lambda head, filename: "OFXHEADER" in head[:1024] or "<OFX>" in head.upper())
+def parse_ofx(stream):
+    txn = None
+    for tag, value in _ofx_tokens(stream):
+        if tag == "STMTTRN":
+            txn = {}
+        elif txn is not None and tag in ("/STMTTRN", "/BANKTRANLIST"):
+            try:
+                v = txn.get("DTPOSTED", "")
+                d = date(int(v[:4]), int(v[4:6]), int(v[6:8]))
+                amount = float(txn.get("TRNAMT", "").replace(",", "."))
+            except ValueError:
+                yield None
+            else:
+                name, memo = txn.get("NAME", ""), txn.get("MEMO", "")
+                desc = memo if not name or name in memo else (f"{name} - {memo}" if memo else name)
+                yield _row(d, desc, amount)
+            txn = None
+        elif txn is not None and value and not tag.startswith("/"):
+            txn[tag] = html.unescape(value)
+
+
+# ---------------- QIF ----------------
+def _qif_date(s: str) -> str:
+    # Quicken: 1/31'26, 1/ 3/2026, 31/01/2026
+    return s.replace("'", "/").replace(" ", "").replace("-", "/") if "/" in s or "'" in s else s
+
+
+def _qif_raw(stream):
+    rec, section = {}, ""
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        if line.startswith("!"):
+            section = line.lower()
+            continue
+        if not section.startswith("!type:") or section in ("!type:cat", "!type:class", "!type:memorized"):
+            continue  # listas de contas/categorias, não lançamentos
+        code, value = line[0], line[1:].strip()
+        if code == "^":
+            if rec:
+                category = rec.get("L", "")
+                yield {
+                    "txn_date": rec.get("D", ""),
+                    "description": rec.get("P") or rec.get("M", ""),
+                    "amount": rec.get("T") or rec.get("U", ""),
+                    "txn_type": None,
+                    # [Outra conta] é transferência no Quicken: sem categoria
+                    "category": None if category.startswith("[") else category.split(":")[0],
+                }
+            rec = {}
+        elif code in "DTUPML" and code not in rec:
+            rec[code] = value
+
+
+@register_importer("qif", sniff=lambda head, filename: head.lstrip().lower().startswith(("!type:", "!account", "!option")))
+def parse_qif(stream):
+    return _with_detected_formats(_qif_raw(stream), normalize_date=_qif_date)
+
+
+# ---------------- CNAB 240 (extrato para conciliação, segmento E) ----------------
+def _is_cnab240(head: str, filename: str) -> bool:
+    first = head.split("\n", 1)[0].rstrip("\r")
+    return len(first) == 240 and first[:8].isdigit() and first[7] == "0"
+
+
+@register_importer("cnab240", sniff=_is_cnab240)
+def parse_cnab240(stream):
+    for line in stream:
+        # posições FEBRABAN (1-based): 8 tipo de registro, 14 segmento,
+        # 143-150 data do lançamento, 151-168 valor, 169 D/C, 177-201 histórico
+        if len(line) < 201 or line[7] != "3" or line[13] != "E":
+            continue
+        try:
+            v = line[142:150]
+            d = date(int(v[4:8]), int(v[2:4]), int(v[0:2]))
+            amount = int(line[150:168]) / 100
         except ValueError:
-            pass
-    return date.today()
+            yield None
+            continue
+        yield _row(d, line[176:201], -amount if line[168] == "D" else amount)
+
+
+# ---------------- CSV de banco ----------------
+CSV_COLUMNS = {
+    "date": ("date", "data", "dt", "data lancamento", "data movimento", "data da transacao", "data mov"),
+    "description": ("description", "descricao", "historico", "lancamento", "memo", "title", "titulo",
+                    "estabelecimento", "detalhes"),
+    "amount": ("amount", "valor", "value", "valor r$"),
+    "credit": ("credit", "credito", "entrada", "entradas"),
+    "debit": ("debit", "debito", "saida", "saidas"),
+    "type": ("type", "tipo", "d/c", "natureza"),
+    "category": ("category", "categoria"),
+}
+_ALIASES = {alias: field for field, aliases in CSV_COLUMNS.items() for alias in aliases}
+TYPE_VALUES = {
+    "income": "income", "receita": "income", "c": "income", "credito": "income", "credit": "income",
+    "expense": "expense", "despesa": "expense", "d": "expense", "debito": "expense", "debit": "expense",
+}
+
+
+def _plain(s: str) -> str:
+    s = unicodedata.normalize("NFKD", s or "").encode("ascii", "ignore").decode().lower()
+    s = re.sub(r"\(.*?\)", "", s)
+    return re.sub(r"[^a-z0-9/$ ]", "", s).strip()
+
+
+def _header_map(row: list) -> dict:
+    found = {}
+    for i, name in enumerate(row):
+        field = _ALIASES.get(_plain(name))
+        if field and field not in found:
+            found[field] = i
+    return found
+
+
+def _csv_raw(stream, delimiter):
+    reader = csv.reader(stream, delimiter=delimiter)
+    cols = None
+    # extratos costumam ter linhas de cabeçalho do banco antes da tabela
+    for row in islice(reader, 30):
+        cols = _header_map(row)
+        if "date" in cols and ("amount" in cols or "credit" in cols or "debit" in cols):
+            break
+    else:
+        raise ImportFormatError("CSV sem colunas de data e valor reconhecíveis.")
+
+    get = lambda row, field: row[cols[field]].strip() if field in cols and cols[field] < len(row) else ""  # noqa: E731
+    for row in reader:
+        if not any(c.strip() for c in row):
+            continue
+        amount = get(row, "amount")
+        if not amount:
+            # colunas separadas de crédito/débito; a vazia costuma vir como 0,00
+            credit, debit = get(row, "credit"), get(row, "debit")
+            if credit.strip(" 0.,-R$"):
+                amount = credit
+            elif debit.strip(" 0.,-R$"):
+                amount = debit if debit.startswith("-") else f"-{debit}"
+        yield {
+            "txn_date": get(row, "date"),
+            "description": get(row, "description"),
+            "amount": amount,
+            "txn_type": TYPE_VALUES.get(_plain(get(row, "type"))),
+            "category": get(row, "category") or None,
+        }
 
-def coerce_float(s: str) -> float:
-    s = (s or "").strip().replace(",", "")
+
+@register_importer(FALLBACK)
+def parse_csv(stream, head: str = ""):
+    sample = head[:8192]
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=";,\t|").delimiter
+    except csv.Error:
+        delimiter = ";" if sample.count(";") > sample.count(",") else ","
+    return _with_detected_formats(_csv_raw(stream, delimiter))
+
+
+# ---------------- leitura ----------------
+class Statement:
+    """Extrato aberto: formato/codificação detectados e linhas em fluxo.
+
+    Iterar devolve só as linhas válidas; `skipped` conta as descartadas.
+    """
+
+    def __init__(self, fmt: str, encoding: str, rows):
+        self.format = fmt
+        self.encoding = encoding
+        self.skipped = 0
+        self._rows = rows
+
+    def __iter__(self):
+        for r in self._rows:
+            if r is None:
+                self.skipped += 1
+                continue
+            yield r
+
+
+def read_statement(file_stream, filename: str = "") -> Statement:
+    """Abre um extrato binário (ex.: request.files[...].stream) sem lê-lo inteiro."""
+    file_stream.seek(0)
+    head_bytes = file_stream.read(HEAD_BYTES)
+    file_stream.seek(0)
+    if not head_bytes.strip():
+        raise ImportFormatError("Arquivo vazio.")
+    encoding = detect_encoding(head_bytes)
     try:
-        return float(s)
-    except ValueError:
-        return 0.0
\ No newline at end of file
+        codecs.lookup(encoding)
+    except LookupError:
+        raise ImportFormatError(f"Codificação desconhecida no arquivo: {encoding}.") from None
+    head = head_bytes.decode(encoding, errors="replace")
+    fmt = detect_format(head, filename or "")
+    text = io.TextIOWrapper(file_stream, encoding=encoding, errors="replace", newline="")
+    _sniff, parse = IMPORTERS[fmt]
+    rows = parse(text, head) if fmt == FALLBACK else parse(text)
+    return Statement(fmt, encoding, rows)
+
+
+# ---------------- gravação em lote ----------------
+def resolve_type(row: dict) -> tuple:
+    """(txn_type, valor positivo). Sem tipo explícito, o sinal decide."""
+    amount = row["amount"]
+    txn_type = row.get("txn_type") or ("income" if amount > 0 else "expense")
+    return txn_type, abs(amount)
+
+
+def import_rows(rows, account, default_category, batch_size: int = BATCH_SIZE) -> int:
+    """Grava as linhas em lotes de `batch_size` (um executemany por lote). Não faz commit.
+
+    INSERT em lote não passa pelo flush, então aqui se faz o que os eventos
+    do ORM fariam: casa (tenancy), moeda da conta (currency) e, a cada lote,
+    com os ids devolvidos pelo INSERT (RETURNING), os movimentos do razão e
+    os eventos de auditoria, cada um num único INSERT ... SELECT
+    (ledger.post_inserted, audit.record_inserted), e o gasto por
+    mês/categoria com os alertas de orçamento (alerts.record_inserted).
+    Pelos ids, e não por "id maior que o último antes da importação",
+    gravações concorrentes de outros usuários não entram em dobro.
+    updated_at/created_at vêm do default da coluna, e o cache é invalidado
+    pelo do_orm_execute (cache.py).
+    """
+    from sqlalchemy import insert
+
+    from . import db
+    from .alerts import record_inserted as record_spend_inserted
+    from .audit import record_inserted
+    from .ledger import post_inserted
+    from .models import Category, Transaction
+    from .tenancy import household_for_insert
+
+    if default_category is None:
+        raise ValueError("import_rows precisa de uma categoria padrão.")
+    # mesmo nome com outro tipo (despesa "Salário") cai na categoria padrão
+    categories = {(c.name.lower(), c.kind): c.id for c in Category.query.filter_by(is_active=True)}
+    household_id = household_for_insert()
+    total = 0
+    rows = iter(rows)
+    while True:
+        batch = []
+        for r in islice(rows, batch_size):
+            txn_type, amount = resolve_type(r)
+            batch.append({
+                "household_id": household_id,
+                "txn_type": txn_type,
+                "category_id": categories.get(((r.get("category") or "").lower(), txn_type), default_category.id),
+                "account_id": account.id,
+                "amount": amount,
+                "currency": account.currency,
+                "description": r["description"],
+                "txn_date": r["txn_date"],
+                "receipt_filename": "",
+            })
+        if not batch:
+            break
+        ids = list(db.session.scalars(insert(Transaction).returning(Transaction.id), batch))
+        post_inserted(household_id, ids)
+        record_inserted(household_id, ids, source="import")
+        record_spend_inserted(household_id, ids)
+        total += len(batch)
+    return total
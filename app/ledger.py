@@ -0,0 +1,134 @@
+"""Razão de contas: lançamentos geram movimentos (postings) por conta.
+
+Toda inclusão, edição ou exclusão de Transaction pelo ORM reescreve os
+movimentos dela no mesmo flush (evento after_flush), então o saldo de uma
+conta é um SUM sobre postings pelo índice (account_id, posting_date), sem
+varrer lançamentos.
+
+Transferência (txn_type="transfer") sai de `account_id` e entra em
+`to_account_id`: dois movimentos que se anulam no total da casa. Por isso
+totais de receita/despesa e relatórios filtram `txn_type != 'transfer'` na
+própria consulta.
+
+Inserções em lote via Core não passam pelo ORM: a importação de extratos
+chama `post_inserted` a cada lote, com os ids devolvidos pelo INSERT; cargas avulsas (ex.: bench/datagen) rodam
+`flask ledger-rebuild`.
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, event, func, insert, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import Account, ArchivedPeriod, Posting, Transaction
+
+TRANSFER = "transfer"
+TXN_TYPES = ("income", "expense", TRANSFER)
+
+
+def postings_for(t: Transaction) -> list:
+    base = {"household_id": t.household_id, "transaction_id": t.id, "posting_date": t.txn_date}
+    amount = float(t.amount)
+    if t.txn_type == TRANSFER:
+        return [
+            dict(base, account_id=t.account_id, amount=-amount),
+            dict(base, account_id=t.to_account_id, amount=amount),
+        ]
+    return [dict(base, account_id=t.account_id, amount=amount if t.txn_type == "income" else -amount)]
+
+
+def _sync_postings(session, flush_context):
+    changed = [o for o in list(session.new) + list(session.dirty) + list(session.deleted) if isinstance(o, Transaction)]
+    if not changed:
+        return
+    conn = session.connection()
+    conn.execute(delete(Posting.__table__).where(Posting.__table__.c.transaction_id.in_([t.id for t in changed])))
+    rows = []
+    for t in changed:
+        if t in session.deleted:
+            continue
+        rows.extend(postings_for(t))
+    if rows:
+        conn.execute(insert(Posting.__table__), rows)
+
+
+def _postings_from_transactions(*cond):
+    """INSERT ... SELECT dos movimentos dos lançamentos que atendem `cond`."""
+    t = Transaction.__table__
+    cols = lambda account, amount: select(  # noqa: E731
+        t.c.household_id, t.c.id, account.label("account_id"), t.c.txn_date, amount.label("amount"),
+    ).where(*cond)
+    source = union_all(
+        cols(t.c.account_id, case((t.c.txn_type == "income", t.c.amount), else_=-t.c.amount)),
+        cols(t.c.to_account_id, t.c.amount).where(t.c.txn_type == TRANSFER),
+    )
+    return insert(Posting.__table__).from_select(
+        ["household_id", "transaction_id", "account_id", "posting_date", "amount"], source
+    )
+
+
+def rebuild_postings(household_id: int = None) -> int:
+    """Refaz os movimentos a partir dos lançamentos (todas as casas por padrão). Não faz commit.
+
+    Movimentos de períodos arquivados (partitioning.py) são mantidos: os
+    lançamentos saíram do banco, mas continuam no saldo.
+    """
+    t = Transaction.__table__
+    p = Posting.__table__
+    a = ArchivedPeriod.__table__
+    cond = [] if household_id is None else [t.c.household_id == household_id]
+    archived = select(literal(1)).where(p.c.posting_date >= a.c.start_date, p.c.posting_date < a.c.end_date)
+    del_stmt = delete(p).where(~archived.exists())
+    if household_id is not None:
+        del_stmt = del_stmt.where(p.c.household_id == household_id)
+    conn = db.session.connection()
+    conn.execute(del_stmt)
+    return conn.execute(_postings_from_transactions(*cond)).rowcount
+
+
+def post_inserted(household_id: int, ids: list) -> int:
+    """Movimentos dos lançamentos inseridos em lote (os `ids` devolvidos pelo INSERT). Não faz commit."""
+    t = Transaction.__table__
+    stmt = _postings_from_transactions(t.c.household_id == household_id, t.c.id.in_(ids))
+    return db.session.connection().execute(stmt).rowcount
+
+
+def rebuild_if_empty():
+    """Primeira subida com o razão: gera os movimentos dos lançamentos antigos."""
+    has_postings = db.session.execute(select(literal(1)).select_from(Posting).limit(1)).first()
+    has_txns = db.session.execute(select(literal(1)).select_from(Transaction).limit(1)).first()
+    if has_txns and not has_postings:
+        rebuild_postings()
+        db.session.commit()
+
+
+def account_balances(as_of=None) -> dict:
+    """{account_id: saldo} somando os movimentos (até `as_of`, exclusivo)."""
+    stmt = select(Posting.account_id, func.sum(Posting.amount)).group_by(Posting.account_id)
+    if as_of is not None:
+        stmt = stmt.where(Posting.posting_date < as_of)
+    return {account_id: float(total or 0) for account_id, total in db.session.execute(stmt)}
+
+
+def balances_with_accounts(as_of=None) -> list:
+    balances = account_balances(as_of)
+    return [
+        {"account_id": a.id, "account": a.name, "kind": a.kind, "currency": a.currency, "balance": balances.get(a.id, 0.0)}
+        for a in Account.query.filter_by(is_active=True).order_by(Account.name)
+    ]
+
+
+@click.command("ledger-rebuild")
+@click.option("--household", type=int, help="Só esta casa (padrão: todas).")
+@with_appcontext
+def ledger_rebuild_command(household):
+    """Recalcula a tabela postings a partir dos lançamentos."""
+    n = rebuild_postings(household)
+    db.session.commit()
+    click.echo(f"{n} movimentos gerados.")
+
+
+def init_app(app):
+    app.cli.add_command(ledger_rebuild_command)
+    if not event.contains(Session, "after_flush", _sync_postings):
+        event.listen(Session, "after_flush", _sync_postings)
@@ -1,9 +1,31 @@
 from datetime import datetime, date
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import declared_attr
 from . import db
 
-class User(db.Model):
+DEFAULT_HOUSEHOLD_ID = 1
+
+class Household(db.Model):
+    """Família/casa: cada uma enxerga só os próprios dados."""
+    __tablename__ = "households"
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class HouseholdScoped:
+    """Mixin dos modelos que pertencem a uma casa (filtrados por tenancy.py)."""
+    @declared_attr
+    def household_id(cls):
+        return db.Column(
+            db.Integer, db.ForeignKey("households.id"), nullable=False,
+            default=DEFAULT_HOUSEHOLD_ID, server_default=str(DEFAULT_HOUSEHOLD_ID),
+        )
+
+class User(HouseholdScoped, db.Model):
     __tablename__ = "users"
+    __table_args__ = (
+        db.Index("ix_users_household", "household_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
     username = db.Column(db.String(80), nullable=False, unique=True)
@@ -17,54 +39,233 @@ class User(db.Model):
     def check_password(self, pw: str) -> bool:
         return check_password_hash(self.password_hash, pw)
 
-class Category(db.Model):
+class Category(HouseholdScoped, db.Model):
     __tablename__ = "categories"
+    __table_args__ = (
+        db.Index("uq_categories_household_name", "household_id", "name", unique=True),
+        db.Index("ix_categories_parent", "parent_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80), nullable=False, unique=True)
+    name = db.Column(db.String(80), nullable=False)
     kind = db.Column(db.String(10), nullable=False)  # income/expense
     is_active = db.Column(db.Boolean, default=True, nullable=False)
+    # subcategoria (Moradia -> Aluguel); a árvore inteira fica em category_closure
+    parent_id = db.Column(db.Integer, db.ForeignKey("categories.id"))
+    parent = db.relationship("Category", remote_side=[id])
 
-class Account(db.Model):
+class CategoryClosure(HouseholdScoped, db.Model):
+    """Um par (ancestral, descendente) por caminho da árvore, com a distância.
+
+    Cada categoria é ancestral de si mesma (depth 0). Mantida por categories.py.
+    """
+    __tablename__ = "category_closure"
+    __table_args__ = (
+        # lançamento -> todos os ancestrais (totais acumulados por nível)
+        db.Index("ix_category_closure_descendant", "descendant_id", "ancestor_id", "depth"),
+    )
+    ancestor_id = db.Column(db.Integer, db.ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)
+
+class Account(HouseholdScoped, db.Model):
     __tablename__ = "accounts"
+    __table_args__ = (
+        db.Index("uq_accounts_household_name", "household_id", "name", unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80), nullable=False, unique=True)
+    name = db.Column(db.String(80), nullable=False)
     kind = db.Column(db.String(20), nullable=False)  # checking/credit/cash/savings
     is_active = db.Column(db.Boolean, default=True, nullable=False)
+    currency = db.Column(db.String(3), nullable=False, default="BRL", server_default="BRL")  # ISO 4217
 
-class BudgetTemplate(db.Model):
+class BudgetTemplate(HouseholdScoped, db.Model):
     __tablename__ = "budget_templates"
+    __table_args__ = (
+        db.Index("ix_budget_templates_household", "household_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     category_id = db.Column(db.Integer, db.ForeignKey("categories.id"), nullable=False, unique=True)
     planned_amount = db.Column(db.Float, nullable=False, default=0)
     category = db.relationship("Category")
 
-class Budget(db.Model):
+class Budget(HouseholdScoped, db.Model):
     __tablename__ = "budgets"
+    __table_args__ = (
+        # uma exceção por (mês, categoria); alvo do INSERT ... ON CONFLICT
+        db.Index("uq_budgets_month_category", "month", "category_id", unique=True),
+        db.Index("ix_budgets_household_month", "household_id", "month"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     month = db.Column(db.String(7), nullable=False)  # YYYY-MM
     category_id = db.Column(db.Integer, db.ForeignKey("categories.id"), nullable=False)
     planned_amount = db.Column(db.Float, nullable=False, default=0)
     category = db.relationship("Category")
 
-class Transaction(db.Model):
+class Transaction(HouseholdScoped, db.Model):
     __tablename__ = "transactions"
+    __table_args__ = (
+        db.Index("ix_transactions_household_date", "household_id", "txn_date"),
+        db.Index("ix_transactions_household_category_date", "household_id", "category_id", "txn_date"),
+        db.Index("ix_transactions_household_account_date", "household_id", "account_id", "txn_date"),
+        db.Index("ix_transactions_household_updated", "household_id", "updated_at"),
+        db.Index("ix_transactions_household_client", "household_id", "client_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     txn_date = db.Column(db.Date, default=date.today, nullable=False)
 
-    txn_type = db.Column(db.String(10), nullable=False)  # income/expense
+    txn_type = db.Column(db.String(10), nullable=False)  # income/expense/transfer
     category_id = db.Column(db.Integer, db.ForeignKey("categories.id"), nullable=False)
     account_id = db.Column(db.Integer, db.ForeignKey("accounts.id"), nullable=False)
+    to_account_id = db.Column(db.Integer, db.ForeignKey("accounts.id"))  # destino da transferência
 
     amount = db.Column(db.Float, nullable=False)
+    # dividido entre categorias (ver splits.py): amount é o total e category_id a maior linha
+    is_split = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    # moeda do valor; sem informar, vem da conta (ver currency.py)
+    currency = db.Column(db.String(3), nullable=False, server_default="BRL")
     description = db.Column(db.String(200), default="")
     receipt_filename = db.Column(db.String(260), default="")
 
+    # sincronização offline (ver sync.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           nullable=False, server_default="1970-01-01 00:00:00")
+    client_id = db.Column(db.String(36))  # id gerado no aparelho, evita duplicar reenvios
+
     category = db.relationship("Category")
-    account = db.relationship("Account")
+    account = db.relationship("Account", foreign_keys=[account_id])
+    to_account = db.relationship("Account", foreign_keys=[to_account_id])
+    # linhas do rateio; carregadas só quando is_split (ver splits.py)
+    splits = db.relationship(
+        "TransactionSplit", order_by="TransactionSplit.id", cascade="all, delete-orphan", passive_deletes=True,
+        primaryjoin="Transaction.id == foreign(TransactionSplit.transaction_id)",
+    )
+    # só leitura: gravação por tags.set_tags (transaction_tags precisa da casa em cada linha)
+    tags = db.relationship(
+        "Tag", secondary="transaction_tags", viewonly=True, order_by="Tag.name",
+        primaryjoin="Transaction.id == foreign(TransactionTag.transaction_id)",
+        secondaryjoin="Tag.id == foreign(TransactionTag.tag_id)",
+    )
+
+class TransactionSplit(HouseholdScoped, db.Model):
+    """Linha de um lançamento dividido: parte do valor numa categoria."""
+    __tablename__ = "transaction_splits"
+    __table_args__ = (
+        db.Index("ix_transaction_splits_transaction", "transaction_id"),
+        # lançamentos divididos com linha na categoria (filtros por categoria)
+        db.Index("ix_transaction_splits_category", "category_id", "transaction_id"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    # sem FK: transactions particionada não tem chave única só em id
+    transaction_id = db.Column(db.Integer, nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey("categories.id"), nullable=False)
+    amount = db.Column(db.Float, nullable=False)  # na moeda do lançamento
+    category = db.relationship("Category")
+
+class Tag(HouseholdScoped, db.Model):
+    """Etiqueta livre de lançamentos (ver tags.py)."""
+    __tablename__ = "tags"
+    __table_args__ = (
+        db.Index("uq_tags_household_name", "household_id", "name", unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(40), nullable=False)  # minúsculas, sem espaços nas pontas
+
+class TransactionTag(HouseholdScoped, db.Model):
+    """Lançamento x etiqueta, indexado nos dois sentidos.
+
+    A chave (transaction_id, tag_id) dá as etiquetas de um lançamento; o
+    índice (tag_id, transaction_id), os lançamentos de uma etiqueta.
+    """
+    __tablename__ = "transaction_tags"
+    __table_args__ = (
+        db.Index("ix_transaction_tags_tag", "tag_id", "transaction_id"),
+    )
+    # sem FK: transactions particionada não tem chave única só em id
+    transaction_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    tag_id = db.Column(db.Integer, db.ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True, autoincrement=False)
+
+class Posting(HouseholdScoped, db.Model):
+    """Movimento de uma conta gerado por um lançamento (ver ledger.py).
+
+    Receita: +valor na conta; despesa: -valor; transferência: -valor na
+    origem e +valor no destino. Saldo da conta = soma dos movimentos.
+    """
+    __tablename__ = "postings"
+    __table_args__ = (
+        db.Index("ix_postings_account_date", "account_id", "posting_date"),
+        db.Index("ix_postings_household_account", "household_id", "account_id"),
+        db.Index("ix_postings_transaction", "transaction_id"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    # sem FK: transactions particionada não tem chave única só em id
+    transaction_id = db.Column(db.Integer, nullable=False)
+    account_id = db.Column(db.Integer, db.ForeignKey("accounts.id"), nullable=False)
+    posting_date = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Float, nullable=False)  # com sinal
 
-class RecurringTransaction(db.Model):
+class TransactionTombstone(HouseholdScoped, db.Model):
+    """Lançamento apagado: o delta de sincronização avisa os aparelhos."""
+    __tablename__ = "transaction_tombstones"
+    __table_args__ = (
+        db.Index("ix_tombstones_household_deleted", "household_id", "deleted_at"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class TransactionEvent(HouseholdScoped, db.Model):
+    """Histórico (só inclusão) de alterações em lançamentos; ver audit.py.
+
+    `changes` é JSON compacto: na criação os campos preenchidos, na edição
+    {campo: [antes, depois]} só do que mudou, na exclusão o lançamento todo.
+    """
+    __tablename__ = "transaction_events"
+    __table_args__ = (
+        db.Index("ix_transaction_events_entity_ts", "entity_id", "ts"),
+        db.Index("ix_transaction_events_household_ts", "household_id", "ts"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    entity_id = db.Column(db.Integer, nullable=False)  # transactions.id (sem FK: a tabela pode ser particionada)
+    ts = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # create/update/delete
+    user_id = db.Column(db.Integer)
+    changes = db.Column(db.Text, nullable=False, default="{}")
+
+class CategorySpend(HouseholdScoped, db.Model):
+    """Gasto acumulado por (mês, categoria) com as subcategorias, na moeda dos relatórios; ver alerts.py."""
+    __tablename__ = "category_spend"
+    __table_args__ = (
+        # alvo do INSERT ... ON CONFLICT que soma o delta de cada gravação
+        db.Index("uq_category_spend_month_category", "month", "category_id", unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    category_id = db.Column(db.Integer, db.ForeignKey("categories.id"), nullable=False)
+    amount = db.Column(db.Float, nullable=False, default=0)
+
+class BudgetAlert(HouseholdScoped, db.Model):
+    """Orçamento de (mês, categoria) que passou de `threshold`% (uma vez por limite)."""
+    __tablename__ = "budget_alerts"
+    __table_args__ = (
+        db.Index("uq_budget_alerts_month_category_threshold", "month", "category_id", "threshold", unique=True),
+        db.Index("ix_budget_alerts_household_created", "household_id", "created_at"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey("categories.id"), nullable=False)
+    threshold = db.Column(db.Integer, nullable=False)  # 80, 100...
+    spent = db.Column(db.Float, nullable=False)
+    planned = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    read_at = db.Column(db.DateTime)
+    category = db.relationship("Category")
+
+class RecurringTransaction(HouseholdScoped, db.Model):
     __tablename__ = "recurring_transactions"
+    __table_args__ = (
+        db.Index("ix_recurring_household_active", "household_id", "is_active"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)  # Ex: Aluguel
     txn_type = db.Column(db.String(10), nullable=False, default="expense")  # income/expense
@@ -79,7 +280,40 @@ class RecurringTransaction(db.Model):
     category = db.relationship("Category")
     account = db.relationship("Account")
 
+class ArchivedPeriod(db.Model):
+    """Período de lançamentos tirado do banco e gravado em arquivo (ver partitioning.py)."""
+    __tablename__ = "archived_periods"
+    id = db.Column(db.Integer, primary_key=True)
+    start_date = db.Column(db.Date, nullable=False)  # inclusivo
+    end_date = db.Column(db.Date, nullable=False)  # exclusivo
+    path = db.Column(db.String(500), nullable=False)
+    fmt = db.Column(db.String(10), nullable=False)  # csv.gz/parquet
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class ExchangeRate(db.Model):
+    """Cotação do dia: 1 `currency` = `rate` na moeda `quote` (ver currency.py)."""
+    __tablename__ = "exchange_rates"
+    __table_args__ = (
+        db.Index("uq_exchange_rates_pair_date", "currency", "quote", "rate_date", unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    rate_date = db.Column(db.Date, nullable=False)
+    currency = db.Column(db.String(3), nullable=False)
+    quote = db.Column(db.String(3), nullable=False)
+    rate = db.Column(db.Float, nullable=False)
+
+class AppMeta(db.Model):
+    """Chave/valor de controle da aplicação (ex.: versão do schema aplicada)."""
+    __tablename__ = "app_meta"
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(200), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
 def seed_if_empty():
+    if db.session.get(Household, DEFAULT_HOUSEHOLD_ID) is None:
+        db.session.add(Household(id=DEFAULT_HOUSEHOLD_ID, name="Casa"))
+        db.session.flush()
 
     # Usuários padrão (troque as senhas na primeira entrada)
     if User.query.count() == 0:
@@ -88,7 +322,13 @@ def seed_if_empty():
         db.session.add(admin)
         db.session.add(spouse)
 
-    if Category.query.count() == 0:
+    seed_household(DEFAULT_HOUSEHOLD_ID)
+
+def seed_household(household_id: int):
+    """Categorias, contas e orçamento padrão de uma casa (só o que estiver vazio)."""
+    hid = household_id
+
+    if Category.query.filter_by(household_id=hid).count() == 0:
         defaults = [
             ("Salário", "income"), ("Extra/Bônus", "income"), ("Reembolso", "income"),
             ("Moradia", "expense"), ("Contas", "expense"), ("Mercado", "expense"),
@@ -97,9 +337,9 @@ def seed_if_empty():
             ("Serviços", "expense"), ("Cartão (pagamento)", "expense"), ("Poupança/Reserva", "expense"),
         ]
         for name, kind in defaults:
-            db.session.add(Category(name=name, kind=kind, is_active=True))
+            db.session.add(Category(household_id=hid, name=name, kind=kind, is_active=True))
 
-    if Account.query.count() == 0:
+    if Account.query.filter_by(household_id=hid).count() == 0:
         accs = [
             ("Conta Corrente", "checking"),
             ("Cartão de Crédito", "credit"),
@@ -107,20 +347,20 @@ def seed_if_empty():
             ("Poupança", "savings"),
         ]
         for name, kind in accs:
-            db.session.add(Account(name=name, kind=kind, is_active=True))
+            db.session.add(Account(household_id=hid, name=name, kind=kind, is_active=True))
 
     # seed budget templates (orçamento padrão)
     from sqlalchemy import desc
-    if BudgetTemplate.query.count() == 0:
-        latest = Budget.query.order_by(desc(Budget.month)).first()
+    if BudgetTemplate.query.filter_by(household_id=hid).count() == 0:
+        latest = Budget.query.filter_by(household_id=hid).order_by(desc(Budget.month)).first()
         if latest:
-            items = Budget.query.filter_by(month=latest.month).all()
+            items = Budget.query.filter_by(household_id=hid, month=latest.month).all()
             for b in items:
                 if b.category and b.category.kind == "expense":
-                    db.session.add(BudgetTemplate(category_id=b.category_id, planned_amount=b.planned_amount))
+                    db.session.add(BudgetTemplate(household_id=hid, category_id=b.category_id, planned_amount=b.planned_amount))
         else:
-            expenses = Category.query.filter_by(kind="expense", is_active=True).all()
+            expenses = Category.query.filter_by(household_id=hid, kind="expense", is_active=True).all()
             for c in expenses:
-                db.session.add(BudgetTemplate(category_id=c.id, planned_amount=0))
+                db.session.add(BudgetTemplate(household_id=hid, category_id=c.id, planned_amount=0))
 
     db.session.commit()
@@ -0,0 +1,435 @@
+"""Particionamento de `transactions` por mês ou ano (opcional, só PostgreSQL).
+
+Toda consulta de lançamentos filtra por faixa de txn_date, então com a
+tabela particionada por RANGE (txn_date) o mês atual toca só uma partição
+pequena, e VACUUM/REINDEX passam a ser por partição.
+
+    flask partitions convert --interval month   # converte a tabela (uma vez)
+    flask partitions ensure --ahead 3           # cria partições futuras
+    flask partitions archive 2021 --format csv.gz
+    flask partitions status
+
+`ensure` também roda a cada boot quando a tabela já está particionada, e
+uma partição DEFAULT recebe datas fora das faixas criadas.
+
+`archive` desanexa as partições de um ano fechado, grava as linhas em
+arquivo comprimido (CSV.gz, ou Parquet se houver pyarrow) em ARCHIVE_FOLDER
+e apaga a partição. Relatórios e exportações continuam enxergando esses
+períodos via `archived_transactions()`. Cada arquivo é lido uma vez por
+processo (enquanto não mudar: a chave tem mtime e tamanho) e fica em
+memória separado por casa e ordenado por data, para os últimos
+ARCHIVE_CACHE_FILES arquivos usados.
+"""
+import csv
+import gzip
+import os
+from bisect import bisect_left
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from types import SimpleNamespace
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from . import db
+from .cache import cached
+from .dbutil import is_postgres
+from .models import Account, ArchivedPeriod, Category, Transaction
+from .splits import expand
+from .tenancy import current_household_id
+
+PARENT = "transactions"
+DEFAULT_PARTITION = f"{PARENT}_default"
+CHUNK = 5000
+ARCHIVE_CACHE_FILES = int(os.getenv("ARCHIVE_CACHE_FILES", "4"))
+
+partitions_cli = AppGroup("partitions", help="Particionamento de lançamentos (PostgreSQL).")
+
+
+# ---------------- faixas ----------------
+def _period_start(d: date, interval: str) -> date:
+    return date(d.year, 1, 1) if interval == "year" else date(d.year, d.month, 1)
+
+
+def _next_start(d: date, interval: str) -> date:
+    if interval == "year":
+        return date(d.year + 1, 1, 1)
+    return date(d.year + 1, 1, 1) if d.month == 12 else date(d.year, d.month + 1, 1)
+
+
+def _partition_name(start: date, interval: str) -> str:
+    if interval == "year":
+        return f"{PARENT}_{start.year:04d}"
+    return f"{PARENT}_{start.year:04d}_{start.month:02d}"
+
+
+# ---------------- catálogo ----------------
+def is_partitioned() -> bool:
+    if not is_postgres():
+        return False
+    row = db.session.execute(text(
+        """SELECT 1 FROM pg_partitioned_table pt
+             JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = :name AND c.relnamespace = current_schema()::regnamespace"""
+    ), {"name": PARENT}).first()
+    return row is not None
+
+
+def partition_interval() -> str:
+    """Intervalo gravado no comentário da tabela ('partitioned:month')."""
+    comment = db.session.execute(text(
+        "SELECT obj_description(CAST(:name AS regclass), 'pg_class')"
+    ), {"name": PARENT}).scalar() or ""
+    return "year" if comment.endswith(":year") else "month"
+
+
+def list_partitions() -> list:
+    rows = db.session.execute(text(
+        """SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint
+             FROM pg_inherits i
+             JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:name AS regclass)
+            ORDER BY c.relname"""
+    ), {"name": PARENT}).all()
+    return [{"name": r[0], "bound": r[1], "rows": int(r[2]) if r[2] is not None and r[2] >= 0 else None} for r in rows]
+
+
+def _require_postgres():
+    if not is_postgres():
+        raise click.ClickException("Particionamento só é suportado no PostgreSQL.")
+
+
+# ---------------- criação ----------------
+def _create_partition(start: date, end: date, name: str):
+    """Cria a partição [start, end); move antes o que já caiu na DEFAULT."""
+    s, e = start.isoformat(), end.isoformat()
+    in_default = db.session.execute(text(
+        f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE txn_date >= :s AND txn_date < :e LIMIT 1"
+    ), {"s": start, "e": end}).first()
+    if not in_default:
+        db.session.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES FROM ('{s}') TO ('{e}')"
+        ))
+        return
+    db.session.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    db.session.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE txn_date >= :s AND txn_date < :e RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"s": start, "e": end})
+    db.session.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ('{s}') TO ('{e}')"))
+
+
+def ensure_range(first: date, last: date, interval: str = None) -> list:
+    """Garante partições cobrindo first..last (inclusive). Não faz commit."""
+    interval = interval or partition_interval()
+    existing = {p["name"] for p in list_partitions()}
+    created = []
+    start = _period_start(first, interval)
+    while start <= last:
+        end = _next_start(start, interval)
+        name = _partition_name(start, interval)
+        if name not in existing:
+            _create_partition(start, end, name)
+            created.append(name)
+        start = end
+    return created
+
+
+def ensure_partitions(ahead: int = 3) -> list:
+    """Partições do período atual até `ahead` períodos à frente.
+
+    Roda no boot de cada worker: sob o mesmo lock do bootstrap, senão dois
+    workers veem a partição faltando e o segundo CREATE TABLE falha.
+    """
+    from .bootstrap import init_lock
+
+    if not is_partitioned():
+        return []
+    interval = partition_interval()
+    last = _period_start(date.today(), interval)
+    for _ in range(ahead):
+        last = _next_start(last, interval)
+    with init_lock():
+        # ensure_range relê o catálogo: outro worker pode ter criado enquanto esperávamos
+        created = ensure_range(date.today(), last, interval)
+        db.session.commit()
+    return created
+
+
+def convert(interval: str = "month", ahead: int = 3):
+    """Converte `transactions` em tabela particionada, numa única transação.
+
+    A chave primária passa a ser (id, txn_date), exigência do Postgres para
+    tabelas particionadas. Chaves estrangeiras que apontam PARA transactions
+    são removidas (precisariam incluir txn_date); as que saem dela
+    (categoria, conta, casa) são recriadas.
+    """
+    if is_partitioned():
+        raise click.ClickException("transactions já está particionada.")
+    old = f"{PARENT}_unpartitioned"
+    db.session.execute(text(f"LOCK TABLE {PARENT} IN ACCESS EXCLUSIVE MODE"))
+
+    outgoing_fks = db.session.execute(text(
+        """SELECT pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = CAST(:name AS regclass) AND contype = 'f'"""
+    ), {"name": PARENT}).scalars().all()
+    incoming_fks = db.session.execute(text(
+        """SELECT conrelid::regclass::text, conname FROM pg_constraint
+            WHERE confrelid = CAST(:name AS regclass) AND contype = 'f'"""
+    ), {"name": PARENT}).all()
+    for table, conname in incoming_fks:
+        db.session.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{conname}"'))
+
+    db.session.execute(text(f"ALTER TABLE {PARENT} RENAME TO {old}"))
+    seq = db.session.execute(text(f"SELECT pg_get_serial_sequence('{old}', 'id')")).scalar()
+
+    db.session.execute(text(
+        f"CREATE TABLE {PARENT} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (txn_date)"
+    ))
+    db.session.execute(text(f"ALTER TABLE {PARENT} ADD PRIMARY KEY (id, txn_date)"))
+    for fk in outgoing_fks:
+        db.session.execute(text(f"ALTER TABLE {PARENT} ADD {fk}"))
+    db.session.execute(text(f"COMMENT ON TABLE {PARENT} IS 'partitioned:{interval}'"))
+    db.session.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+
+    first = db.session.execute(text(f"SELECT MIN(txn_date) FROM {old}")).scalar() or date.today()
+    last = _period_start(date.today(), interval)
+    for _ in range(ahead):
+        last = _next_start(last, interval)
+    created = ensure_range(first, last, interval)
+
+    db.session.execute(text(f"INSERT INTO {PARENT} SELECT * FROM {old}"))
+    if seq:
+        db.session.execute(text(f"ALTER SEQUENCE {seq} OWNED BY NONE"))
+    db.session.execute(text(f"DROP TABLE {old}"))
+    if seq:
+        db.session.execute(text(f"ALTER SEQUENCE {seq} OWNED BY {PARENT}.id"))
+
+    # índices do modelo, criados no pai e propagados para cada partição
+    for index in Transaction.__table__.indexes:
+        index.create(db.session.connection())
+    db.session.commit()
+    return created
+
+
+# ---------------- arquivo ----------------
+def archive_folder() -> Path:
+    folder = Path(os.getenv("ARCHIVE_FOLDER") or Path(current_app.config["BASE_DIR"]) / "archive")
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+
+def _write_rows(result, path: Path, fmt: str) -> int:
+    columns = list(result.keys())
+    n = 0
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            while True:
+                chunk = result.fetchmany(CHUNK)
+                if not chunk:
+                    break
+                batch = pa.Table.from_pylist([dict(zip(columns, r)) for r in chunk])
+                if writer is None:
+                    writer = pq.ParquetWriter(str(path), batch.schema, compression="zstd")
+                writer.write_table(batch)
+                n += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return n
+
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(columns)
+        while True:
+            chunk = result.fetchmany(CHUNK)
+            if not chunk:
+                break
+            w.writerows(chunk)
+            n += len(chunk)
+    return n
+
+
+def archive_year(year: int, fmt: str = "csv.gz") -> list:
+    """Desanexa as partições do ano, grava em arquivo e apaga do banco."""
+    if not is_partitioned():
+        raise click.ClickException("transactions não está particionada (rode 'flask partitions convert').")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise click.ClickException("Formato parquet requer o pacote pyarrow.")
+    if date(year + 1, 1, 1) > _period_start(date.today(), "year"):
+        raise click.ClickException("Só é possível arquivar anos já fechados.")
+
+    interval = partition_interval()
+    start, end = date(year, 1, 1), date(year + 1, 1, 1)
+    ensure_range(start, date(year, 12, 31), interval)  # tira da DEFAULT o que for desse ano
+
+    folder = archive_folder()
+    done = []
+    p = start
+    while p < end:
+        nxt = _next_start(p, interval)
+        name = _partition_name(p, interval)
+        db.session.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        path = folder / f"{name}.{fmt}"
+        result = db.session.execute(
+            text(f"SELECT * FROM {name} ORDER BY txn_date, id"),
+            execution_options={"stream_results": True},
+        )
+        rows = _write_rows(result, path, fmt)
+        if rows:
+            db.session.add(ArchivedPeriod(start_date=p, end_date=nxt, path=str(path), fmt=fmt, rows=rows))
+            done.append((name, rows, str(path)))
+        else:
+            path.unlink(missing_ok=True)
+        db.session.execute(text(f"DROP TABLE {name}"))
+        p = nxt
+    db.session.commit()
+    return done
+
+
+def _archived_periods() -> list:
+    return cached(("archived_periods",), lambda: [
+        (a.start_date, a.end_date, a.path, a.fmt) for a in ArchivedPeriod.query.order_by(ArchivedPeriod.start_date).all()
+    ])
+
+
+def _read_archive(path: str, fmt: str):
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=CHUNK):
+            yield from batch.to_pylist()
+        return
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        for r in csv.DictReader(f):
+            r["id"] = int(r["id"])
+            r["household_id"] = int(r["household_id"])
+            r["category_id"] = int(r["category_id"])
+            r["account_id"] = int(r["account_id"])
+            r["to_account_id"] = int(r["to_account_id"]) if r.get("to_account_id") else None
+            r["amount"] = float(r["amount"])
+            r["txn_date"] = date.fromisoformat(r["txn_date"])
+            r["created_at"] = datetime.fromisoformat(r["created_at"]) if r.get("created_at") else None
+            r["is_split"] = r.get("is_split") in ("True", "true", "t", "1")  # arquivos antigos: sem a coluna
+            yield r
+
+
+@lru_cache(maxsize=ARCHIVE_CACHE_FILES)
+def _parsed_archive(path: str, fmt: str, mtime_ns: int, size: int) -> dict:
+    """{casa: (datas ordenadas, linhas)} do arquivo; mtime e tamanho só entram na chave."""
+    by_household = {}
+    for r in _read_archive(path, fmt):
+        by_household.setdefault(r["household_id"], []).append(r)
+    out = {}
+    for hid, rows in by_household.items():
+        rows.sort(key=lambda r: r["txn_date"])
+        out[hid] = ([r["txn_date"] for r in rows], rows)
+    return out
+
+
+def _archive_rows(path: str, fmt: str, household_id, start: date, end: date):
+    """Linhas do arquivo em [start, end), só da casa (todas fora de requisição). Não alterar: são do cache."""
+    st = os.stat(path)
+    parsed = _parsed_archive(path, fmt, st.st_mtime_ns, st.st_size)
+    groups = parsed.values() if household_id is None else [parsed.get(household_id, ([], []))]
+    for dates, rows in groups:
+        yield from rows[bisect_left(dates, start):bisect_left(dates, end)]
+
+
+def archived_transactions(start: date, end: date, txn_type=None, account_id=None, category_ids=None,
+                          tag_filter=None) -> list:
+    """Lançamentos arquivados em [start, end), com os mesmos atributos do modelo.
+
+    Sem `txn_type`, transferências ficam de fora, como nos relatórios. As
+    etiquetas (tags.TagFilter) e as linhas dos divididos continuam no banco
+    depois de arquivar; cada dividido vira uma linha por categoria. Só lê
+    arquivos de períodos que se sobrepõem à faixa, já separados por casa e
+    ordenados por data (`_parsed_archive`); sem arquivo, custa uma consulta
+    (em cache) à tabela archived_periods.
+    """
+    periods = [p for p in _archived_periods() if p[0] < end and p[1] > start]
+    if not periods:
+        return []
+    hid = current_household_id()
+    categories = {c.id: c for c in Category.query.all()}
+    accounts = {a.id: a for a in Account.query.all()}
+    category_ids = set(category_ids or [])
+    tagged_ids = None
+    if tag_filter:
+        from .tags import matching_ids
+        tagged_ids = matching_ids(tag_filter)
+    out = []
+    for _, _, path, fmt in periods:
+        for r in _archive_rows(path, fmt, hid, start, end):
+            if txn_type and r["txn_type"] != txn_type:
+                continue
+            if not txn_type and r["txn_type"] == "transfer":
+                continue
+            if account_id and r["account_id"] != account_id:
+                continue
+            if tagged_ids is not None and r["id"] not in tagged_ids:
+                continue
+            out.append(SimpleNamespace(
+                **r, category=categories.get(r["category_id"]), account=accounts.get(r["account_id"]),
+                to_account=accounts.get(r.get("to_account_id")),
+            ))
+    out = expand(out, categories)
+    if category_ids:
+        out = [r for r in out if r.category_id in category_ids]
+    return out
+
+
+# ---------------- CLI ----------------
+@partitions_cli.command("convert")
+@click.option("--interval", type=click.Choice(["month", "year"]), default="month")
+@click.option("--ahead", default=3, help="Partições futuras a criar.")
+def convert_command(interval, ahead):
+    """Converte transactions em tabela particionada por txn_date."""
+    _require_postgres()
+    created = convert(interval, ahead)
+    click.echo(f"transactions particionada por {interval}: {len(created)} partições criadas.")
+
+
+@partitions_cli.command("ensure")
+@click.option("--ahead", default=3, help="Partições futuras a garantir.")
+def ensure_command(ahead):
+    """Cria as partições que faltam até `ahead` períodos à frente."""
+    _require_postgres()
+    created = ensure_partitions(ahead)
+    click.echo(f"{len(created)} partições criadas." + (" " + ", ".join(created) if created else ""))
+
+
+@partitions_cli.command("archive")
+@click.argument("year", type=int)
+@click.option("--format", "fmt", type=click.Choice(["csv.gz", "parquet"]), default="csv.gz")
+def archive_command(year, fmt):
+    """Move um ano fechado para arquivo comprimido em ARCHIVE_FOLDER."""
+    _require_postgres()
+    for name, rows, path in archive_year(year, fmt):
+        click.echo(f"{name}: {rows} linhas -> {path}")
+
+
+@partitions_cli.command("status")
+def status_command():
+    """Lista partições e períodos arquivados."""
+    _require_postgres()
+    if not is_partitioned():
+        click.echo("transactions não está particionada.")
+    else:
+        click.echo(f"Particionada por {partition_interval()}:")
+        for p in list_partitions():
+            click.echo(f"  {p['name']}: {p['bound']} (~{p['rows'] if p['rows'] is not None else '?'} linhas)")
+    for a in ArchivedPeriod.query.order_by(ArchivedPeriod.start_date).all():
+        click.echo(f"  arquivo {a.start_date} a {a.end_date}: {a.rows} linhas em {a.path}")
+
+
+def init_app(app):
+    app.cli.add_command(partitions_cli)
@@ -0,0 +1,141 @@
+"""Tabela dinâmica categoria x mês (relatório cruzado).
+
+Uma única consulta agrupada por (categoria, mês) traz só as células com
+valor; elas vão para uma matriz densa (array de floats, linha = categoria,
+coluna = mês, valores[i * meses + j]) e os totais de linha, de coluna e o
+geral saem de fatias dela. A mesma Pivot vira HTML (reports_pivot.html),
+XLSX com fórmulas (exporters.export_pivot_xlsx) e JSON (`to_dict`).
+
+Valores na moeda dos relatórios (ver currency.converted). Com "Todos" os
+tipos, receitas entram positivas e despesas negativas: o total geral é o
+saldo do período. Anos arquivados (partitioning.py) somam na mesma matriz.
+"""
+import re
+from array import array
+
+from sqlalchemy import case, func, select
+
+from . import db
+from .budget_engine import month_list
+from .cache import cached
+from .currency import convert, converted, report_currency
+from .dbutil import month_key
+from .ledger import TRANSFER
+from .models import Category, Transaction
+from .partitioning import archived_transactions
+from .splits import line_columns
+from .utils import month_first_day, next_month_first_day
+
+TXN_TYPES = ("income", "expense")
+MAX_MONTHS = 120
+MONTH_RE = re.compile(r"\d{4}-(0[1-9]|1[0-2])")
+
+
+class Pivot:
+    """Matriz densa categorias x meses, com totais."""
+
+    def __init__(self, categories: list, months: list, values: array):
+        self.categories = categories  # [{"id", "name", "kind"}], na ordem das linhas
+        self.months = months
+        self.values = values
+        n = len(months)
+        self.row_totals = [sum(values[i * n:(i + 1) * n]) for i in range(len(categories))]
+        self.col_totals = [sum(values[j::n]) for j in range(n)] if categories else [0.0] * n
+        self.total = sum(self.row_totals)
+
+    def row(self, i: int) -> array:
+        n = len(self.months)
+        return self.values[i * n:(i + 1) * n]
+
+    def __iter__(self):
+        """(categoria, valores por mês, total da linha)."""
+        for i, cat in enumerate(self.categories):
+            yield cat, self.row(i), self.row_totals[i]
+
+    def to_dict(self) -> dict:
+        return {
+            "currency": report_currency(),
+            "months": self.months,
+            "rows": [
+                {**cat, "values": [round(v, 2) for v in cells], "total": round(total, 2)}
+                for cat, cells, total in self
+            ],
+            "month_totals": [round(v, 2) for v in self.col_totals],
+            "total": round(self.total, 2),
+        }
+
+
+def build(start_ym: str, end_ym: str, txn_type: str = "expense", account_id: int = None) -> Pivot:
+    """Pivot de [start_ym, end_ym] (meses 'YYYY-MM', inclusive). Em cache por filtros + versão dos dados.
+
+    ValueError para mês inválido ou faixa maior que MAX_MONTHS.
+    """
+    if not (MONTH_RE.fullmatch(start_ym or "") and MONTH_RE.fullmatch(end_ym or "")):
+        raise ValueError("mês inválido")
+    months = month_list(start_ym, end_ym)
+    if not months or len(months) > MAX_MONTHS:
+        raise ValueError("faixa de meses inválida")
+    key = ("pivot", months[0], months[-1], txn_type, account_id, report_currency())
+    return cached(key, lambda: _compute(months, txn_type, account_id))
+
+
+def _compute(months: list, txn_type: str, account_id: int) -> Pivot:
+    start = month_first_day(months[0])
+    end = next_month_first_day(months[-1])
+    category, line_amount, with_lines = line_columns()
+    amount, with_rates = converted(line_amount, Transaction.currency, Transaction.txn_date, start, end)
+    if txn_type not in TXN_TYPES:
+        amount = case((Transaction.txn_type == "expense", -amount), else_=amount)
+    ym = month_key(Transaction.txn_date).label("ym")
+
+    stmt = (
+        with_rates(with_lines(select(Category.id, Category.name, Category.kind, ym, func.sum(amount))
+                              .select_from(Transaction))
+                   .join(Category, Category.id == category))
+        .where(Transaction.txn_date >= start, Transaction.txn_date < end)
+        .group_by(Category.id, Category.name, Category.kind, ym)
+    )
+    if txn_type in TXN_TYPES:
+        stmt = stmt.where(Transaction.txn_type == txn_type)
+    else:
+        stmt = stmt.where(Transaction.txn_type != TRANSFER)
+    if account_id:
+        stmt = stmt.where(Transaction.account_id == account_id)
+
+    cells = [(cid, name, kind, m, float(total or 0)) for cid, name, kind, m, total in db.session.execute(stmt)]
+    for t in archived_transactions(
+        start, end, txn_type=txn_type if txn_type in TXN_TYPES else None, account_id=account_id
+    ):
+        value = convert(t.amount, getattr(t, "currency", None), t.txn_date)
+        if value is None:
+            continue  # sem cotação: fora dos totais, como no SELECT
+        if txn_type not in TXN_TYPES and t.txn_type == "expense":
+            value = -value
+        cat = t.category
+        cells.append((t.category_id, cat.name if cat else "?", cat.kind if cat else t.txn_type,
+                      t.txn_date.strftime("%Y-%m"), value))
+
+    categories = {}
+    for cid, name, kind, _, _ in cells:
+        categories.setdefault(cid, {"id": cid, "name": name, "kind": kind})
+    # receitas antes de despesas, por nome
+    ordered = sorted(categories.values(), key=lambda c: (c["kind"] != "income", c["name"].lower()))
+    row_of = {c["id"]: i for i, c in enumerate(ordered)}
+    col_of = {m: j for j, m in enumerate(months)}
+
+    n = len(months)
+    values = array("d", [0.0]) * (n * len(ordered))
+    for cid, _, _, m, total in cells:
+        j = col_of.get(m)
+        if j is not None:
+            values[row_of[cid] * n + j] += total
+    return Pivot(ordered, months, values)
+
+
+def last_months(end_ym: str, count: int = 12) -> str:
+    """Primeiro mês de uma janela de `count` meses terminando em end_ym."""
+    y, m = map(int, end_ym.split("-"))
+    m -= count - 1
+    while m < 1:
+        y, m = y - 1, m + 12
+    return f"{y:04d}-{m:02d}"
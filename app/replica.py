@@ -0,0 +1,113 @@
+"""Leituras pesadas numa réplica (DATABASE_REPLICA_URL), opcional.
+
+Sem DATABASE_REPLICA_URL nada muda: tudo vai para o banco principal.
+Com ela, as views marcadas com @replica_reads (relatórios, exportações,
+dashboard, diagnóstico) fazem os SELECTs na réplica, e o resto do app usa
+o principal. A escolha é feita em um só lugar, no get_bind da sessão
+(RoutingSession); as consultas não mudam.
+
+Vai sempre para o principal, mesmo numa view de leitura:
+- flush, INSERT/UPDATE/DELETE e tudo depois da primeira escrita na sessão;
+- o que roda dentro de `with primary():` (ex.: gerar recorrentes, que lê
+  para decidir o que gravar);
+- as requisições de quem gravou algo nos últimos REPLICA_STICKY_SECONDS
+  (padrão 10): ler o que acabou de salvar não depende do atraso da réplica.
+
+Para testar localmente basta uma cópia do arquivo SQLite ou um segundo
+Postgres em DATABASE_REPLICA_URL.
+"""
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_request_context, request, session as web_session
+from flask_sqlalchemy.session import Session as BaseSession
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+REPLICA_BIND = "replica"
+STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+
+
+def replica_url():
+    return os.getenv("DATABASE_REPLICA_URL", "").strip() or None
+
+
+class RoutingSession(BaseSession):
+    """Sessão do Flask-SQLAlchemy que manda leituras para a réplica quando permitido."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause) -> bool:
+        if self._flushing or self.info.get("wrote") or self.info.get("primary"):
+            return False
+        if clause is None or getattr(clause, "is_dml", False):
+            return False  # session.connection() sem cláusula é usado para escrever em lote
+        return has_request_context() and g.get("replica_reads", False)
+
+
+def replica_reads(view):
+    """Marca uma view só de leitura: os SELECTs dela podem ir para a réplica."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if request.method in ("GET", "HEAD") and web_session.get("primary_until", 0) <= time.time():
+            g.replica_reads = True
+        return view(*args, **kwargs)
+    return wrapped
+
+
+@contextmanager
+def primary():
+    """Leituras deste bloco vão para o banco principal."""
+    from . import db
+    previous = db.session.info.get("primary")
+    db.session.info["primary"] = True
+    try:
+        yield
+    finally:
+        db.session.info["primary"] = previous
+
+
+def _mark_write(session, *args):
+    session.info["wrote"] = True
+
+
+def _on_orm_execute(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
+
+def _after_commit(session):
+    # quem gravou lê do principal por alguns segundos (atraso da réplica)
+    if session.info.get("wrote") and has_request_context() and STICKY_SECONDS:
+        web_session["primary_until"] = time.time() + STICKY_SECONDS
+
+
+def configure(app, url: str):
+    """Antes de db.init_app: registra a réplica como bind extra.
+
+    As opções padrão do engine valem para os dois; aqui só o que depende
+    do banco da réplica, que pode ser de outro tipo que o principal.
+    """
+    from . import sqlite_profile
+    options = {"url": url}
+    if sqlite_profile.enabled(url):
+        options.update(sqlite_profile.engine_options())
+    elif not url.startswith("sqlite"):
+        options.update(pool_pre_ping=True, connect_args={})
+    app.config["SQLALCHEMY_BINDS"] = {REPLICA_BIND: options}
+
+
+def init_app(app):
+    if REPLICA_BIND not in app.config.get("SQLALCHEMY_BINDS", {}):
+        return
+    if not event.contains(Session, "after_commit", _after_commit):
+        event.listen(Session, "before_flush", _mark_write)
+        event.listen(Session, "do_orm_execute", _on_orm_execute)
+        event.listen(Session, "after_commit", _after_commit)
@@ -1,74 +1,92 @@
 import os
+import re
 from datetime import datetime, date, timedelta
+from itertools import islice
 from pathlib import Path
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_from_directory, session
+from flask import Blueprint, abort, render_template, request, redirect, url_for, flash, send_from_directory, session, Response, stream_with_context
 from werkzeug.utils import secure_filename
-from sqlalchemy import text
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
 
-from . import db
+from . import columnar, db, singleflight
 from .models import Transaction, Budget, BudgetTemplate, RecurringTransaction, Category, Account, User
-from .utils import month_now, month_first_day, next_month_first_day, login_required, admin_required
-from .exporters import export_csv, export_xlsx_professional, export_pdf_professional
-from .importers import parse_bank_csv, coerce_date, coerce_float
+from .utils import month_now, month_first_day, next_month_first_day, login_required, admin_required, format_currency
+from .exporters import export_csv, export_xlsx_professional, export_pdf_professional, export_pivot_xlsx
+from .importers import ImportFormatError, import_rows, read_statement
+from .diagnostics import get_diagnostics
+from .budget_engine import budget_vs_actual, period_months, period_totals
+from .budget_bulk import BulkBudgetError, parse_cells, upsert_cells, clone_month
+from .partitioning import archived_transactions
+from .sync import SyncError, apply_batch, delta
+from .cache import data_version, reference_fingerprint, transactions_fingerprint
+from .ledger import TRANSFER, TXN_TYPES, balances_with_accounts
+from .assets import precache_urls, precache_version
+from .currency import CURRENCIES, convert, converted, missing_rates, report_currency
+from .audit import FIELD_LABELS, timeline
+from .pivot import MONTH_RE as PIVOT_MONTH_RE, build as build_pivot, last_months
+from .tenancy import current_household_id
+from .replica import primary, replica_reads
+from .alerts import feed as alerts_feed, mark_all_read, unread_count
+from .categories import CategoryTreeError, breadcrumb, descendants, rollup, tree, validate_parent
+from .splits import SplitError, apply as apply_split, in_categories, line_columns, lines_for, parse_lines as parse_split_lines
+from .tags import condition as tag_condition, counts as tag_counts, parse_filter as parse_tag_filter, recurring_tag, set_tags, suggest as suggest_tags
 
 bp = Blueprint("bp", __name__)
 
+TYPE_LABELS = {"income": "Receita", "expense": "Despesa", TRANSFER: "Transferência"}
+
 def ensure_recurring_for_month(ym: str):
     """Gera lançamentos recorrentes (uma vez por mês)"""
-    items = RecurringTransaction.query.filter_by(is_active=True).all()
+    # decide o que gravar lendo do banco principal, nunca da réplica
+    with primary():
+        _generate_recurring(ym)
+
+def _generate_recurring(ym: str):
+    # ordem fixa: pedidos simultâneos travam as recorrências na mesma ordem (sem deadlock)
+    items = RecurringTransaction.query.filter_by(is_active=True).order_by(RecurringTransaction.id).all()
     if not items:
         return
     # datas do mês
     y, m = map(int, ym.split("-"))
     last_day = __import__("calendar").monthrange(y, m)[1]
+    created = []
     for r in items:
         if r.last_generated_month == ym:
             continue
         day = max(1, min(int(r.day_of_month or 1), last_day))
         d = date(y, m, day)
-        # evita duplicar: procura por mesmo recorrente no mês
+        # evita duplicar: procura por mesmo recorrente no mês (etiqueta rec:<id>)
+        tag = recurring_tag(r.id)
         exists = Transaction.query.filter_by(
             txn_type=r.txn_type,
             category_id=r.category_id,
             account_id=r.account_id,
             amount=r.amount,
             txn_date=d,
-        ).filter(Transaction.description.like(f"%[REC:{r.id}]%")).first()
+        ).filter(tag_condition(Transaction.id, parse_tag_filter(tag))).first()
         if exists:
             r.last_generated_month = ym
             continue
 
-        desc = (r.description or r.name or "").strip()
-        tag = f"[REC:{r.id}]"
-        if tag not in desc:
-            desc = (desc + " " + tag).strip()
-
-        db.session.add(Transaction(
+        t = Transaction(
             txn_type=r.txn_type,
             category_id=r.category_id,
             account_id=r.account_id,
             amount=float(r.amount),
-            description=desc,
+            description=(r.description or r.name or "").strip(),
             txn_date=d,
             receipt_filename=""
-        ))
+        )
+        db.session.add(t)
+        created.append((t, tag))
         r.last_generated_month = ym
+    if created:
+        db.session.flush()  # ids para as etiquetas
+        for t, tag in created:
+            set_tags(t, [tag])
     db.session.commit()
 
-def get_effective_budgets(ym: str):
-    """Retorna dict category_name -> planned_amount (template + overrides do mês)."""
-    planned = {}
-    # templates
-    templates = BudgetTemplate.query.all()
-    for t in templates:
-        planned[t.category.name] = float(t.planned_amount)
-    # overrides (se existir para o mês)
-    overrides = Budget.query.filter_by(month=ym).all()
-    for o in overrides:
-        planned[o.category.name] = float(o.planned_amount)
-    return planned
-
 
 # ---------------- AUTH ----------------
 @bp.route("/login", methods=["GET", "POST"])
@@ -83,6 +101,7 @@ def login():
         session["user_id"] = user.id
         session["username"] = user.username
         session["role"] = user.role
+        session["household_id"] = user.household_id
         flash(f"Bem-vindo, {user.name}!", "success")
         nxt = request.args.get("next") or url_for("bp.dashboard")
         return redirect(nxt)
@@ -92,7 +111,10 @@ def login():
 def logout():
     session.clear()
     flash("Você saiu do sistema.", "info")
-    return redirect(url_for("bp.login"))
+    resp = redirect(url_for("bp.login"))
+    # aparelho compartilhado: páginas em cache e IndexedDB do PWA não ficam para o próximo
+    resp.headers["Clear-Site-Data"] = '"cache", "storage"'
+    return resp
 
 @bp.route("/")
 def root():
@@ -100,47 +122,61 @@ def root():
         return redirect(url_for("bp.login"))
     return redirect(url_for("bp.dashboard"))
 
+@bp.route("/app")
+@login_required
+def app_shell():
+    """Tela inicial do PWA: sem dados do servidor, desenhada do IndexedDB (offline.js)."""
+    return render_template("app_offline.html")
+
+def _period_filter(ym):
+    """(period, meses) do filtro `period=` (YYYY-MM, YYYY-Qn ou YYYY); sem ele, só o mês."""
+    period = (request.args.get("period") or "").strip().upper()
+    if period:
+        try:
+            return period, period_months(period)
+        except ValueError as e:
+            flash(str(e), "warning")
+    return "", [ym]
+
 # ---------------- DASHBOARD ----------------
 @bp.route("/dashboard")
 @login_required
+@replica_reads
 def dashboard():
     ym = request.args.get("month") or month_now()
     ensure_recurring_for_month(ym)
-    start = month_first_day(ym)
-    end = next_month_first_day(ym)
-
-    txs = Transaction.query.filter(Transaction.txn_date >= start, Transaction.txn_date < end).all()
-    spent = sum(t.amount for t in txs if t.txn_type == "expense")
-    income = sum(t.amount for t in txs if t.txn_type == "income")
-
-    effective = get_effective_budgets(ym)
-    planned = sum(effective.values())
-    budgets = Budget.query.filter_by(month=ym).all()
-
-    spent_by_cat = {}
-    for t in txs:
-        if t.txn_type != "expense":
-            continue
-        spent_by_cat[t.category.name] = spent_by_cat.get(t.category.name, 0) + t.amount
-
-    budget_rows = []
-    for cat, plan in effective.items():
-        s = spent_by_cat.get(cat, 0.0)
-        budget_rows.append({"category": cat, "planned": plan, "spent": s, "remaining": plan - s})
-    budget_rows.sort(key=lambda r: r["remaining"])
-
-    recent = Transaction.query.order_by(Transaction.txn_date.desc(), Transaction.id.desc()).limit(10).all()
+    period, months = _period_filter(ym)
+
+    totals = period_totals(months[0], months[-1])
+    spent = totals["expense"]
+    income = totals["income"]
+
+    budget_rows = budget_vs_actual(months[0], months[-1])
+    # subcategoria com orçamento dentro de outra com orçamento: conta só o de cima
+    planned = sum(r["planned"] for r in budget_rows if not r["nested"])
+
+    recent = (
+        Transaction.query
+        .options(joinedload(Transaction.category), joinedload(Transaction.account), joinedload(Transaction.to_account))
+        .order_by(Transaction.txn_date.desc(), Transaction.id.desc())
+        .limit(10)
+        .all()
+    )
 
     return render_template(
         "dashboard.html",
         month=ym,
+        period=period,
         planned=planned,
         spent=spent,
         income=income,
         balance=income - spent,
         budget_balance=planned - spent,
         budget_rows=budget_rows,
-        recent=recent
+        recent=recent,
+        balances=balances_with_accounts(),
+        alerts_unread=unread_count(),
+        missing_rates=missing_rates(month_first_day(months[0]), next_month_first_day(months[-1])),
     )
 
 # ---------------- TRANSACTIONS ----------------
@@ -151,8 +187,21 @@ def transactions_list():
     ensure_recurring_for_month(ym)
     start = month_first_day(ym)
     end = next_month_first_day(ym)
-    txs = Transaction.query.filter(Transaction.txn_date >= start, Transaction.txn_date < end).order_by(Transaction.txn_date.desc(), Transaction.id.desc()).all()
-    return render_template("transactions_list.html", month=ym, txs=txs)
+    tag_filter = parse_tag_filter(request.args.get("tags"), request.args.get("tag_match"))
+    # a consulta só roda se o trecho da tabela não estiver em cache
+    txs = (
+        Transaction.query
+        .options(joinedload(Transaction.category), joinedload(Transaction.account), joinedload(Transaction.to_account),
+                 selectinload(Transaction.tags))
+        .filter(Transaction.txn_date >= start, Transaction.txn_date < end)
+        .order_by(Transaction.txn_date.desc(), Transaction.id.desc())
+    )
+    if tag_filter:
+        txs = txs.filter(tag_condition(Transaction.id, tag_filter))
+    return render_template(
+        "transactions_list.html", month=ym, txs=txs, version=transactions_fingerprint(start, end),
+        tag_filter=tag_filter, tag_options=tag_counts(), split_lines=lines_for,
+    )
 
 @bp.route("/transactions/new", methods=["GET", "POST"])
 @login_required
@@ -180,10 +229,10 @@ def transactions_delete(tid: int):
     return redirect(url_for("bp.transactions_list", month=ym))
 
 def _transaction_form(existing=None):
-    cats_income = Category.query.filter_by(kind="income", is_active=True).order_by(Category.name.asc()).all()
-    cats_expense = Category.query.filter_by(kind="expense", is_active=True).order_by(Category.name.asc()).all()
+    cats_income = tree("income")
+    cats_expense = tree("expense")
     accounts = Account.query.filter_by(is_active=True).order_by(Account.name.asc()).all()
-    return render_template("transactions_form.html", existing=existing, cats_income=cats_income, cats_expense=cats_expense, accounts=accounts)
+    return render_template("transactions_form.html", existing=existing, cats_income=cats_income, cats_expense=cats_expense, accounts=accounts, tag_options=tag_counts())
 
 def _save_transaction(existing=None):
     txn_type = request.form.get("txn_type", "expense")
@@ -193,7 +242,7 @@ def _save_transaction(existing=None):
     description = request.form.get("description", "").strip()
     txn_date_str = request.form.get("txn_date", "").strip()
 
-    if txn_type not in ("income", "expense"):
+    if txn_type not in TXN_TYPES:
         flash("Tipo inválido.", "danger")
         return redirect(request.path)
 
@@ -208,10 +257,33 @@ def _save_transaction(existing=None):
     except ValueError:
         d = date.today()
 
+    # rateio entre categorias (transferência não tem categoria de gasto)
+    try:
+        split_lines = [] if txn_type == TRANSFER else parse_split_lines(
+            request.form.getlist("split_category_id"), request.form.getlist("split_amount"),
+        )
+    except SplitError as e:
+        flash(str(e), "danger")
+        return redirect(request.path)
+    if split_lines and not category_id:
+        category_id = str(split_lines[0][0])
+
     if not category_id or not account_id:
         flash("Selecione categoria e conta.", "danger")
         return redirect(request.path)
 
+    # só aceita categoria/conta da própria casa (consultas já vêm filtradas)
+    if not db.session.get(Category, int(category_id)) or not db.session.get(Account, int(account_id)):
+        flash("Categoria ou conta inválida.", "danger")
+        return redirect(request.path)
+
+    to_account_id = None
+    if txn_type == TRANSFER:
+        to_account_id = request.form.get("to_account_id", type=int)
+        if not to_account_id or to_account_id == int(account_id) or not db.session.get(Account, to_account_id):
+            flash("Transferência: selecione uma conta de destino diferente da origem.", "danger")
+            return redirect(request.path)
+
     receipt_filename = existing.receipt_filename if existing else ""
     f = request.files.get("receipt")
     if f and f.filename:
@@ -224,22 +296,39 @@ def _save_transaction(existing=None):
         existing.txn_type = txn_type
         existing.category_id = int(category_id)
         existing.account_id = int(account_id)
+        existing.to_account_id = to_account_id
         existing.amount = amount_f
         existing.description = description
         existing.txn_date = d
         existing.receipt_filename = receipt_filename
+        try:
+            apply_split(existing, split_lines, amount_f)
+        except SplitError as e:
+            db.session.rollback()
+            flash(str(e), "danger")
+            return redirect(request.path)
+        set_tags(existing, request.form.get("tags"))
         flash("Lançamento atualizado.", "success")
     else:
         t = Transaction(
             txn_type=txn_type,
             category_id=int(category_id),
             account_id=int(account_id),
+            to_account_id=to_account_id,
             amount=amount_f,
             description=description,
             txn_date=d,
             receipt_filename=receipt_filename
         )
+        try:
+            apply_split(t, split_lines, amount_f)
+        except SplitError as e:
+            flash(str(e), "danger")
+            return redirect(request.path)
         db.session.add(t)
+        if request.form.get("tags", "").strip():
+            db.session.flush()  # id para as etiquetas
+            set_tags(t, request.form.get("tags"))
         flash("Lançamento salvo.", "success")
 
     db.session.commit()
@@ -260,6 +349,11 @@ def budgets():
         if not category_id:
             flash("Selecione a categoria.", "danger")
             return redirect(url_for("bp.budgets", month=month))
+        # só categoria de despesa da própria casa (a consulta já vem filtrada)
+        category = db.session.get(Category, int(category_id)) if category_id.isdigit() else None
+        if category is None or category.kind != "expense":
+            flash("Categoria inválida.", "danger")
+            return redirect(url_for("bp.budgets", month=month))
         try:
             planned = float(amount)
         except ValueError:
@@ -285,23 +379,129 @@ def budgets():
 
         return redirect(url_for("bp.budgets", month=month))
 
-    # mostrar template + overrides do mês
-    templates = BudgetTemplate.query.all()
-    overrides = {b.category_id: b for b in Budget.query.filter_by(month=ym).all()}
-    rows = []
-    for t in sorted(templates, key=lambda x: x.category.name):
-        ov = overrides.get(t.category_id)
-        rows.append({
-            "category_id": t.category_id,
-            "category": t.category.name,
-            "template_amount": float(t.planned_amount),
-            "month_amount": float(ov.planned_amount) if ov else None,
-            "effective_amount": float(ov.planned_amount) if ov else float(t.planned_amount),
-            "has_override": bool(ov),
-        })
+    # mostrar template + overrides do mês (ou o acumulado do período)
+    period, months = _period_filter(ym)
+    rows = sorted(budget_vs_actual(months[0], months[-1]), key=lambda r: r["category"])
 
-    cats_expense = Category.query.filter_by(kind="expense", is_active=True).order_by(Category.name.asc()).all()
-    return render_template("budgets.html", month=ym, rows=rows, cats_expense=cats_expense)
+    return render_template(
+        "budgets.html", month=ym, period=period, rows=rows, cats_expense=tree("expense"),
+        missing_rates=missing_rates(month_first_day(months[0]), next_month_first_day(months[-1])),
+    )
+
+@bp.route("/budgets/clone", methods=["POST"])
+@login_required
+def budgets_clone():
+    source = request.form.get("source", "").strip()
+    start = request.form.get("start", "").strip()
+    end = request.form.get("end", "").strip() or None
+    try:
+        n = clone_month(
+            source, start, end,
+            scale=(request.form.get("scale") or "1").replace(",", "."),
+            effective=request.form.get("effective") == "1",
+        )
+        db.session.commit()
+    except BulkBudgetError as e:
+        db.session.rollback()
+        flash(str(e), "danger")
+        return redirect(url_for("bp.budgets", month=source or month_now()))
+    flash(f"Orçamento copiado: {n} exceções gravadas.", "success")
+    return redirect(url_for("bp.budgets", month=start))
+
+@bp.route("/api/budgets/bulk", methods=["POST"])
+@login_required
+def api_budgets_bulk():
+    """Grava uma matriz categoria x mês em uma única transação."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        n = upsert_cells(parse_cells(payload))
+        db.session.commit()
+    except BulkBudgetError as e:
+        db.session.rollback()
+        return {"ok": False, "errors": e.errors}, 400
+    return {"ok": True, "upserted": n}
+
+@bp.route("/api/budgets/clone", methods=["POST"])
+@login_required
+def api_budgets_clone():
+    """Copia (e opcionalmente escala) as exceções de um mês para um intervalo."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        n = clone_month(
+            payload.get("source"), payload.get("start"), payload.get("end"),
+            scale=payload.get("scale", 1.0),
+            effective=bool(payload.get("effective")),
+        )
+        db.session.commit()
+    except BulkBudgetError as e:
+        db.session.rollback()
+        return {"ok": False, "errors": e.errors}, 400
+    return {"ok": True, "upserted": n}
+
+# ---------------- ALERTAS DE ORÇAMENTO ----------------
+@bp.route("/alerts")
+@login_required
+def alerts():
+    return render_template("alerts.html", alerts=alerts_feed(), unread=unread_count())
+
+@bp.route("/alerts/read", methods=["POST"])
+@login_required
+def alerts_read():
+    n = mark_all_read()
+    db.session.commit()
+    flash(f"{n} alerta(s) marcado(s) como lido(s).", "success")
+    return redirect(url_for("bp.alerts"))
+
+@bp.route("/api/alerts")
+@login_required
+def api_alerts():
+    """Feed de alertas para o PWA (mais recentes primeiro)."""
+    limit = max(1, min(request.args.get("limit", 50, type=int), 500))
+    return {
+        "unread": unread_count(),
+        "alerts": [
+            {
+                "id": a.id, "month": a.month, "category_id": a.category_id, "category": a.category.name,
+                "threshold": a.threshold, "spent": round(a.spent, 2), "planned": round(a.planned, 2),
+                "created_at": a.created_at.isoformat(), "read": a.read_at is not None,
+            }
+            for a in alerts_feed(limit)
+        ],
+    }
+
+@bp.route("/api/tags")
+@login_required
+def api_tags():
+    """Autocompletar de etiquetas: nome e número de lançamentos (contagem em cache)."""
+    limit = max(1, min(request.args.get("limit", 20, type=int), 200))
+    return {"tags": [{"name": n, "count": c} for n, c in suggest_tags(request.args.get("q", ""), limit)]}
+
+# ---------------- SYNC (PWA offline) ----------------
+@bp.route("/api/sync/delta")
+@login_required
+def api_sync_delta():
+    """Lançamentos alterados/apagados desde o cursor (ver sync.py)."""
+    try:
+        return delta(request.args.get("since", ""))
+    except SyncError as e:
+        return {"ok": False, "errors": e.errors}, 400
+
+@bp.route("/api/sync/transactions", methods=["POST"])
+@login_required
+def api_sync_transactions():
+    """Recebe em lote os lançamentos feitos offline (resultado por item)."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        results = apply_batch(payload.get("items"))
+        db.session.commit()
+    except SyncError as e:
+        db.session.rollback()
+        return {"ok": False, "errors": e.errors}, 400
+    return {
+        "ok": True,
+        "results": results,
+        "ids": {r["client_id"]: r["id"] for r in results if "id" in r},
+    }
 
 # ---------------- RECEIPTS ----------------
 @bp.route("/receipts")
@@ -313,6 +513,9 @@ def receipts():
 @bp.route("/uploads/<path:filename>")
 @login_required
 def uploads(filename):
+    # só comprovantes de lançamentos da própria casa
+    if not Transaction.query.filter_by(receipt_filename=filename).first():
+        abort(404)
     return send_from_directory(current_upload_dir(), filename, as_attachment=False)
 
 def current_upload_dir():
@@ -320,8 +523,26 @@ def current_upload_dir():
     return current_app.config["UPLOAD_FOLDER"]
 
 # ---------------- REPORTS ----------------
+def _account_filter(account_id):
+    """Id da conta do filtro ("all" ou inválido = None)."""
+    try:
+        return int(account_id) if account_id and account_id != "all" else None
+    except ValueError:
+        return None
+
+def _archived_for_report(start, end, txn_type, account_id, cat_ids, tag_filter=None):
+    """Lançamentos de anos arquivados em arquivo (ver partitioning.py)."""
+    return archived_transactions(
+        start, end,
+        txn_type=txn_type if txn_type in TXN_TYPES else None,
+        account_id=_account_filter(account_id),
+        category_ids=cat_ids,
+        tag_filter=tag_filter,
+    )
+
 @bp.route("/reports")
 @login_required
+@replica_reads
 def reports():
     # Filtros
     ym = request.args.get("month") or month_now()
@@ -330,6 +551,7 @@ def reports():
     txn_type = (request.args.get("txn_type") or "all").strip()
     account_id = (request.args.get("account_id") or "all").strip()
     category_ids = request.args.getlist("category_id")
+    tag_filter = parse_tag_filter(request.args.get("tags"), request.args.get("tag_match"))
 
     # Range de datas (end exclusivo)
     start = month_first_day(ym)
@@ -345,16 +567,16 @@ def reports():
     except Exception:
         flash("Datas inválidas no filtro (use YYYY-MM-DD).", "warning")
 
-    q = Transaction.query.filter(Transaction.txn_date >= start, Transaction.txn_date < end)
+    conditions = [Transaction.txn_date >= start, Transaction.txn_date < end]
 
-    if txn_type in ("income", "expense"):
-        q = q.filter(Transaction.txn_type == txn_type)
+    if txn_type in TXN_TYPES:
+        conditions.append(Transaction.txn_type == txn_type)
+    else:
+        # transferência entre contas não é receita nem despesa
+        conditions.append(Transaction.txn_type != TRANSFER)
 
-    if account_id and account_id != "all":
-        try:
-            q = q.filter(Transaction.account_id == int(account_id))
-        except Exception:
-            pass
+    if _account_filter(account_id):
+        conditions.append(Transaction.account_id == _account_filter(account_id))
 
     cat_ids_int = []
     for cid in category_ids:
@@ -362,35 +584,54 @@ def reports():
             cat_ids_int.append(int(cid))
         except Exception:
             pass
-    if cat_ids_int:
-        q = q.filter(Transaction.category_id.in_(cat_ids_int))
-
-    txs = q.all()
-
-    by_cat = {}
-    by_acc = {}
-    total_income = 0.0
-    total_expense = 0.0
-
-    for t in txs:
-        if t.txn_type == "expense":
-            total_expense += float(t.amount)
-        else:
-            total_income += float(t.amount)
-
-        key_c = f"{t.txn_type}:{t.category.name}"
-        by_cat[key_c] = by_cat.get(key_c, 0) + float(t.amount)
-
-        key_a = f"{t.txn_type}:{t.account.name}"
-        by_acc[key_a] = by_acc.get(key_a, 0) + float(t.amount)
-
+    # categoria escolhida inclui as subcategorias
+    cat_filter = descendants(cat_ids_int)
+    if tag_filter:
+        conditions.append(tag_condition(Transaction.id, tag_filter))
+    try:
+        drill = int(request.args.get("drill") or 0) or None
+    except ValueError:
+        drill = None
+
+    def summarize():
+        # por tipo e conta, na moeda dos relatórios, somado no banco; dividido com
+        # filtro de categoria entra só com as linhas das categorias filtradas
+        category, line_amount, with_lines = line_columns()
+        amount, with_rates = converted(line_amount, Transaction.currency, Transaction.txn_date, start, end)
+        stmt = with_rates(with_lines(
+            select(Transaction.txn_type, Account.name, func.sum(amount))
+            .select_from(Transaction).join(Account, Account.id == Transaction.account_id)
+        )).where(*conditions).group_by(Transaction.txn_type, Account.name)
+        if cat_filter:
+            stmt = stmt.where(category.in_(cat_filter))
+        by_acc = {(ttype, name): float(total) for ttype, name, total in db.session.execute(stmt) if total is not None}
+
+        # anos arquivados vêm de arquivo (arquivados antigos não têm moeda: BRL)
+        for t in _archived_for_report(start, end, txn_type, account_id, cat_filter, tag_filter):
+            amount = convert(t.amount, getattr(t, "currency", None), t.txn_date)
+            if amount is None:
+                continue  # sem cotação: fora dos totais (aviso na tela)
+            key_a = (t.txn_type, t.account.name)
+            by_acc[key_a] = by_acc.get(key_a, 0) + amount
+
+        total_income = sum(v for (ttype, _), v in by_acc.items() if ttype == "income")
+        total_expense = sum(v for (ttype, _), v in by_acc.items() if ttype == "expense")
+
+        # ordenar
+        acc_rows = sorted([(k[0], k[1], v) for k, v in by_acc.items()], key=lambda x: (x[0], -x[2]))
+        # por categoria: um nível da árvore, somando as subcategorias (JOIN na closure)
+        cat_rows = rollup(start, end, txn_type, _account_filter(account_id), cat_filter, drill, tag_filter)
+        return total_income, total_expense, cat_rows, acc_rows
+
+    # pedidos iguais ao mesmo tempo (ex.: duas pessoas da casa) consultam uma vez só
+    flight_key = (
+        "reports", current_household_id(), start, end, txn_type, account_id,
+        tuple(sorted(cat_ids_int)), drill, tag_filter, report_currency(), data_version(),
+    )
+    total_income, total_expense, cat_rows, acc_rows = singleflight.do(flight_key, summarize)
     net = total_income - total_expense
 
-    # ordenar
-    cat_rows = sorted([(k.split(":", 1)[0], k.split(":", 1)[1], v) for k, v in by_cat.items()], key=lambda x: (x[0], -x[2]))
-    acc_rows = sorted([(k.split(":", 1)[0], k.split(":", 1)[1], v) for k, v in by_acc.items()], key=lambda x: (x[0], -x[2]))
-
-    categories = Category.query.filter_by(is_active=True).order_by(Category.kind.asc(), Category.name.asc()).all()
+    categories = tree()
     accounts = Account.query.order_by(Account.name.asc()).all()
 
     export_params = {
@@ -400,17 +641,20 @@ def reports():
         "txn_type": txn_type if txn_type != "all" else None,
         "account_id": account_id if account_id != "all" else None,
         "category_id": cat_ids_int or None,
+        "tags": ",".join(tag_filter.names) if tag_filter else None,
+        "tag_match": tag_filter.match if tag_filter and len(tag_filter.names) > 1 else None,
     }
 
     # remove None (url_for não precisa)
     export_params = {k: v for k, v in export_params.items() if v not in (None, "", [])}
 
     # DRE: separar receitas e despesas com base no balancete por categoria
-    dre_income_rows = [row for row in cat_rows if row[0] == "Receita"]
-    dre_expense_rows = [row for row in cat_rows if row[0] == "Despesa"]
+    dre_income_rows = [row for row in cat_rows if row["txn_type"] == "income"]
+    dre_expense_rows = [row for row in cat_rows if row["txn_type"] == "expense"]
 
     return render_template(
         "reports.html",
+        missing_rates=missing_rates(start, end),
         month=ym,
         date_from=date_from,
         date_to=date_to,
@@ -418,6 +662,8 @@ def reports():
         account_id=account_id,
         category_ids=cat_ids_int,
         categories=categories,
+        tag_filter=tag_filter,
+        tag_options=tag_counts(),
         accounts=accounts,
         label=label,
         total_income=total_income,
@@ -427,37 +673,61 @@ def reports():
         dre_income_rows=dre_income_rows,
         dre_expense_rows=dre_expense_rows,
         acc_rows=acc_rows,
+        drill=drill,
+        drill_path=breadcrumb(drill),
         export_params=export_params,
+        parquet=columnar.available(),
     )
 
 
-@bp.route("/reports/export/<fmt>")
-@login_required
-def reports_export(fmt: str):
+def _export_filters():
+    """(mês, início, fim, rótulo, tipo, conta, categorias, etiquetas, datas_ok) dos exports, da query string.
+
+    Com datas inválidas o período fica sendo o mês e datas_ok é False.
+    """
     ym = request.args.get("month") or month_now()
     date_from = (request.args.get("date_from") or "").strip()
     date_to = (request.args.get("date_to") or "").strip()
     txn_type = (request.args.get("txn_type") or "all").strip()
     account_id = (request.args.get("account_id") or "all").strip()
-    category_ids = request.args.getlist("category_id")
+
+    cat_ids_int = []
+    for cid in request.args.getlist("category_id"):
+        try:
+            cat_ids_int.append(int(cid))
+        except Exception:
+            pass
 
     start = month_first_day(ym)
     end = next_month_first_day(ym)
     label = f"{ym}"
-    try:
-        if date_from or date_to:
-            if date_from:
-                start = date.fromisoformat(date_from)
-            if date_to:
-                end = date.fromisoformat(date_to) + timedelta(days=1)
+    dates_ok = True
+    if date_from or date_to:
+        try:
+            s = date.fromisoformat(date_from) if date_from else start
+            e = date.fromisoformat(date_to) + timedelta(days=1) if date_to else end
+            start, end = s, e
             label = f"{start.isoformat()}_a_{(end - timedelta(days=1)).isoformat()}"
-    except Exception:
+        except ValueError:
+            dates_ok = False
+    tag_filter = parse_tag_filter(request.args.get("tags"), request.args.get("tag_match"))
+    return ym, start, end, label, txn_type, account_id, cat_ids_int, tag_filter, dates_ok
+
+@bp.route("/reports/export/<fmt>")
+@login_required
+@replica_reads
+def reports_export(fmt: str):
+    ym, start, end, label, txn_type, account_id, cat_ids_int, tag_filter, dates_ok = _export_filters()
+    if not dates_ok:
         flash("Datas inválidas no filtro (use YYYY-MM-DD).", "warning")
 
     q = Transaction.query.filter(Transaction.txn_date >= start, Transaction.txn_date < end)
 
-    if txn_type in ("income", "expense"):
+    if txn_type in TXN_TYPES:
         q = q.filter(Transaction.txn_type == txn_type)
+    else:
+        # transferência entre contas não é receita nem despesa
+        q = q.filter(Transaction.txn_type != TRANSFER)
 
     if account_id and account_id != "all":
         try:
@@ -465,96 +735,211 @@ def reports_export(fmt: str):
         except Exception:
             pass
 
-    cat_ids_int = []
-    for cid in category_ids:
-        try:
-            cat_ids_int.append(int(cid))
-        except Exception:
-            pass
-    if cat_ids_int:
-        q = q.filter(Transaction.category_id.in_(cat_ids_int))
-
-    txs = q.order_by(Transaction.txn_date.asc()).all()
+    cat_filter = descendants(cat_ids_int)
+    if cat_filter:
+        q = q.filter(in_categories(cat_filter))
+    if tag_filter:
+        q = q.filter(tag_condition(Transaction.id, tag_filter))
+
+    if fmt not in ("csv", "xlsx", "pdf", "parquet"):
+        flash("Formato inválido.", "danger")
+        return redirect(url_for("bp.reports", month=ym))
+    if fmt == "parquet" and not columnar.available():
+        flash("Formato parquet requer o pacote pyarrow.", "warning")
+        return redirect(url_for("bp.reports", month=ym))
+
+    def write(out):
+        if fmt == "parquet":
+            acc = _account_filter(account_id)
+            columnar.write_parquet(out, columnar.record_batches(start, end, txn_type, acc, cat_filter, tag_filter=tag_filter))
+            return
+
+        txs = q.order_by(Transaction.txn_date.asc()).all()
+        # dividido: uma linha por categoria (só as do filtro, se houver)
+        split = lines_for(txs)
+        entries = []
+        for t in txs:
+            if t.id in split:
+                entries.extend((t, line.category, line.amount) for line in split[t.id]
+                               if not cat_filter or line.category_id in cat_filter)
+            else:
+                entries.append((t, t.category, t.amount))
+        archived = _archived_for_report(start, end, txn_type, account_id, cat_filter, tag_filter)
+        if archived:
+            entries = sorted([(t, t.category, t.amount) for t in archived] + entries, key=lambda e: e[0].txn_date)
+
+        currency = report_currency()
+        headers = ["Data", "Tipo", "Categoria", "Conta", "Descrição", "Valor", "Comprovante"]
+        rows = []
+        total_income = 0.0
+        total_expense = 0.0
+
+        for t, category, line_amount in entries:
+            # sem cotação: a linha sai com o valor em branco e fora dos totais
+            amount = convert(line_amount, getattr(t, "currency", None), t.txn_date)
+            if amount is None:
+                pass
+            elif t.txn_type == "expense":
+                total_expense += amount
+            elif t.txn_type == "income":
+                total_income += amount
+
+            rows.append([
+                t.txn_date,
+                t.txn_type,
+                category.name if category else "",
+                t.account.name if t.account else "",
+                t.description,
+                amount,
+                t.receipt_filename,
+            ])
 
-    headers = ["Data", "Tipo", "Categoria", "Conta", "Descrição", "Valor", "Comprovante"]
-    rows = []
-    total_income = 0.0
-    total_expense = 0.0
+        net = total_income - total_expense
 
-    for t in txs:
-        if t.txn_type == "expense":
-            total_expense += float(t.amount)
+        if fmt == "csv":
+            export_csv(out, rows, headers)
+        elif fmt == "xlsx":
+            export_xlsx_professional(out, rows, headers, title="Lançamentos", currency=currency, meta={
+                "Período": f"{start.isoformat()} a {(end - timedelta(days=1)).isoformat()}",
+                "Filtro tipo": {"income": "Receitas", "expense": "Despesas", TRANSFER: "Transferências"}.get(txn_type, "Todos"),
+                "Total receitas": format_currency(total_income, currency),
+                "Total despesas": format_currency(total_expense, currency),
+                "Saldo": format_currency(net, currency),
+            })
         else:
-            total_income += float(t.amount)
-
-        rows.append([
-            t.txn_date,
-            t.txn_type,
-            t.category.name if t.category else "",
-            t.account.name if t.account else "",
-            t.description,
-            float(t.amount),
-            t.receipt_filename,
-        ])
-
-    net = total_income - total_expense
+            pdf_rows = []
+            for r in rows:
+                pdf_rows.append([
+                    r[0].strftime("%Y-%m-%d"),
+                    TYPE_LABELS.get(r[1], r[1]),
+                    r[2],
+                    r[3],
+                    (r[4] or "")[:40],
+                    format_currency(r[5], currency) if r[5] is not None else "sem cotação",
+                    ("Sim" if r[6] else "Não"),
+                ])
+            export_pdf_professional(
+                out,
+                "Relatório de Lançamentos",
+                headers=["Data", "Tipo", "Categoria", "Conta", "Descrição", "Valor", "Comp."],
+                rows=pdf_rows,
+                meta={
+                    "Período": f"{start.isoformat()} a {(end - timedelta(days=1)).isoformat()}",
+                    "Total receitas": format_currency(total_income, currency),
+                    "Total despesas": format_currency(total_expense, currency),
+                    "Saldo": format_currency(net, currency),
+                },
+            )
 
     from flask import current_app
     export_dir = Path(current_app.config["EXPORT_FOLDER"])
     export_dir.mkdir(parents=True, exist_ok=True)
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-    # Nome amigável com filtros
-    base_name = f"lancamentos_{label}_{ts}"
+    # Nome amigável com filtros (normalizado para url); o sufixo vem da chave
+    base_name = re.sub(r"[^A-Za-z0-9_\-]", "_", f"lancamentos_{label}")
 
-    # Normaliza para url
-    base_name = re.sub(r"[^A-Za-z0-9_\-]", "_", base_name)
+    # Pedidos iguais (clique duplo, duas pessoas, outro worker) geram um arquivo só.
+    # A versão dos dados entre workers é a impressão digital dos lançamentos do período.
+    flight_key = (
+        "reports_export", fmt, current_household_id(), start, end, txn_type, account_id,
+        tuple(sorted(cat_ids_int)), tag_filter, report_currency(), transactions_fingerprint(start, end),
+        reference_fingerprint(), data_version(),
+    )
+    out = singleflight.shared_file(export_dir, base_name, fmt, flight_key, write)
+    return send_from_directory(str(export_dir), out.name, as_attachment=True)
 
-    if fmt == "csv":
-        out = export_dir / f"{base_name}.csv"
-        export_csv(out, headers, rows)
-        return send_from_directory(str(export_dir), out.name, as_attachment=True)
+@bp.route("/api/export/transactions.arrow")
+@login_required
+@replica_reads
+def api_export_arrow():
+    """Lançamentos em Arrow IPC (streaming), com os filtros de /reports/export (ver columnar.py)."""
+    if not columnar.available():
+        return {"ok": False, "errors": ["Exportação Arrow requer o pacote pyarrow."]}, 501
+    ym, start, end, label, txn_type, account_id, cat_ids_int, tag_filter, dates_ok = _export_filters()
+    if not dates_ok:
+        return {"ok": False, "errors": ["Datas inválidas no filtro (use YYYY-MM-DD)."]}, 400
+    batches = columnar.record_batches(
+        start, end, txn_type, _account_filter(account_id), descendants(cat_ids_int), tag_filter=tag_filter,
+    )
+    return Response(
+        stream_with_context(columnar.ipc_stream(batches)),
+        mimetype=columnar.MIME_ARROW,
+        headers={"Content-Disposition": f'attachment; filename="lancamentos_{label}.arrow"'},
+    )
 
-    if fmt == "xlsx":
-        out = export_dir / f"{base_name}.xlsx"
-        export_xlsx_professional(out, rows, headers, title="Lançamentos", meta={
-            "Período": f"{start.isoformat()} a {(end - timedelta(days=1)).isoformat()}",
-            "Filtro tipo": ("Todos" if txn_type == "all" else ("Receitas" if txn_type == "income" else "Despesas")),
-            "Total receitas": f"${total_income:,.2f}",
-            "Total despesas": f"${total_expense:,.2f}",
-            "Saldo": f"${net:,.2f}",
-        })
-        return send_from_directory(str(export_dir), out.name, as_attachment=True)
 
-    if fmt == "pdf":
-        out = export_dir / f"{base_name}.pdf"
-        pdf_rows = []
-        for r in rows:
-            pdf_rows.append([
-                r[0].strftime("%Y-%m-%d"),
-                "Receita" if r[1] == "income" else "Despesa",
-                r[2],
-                r[3],
-                (r[4] or "")[:40],
-                f"${r[5]:,.2f}",
-                ("Sim" if r[6] else "Não"),
-            ])
-        export_pdf_professional(
-            out,
-            "Relatório de Lançamentos",
-            headers=["Data", "Tipo", "Categoria", "Conta", "Descrição", "Valor", "Comp."],
-            rows=pdf_rows,
-            meta={
-                "Período": f"{start.isoformat()} a {(end - timedelta(days=1)).isoformat()}",
-                "Total receitas": f"${total_income:,.2f}",
-                "Total despesas": f"${total_expense:,.2f}",
-                "Saldo": f"${net:,.2f}",
-            },
+def _pivot_filters():
+    """(início, fim, tipo, conta) da tabela categoria x mês, a partir da query string."""
+    end_ym = request.args.get("end") or ""
+    if not PIVOT_MONTH_RE.fullmatch(end_ym):
+        end_ym = month_now()  # a janela padrão é calculada a partir dele
+    start_ym = request.args.get("start") or last_months(end_ym, 12)
+    txn_type = (request.args.get("txn_type") or "expense").strip()
+    try:
+        account_id = int(request.args.get("account_id") or 0) or None
+    except ValueError:
+        account_id = None
+    if start_ym > end_ym:
+        start_ym, end_ym = end_ym, start_ym
+    return start_ym, end_ym, txn_type, account_id
+
+@bp.route("/reports/pivot")
+@login_required
+@replica_reads
+def reports_pivot():
+    start_ym, end_ym, txn_type, account_id = _pivot_filters()
+    try:
+        pivot = build_pivot(start_ym, end_ym, txn_type, account_id)
+    except ValueError:
+        flash("Meses inválidos no filtro (use YYYY-MM, até 10 anos).", "warning")
+        return redirect(url_for("bp.reports_pivot"))
+    export_params = {"start": start_ym, "end": end_ym, "txn_type": txn_type}
+    if account_id:
+        export_params["account_id"] = account_id
+    return render_template(
+        "reports_pivot.html",
+        pivot=pivot,
+        start=start_ym,
+        end=end_ym,
+        txn_type=txn_type,
+        account_id=account_id,
+        accounts=Account.query.order_by(Account.name.asc()).all(),
+        export_params=export_params,
+    )
+
+@bp.route("/reports/pivot/export/<fmt>")
+@login_required
+@replica_reads
+def reports_pivot_export(fmt: str):
+    start_ym, end_ym, txn_type, account_id = _pivot_filters()
+    try:
+        pivot = build_pivot(start_ym, end_ym, txn_type, account_id)
+    except ValueError:
+        return {"ok": False, "errors": ["Meses inválidos (use YYYY-MM, até 10 anos)."]}, 400
+
+    if fmt == "json":
+        return pivot.to_dict()
+
+    if fmt == "xlsx":
+        from flask import current_app
+        export_dir = Path(current_app.config["EXPORT_FOLDER"])
+        export_dir.mkdir(parents=True, exist_ok=True)
+        base_name = re.sub(r"[^A-Za-z0-9_\-]", "_", f"categorias_x_meses_{start_ym}_a_{end_ym}")
+        flight_key = (
+            "reports_pivot_export", fmt, current_household_id(), start_ym, end_ym, txn_type, account_id,
+            report_currency(), transactions_fingerprint(month_first_day(start_ym), next_month_first_day(end_ym)),
+            reference_fingerprint(), data_version(),
         )
+        out = singleflight.shared_file(export_dir, base_name, fmt, flight_key, lambda path: export_pivot_xlsx(
+            path, pivot, currency=report_currency(), meta={
+                "Período": f"{start_ym} a {end_ym}",
+                "Filtro tipo": {"income": "Receitas", "expense": "Despesas"}.get(txn_type, "Receitas - despesas"),
+            },
+        ))
         return send_from_directory(str(export_dir), out.name, as_attachment=True)
 
     flash("Formato inválido.", "danger")
-    return redirect(url_for("bp.reports", month=ym))
+    return redirect(url_for("bp.reports_pivot"))
 
 
 
@@ -563,75 +948,55 @@ def reports_export(fmt: str):
 @admin_required
 def import_csv():
     preview = []
+    statement = None
     if request.method == "POST":
         f = request.files.get("file")
         if not f or not f.filename:
-            flash("Selecione um arquivo CSV.", "danger")
+            flash("Selecione um arquivo de extrato.", "danger")
             return redirect(url_for("bp.import_csv"))
-        rows = parse_bank_csv(f.stream)
-        preview = rows[:20]
-        # modo "importar"
-        if request.form.get("do_import") == "1":
-            account_name = request.form.get("account_name","Conta Corrente").strip() or "Conta Corrente"
-            account = Account.query.filter_by(name=account_name).first()
-            if not account:
-                account = Account(name=account_name, kind="checking", is_active=True)
-                db.session.add(account)
+        # categoria fallback
+        fallback_cat = (Category.query.filter_by(name="Contas", kind="expense").first()
+                        or Category.query.filter_by(kind="expense", is_active=True).first())
+        if not fallback_cat:
+            flash("Cadastre uma categoria de despesa antes de importar.", "danger")
+            return redirect(url_for("bp.settings"))
+        try:
+            statement = read_statement(f.stream, f.filename)
+            # modo "importar"
+            if request.form.get("do_import") == "1":
+                account_name = request.form.get("account_name","Conta Corrente").strip() or "Conta Corrente"
+                account = Account.query.filter_by(name=account_name).first()
+                if not account:
+                    account = Account(name=account_name, kind="checking", is_active=True)
+                    db.session.add(account)
+                    db.session.commit()
+
+                imported = import_rows(statement, account, fallback_cat)
                 db.session.commit()
+                msg = f"Importação concluída: {imported} registros."
+                if statement.skipped:
+                    msg += f" {statement.skipped} linha(s) ignorada(s) por data ou valor inválido."
+                flash(msg, "success")
+                return redirect(url_for("bp.transactions_list", month=month_now()))
+            preview = list(islice(statement, 20))
+        except ImportFormatError as e:
+            db.session.rollback()
+            flash(str(e), "danger")
+            return redirect(url_for("bp.import_csv"))
 
-            # categoria fallback
-            fallback_cat = Category.query.filter_by(name="Contas").first() or Category.query.filter_by(kind="expense").first()
-
-            imported = 0
-            for r in rows:
-                d = coerce_date(r.get("date") or r.get("Date") or r.get("DATA"))
-                desc = (r.get("description") or r.get("Description") or r.get("HISTORICO") or "").strip()
-                amt = coerce_float(r.get("amount") or r.get("Amount") or r.get("VALOR"))
-                typ = (r.get("type") or r.get("Type") or "").strip().lower()
-
-                # se valor negativo, é despesa
-                txn_type = "expense"
-                if typ in ("income","receita"):
-                    txn_type = "income"
-                elif typ in ("expense","despesa"):
-                    txn_type = "expense"
-                else:
-                    txn_type = "income" if amt > 0 else "expense"
-                amt_abs = abs(amt)
-
-                # categoria opcional
-                cat_name = (r.get("category") or r.get("Category") or "").strip()
-                cat = Category.query.filter_by(name=cat_name).first() if cat_name else None
-                if not cat:
-                    cat = fallback_cat
-
-                db.session.add(Transaction(
-                    txn_type=txn_type,
-                    category_id=cat.id,
-                    account_id=account.id,
-                    amount=amt_abs,
-                    description=desc,
-                    txn_date=d,
-                    receipt_filename=""
-                ))
-                imported += 1
-            db.session.commit()
-            flash(f"Importação concluída: {imported} registros.", "success")
-            return redirect(url_for("bp.transactions_list", month=month_now()))
-
-    return render_template("import.html", preview=preview)
+    return render_template("import.html", preview=preview, statement=statement)
 
 # ---------------- SETTINGS ----------------
 @bp.route("/settings")
 @admin_required
 def settings():
-    cats = Category.query.order_by(Category.kind.asc(), Category.name.asc()).all()
+    cats = tree(active_only=False)
     accs = Account.query.order_by(Account.name.asc()).all()
     users = User.query.order_by(User.role.desc(), User.username.asc()).all()
     recurring = RecurringTransaction.query.order_by(RecurringTransaction.id.desc()).all()
     cats_expense = Category.query.filter_by(kind="expense", is_active=True).order_by(Category.name.asc()).all()
     cats_income = Category.query.filter_by(kind="income", is_active=True).order_by(Category.name.asc()).all()
-    return render_template("settings.html", cats=cats, accs=accs, users=users, recurring=recurring, cats_expense=cats_expense, cats_income=cats_income)
+    return render_template("settings.html", cats=cats, accs=accs, users=users, recurring=recurring, cats_expense=cats_expense, cats_income=cats_income, currencies=CURRENCIES, report_currency=report_currency())
 
 @bp.route("/settings/category", methods=["POST"])
 @admin_required
@@ -644,23 +1009,46 @@ def add_category():
     if Category.query.filter_by(name=name).first():
         flash("Categoria já existe.", "warning")
         return redirect(url_for("bp.settings"))
-    db.session.add(Category(name=name, kind=kind, is_active=True))
+    category = Category(name=name, kind=kind, is_active=True)
+    try:
+        parent = validate_parent(category, request.form.get("parent_id"))
+    except CategoryTreeError as e:
+        flash(str(e), "danger")
+        return redirect(url_for("bp.settings"))
+    category.parent_id = parent.id if parent else None
+    db.session.add(category)
     db.session.commit()
     flash("Categoria adicionada.", "success")
     return redirect(url_for("bp.settings"))
 
+@bp.route("/settings/category/<int:cid>/parent", methods=["POST"])
+@admin_required
+def move_category(cid: int):
+    """Muda a categoria (com as subcategorias) de lugar na árvore."""
+    category = Category.query.get_or_404(cid)
+    try:
+        parent = validate_parent(category, request.form.get("parent_id"))
+    except CategoryTreeError as e:
+        flash(str(e), "danger")
+        return redirect(url_for("bp.settings"))
+    category.parent_id = parent.id if parent else None
+    db.session.commit()
+    flash(f"Categoria {category.name} movida.", "success")
+    return redirect(url_for("bp.settings"))
+
 @bp.route("/settings/account", methods=["POST"])
 @admin_required
 def add_account():
     name = request.form.get("name","").strip()
     kind = request.form.get("kind","checking").strip()
-    if not name:
+    currency = request.form.get("currency", "").strip().upper() or report_currency()
+    if not name or currency not in CURRENCIES:
         flash("Conta inválida.", "danger")
         return redirect(url_for("bp.settings"))
     if Account.query.filter_by(name=name).first():
         flash("Conta já existe.", "warning")
         return redirect(url_for("bp.settings"))
-    db.session.add(Account(name=name, kind=kind, is_active=True))
+    db.session.add(Account(name=name, kind=kind, currency=currency, is_active=True))
     db.session.commit()
     flash("Conta adicionada.", "success")
     return redirect(url_for("bp.settings"))
@@ -691,7 +1079,8 @@ def add_user():
         return redirect(url_for("bp.settings"))
     if role not in ("admin","user"):
         role = "user"
-    if User.query.filter_by(username=username).first():
+    # username é único no sistema inteiro (login não sabe a casa)
+    if User.query.filter_by(username=username).execution_options(all_households=True).first():
         flash("Usuário já existe.", "warning")
         return redirect(url_for("bp.settings"))
     u = User(name=name, username=username, role=role, is_active=True, password_hash="")
@@ -725,130 +1114,36 @@ def delete_user(uid: int):
 # ---------------- DIAGNÓSTICO (ADMIN) ----------------
 @bp.route("/admin/diagnostico")
 @admin_required
+@replica_reads
 def admin_diagnostico():
     """Página de diagnóstico para confirmar DB conectado e contagens.
     NÃO mostra senhas. Útil quando 'sumiu' dados ou após deploy.
-    """
-    info = {
-        "db_url": None,
-        "db_name": None,
-        "db_user": None,
-        "db_host": None,
-        "db_driver": None,
-        "tables": [],
-        "errors": []
-    }
 
-    # URL do engine (sem senha)
-    try:
-        url_obj = db.engine.url
-        # render_as_string existe no SQLAlchemy 1.4+/2.x
-        try:
-            info["db_url"] = url_obj.render_as_string(hide_password=True)
-        except Exception:
-            info["db_url"] = str(url_obj)
-        info["db_name"] = getattr(url_obj, "database", None)
-        info["db_user"] = getattr(url_obj, "username", None)
-        info["db_host"] = getattr(url_obj, "host", None)
-        info["db_driver"] = getattr(url_obj, "drivername", None)
-    except Exception as e:
-        db.session.rollback()
-        info["errors"].append(f"Falha ao ler URL do banco: {e}")
-
-    # Tabelas (Postgres: schema public)
-    try:
-        rows = db.session.execute(text(
-            """SELECT table_name
-                 FROM information_schema.tables
-                 WHERE table_schema='public'
-                 ORDER BY table_name"""
-        )).fetchall()
-        info["tables"] = [r[0] for r in rows]
-    except Exception as e:
-        db.session.rollback()
-        # Fallback (SQLite)
-        try:
-            rows = db.session.execute(text(
-                """SELECT name FROM sqlite_master
-                     WHERE type='table'
-                     ORDER BY name"""
-            )).fetchall()
-            info["tables"] = [r[0] for r in rows]
-        except Exception as e2:
-            info["errors"].append(f"Falha ao listar tabelas: {e} / {e2}")
-
-    counts = {}
-    try: counts["users_total"] = User.query.count()
-    except Exception as e: info["errors"].append(f"users count: {e}")
-    try: counts["transactions_total"] = Transaction.query.count()
-    except Exception as e: info["errors"].append(f"transactions count: {e}")
-    try: counts["budgets_total"] = Budget.query.count()
-    except Exception as e: info["errors"].append(f"budgets count: {e}")
-    try: counts["budget_templates_total"] = BudgetTemplate.query.count()
-    except Exception as e: info["errors"].append(f"budget_templates count: {e}")
-    try: counts["recurring_total"] = RecurringTransaction.query.count()
-    except Exception as e: info["errors"].append(f"recurring count: {e}")
-    try: counts["categories_total"] = Category.query.count()
-    except Exception as e: info["errors"].append(f"categories count: {e}")
-    try: counts["accounts_total"] = Account.query.count()
-    except Exception as e: info["errors"].append(f"accounts count: {e}")
-
-    # Datas e meses das transações
-    stats = {"min_date": None, "max_date": None, "months": []}
-    try:
-        row = db.session.execute(text("SELECT MIN(txn_date), MAX(txn_date) FROM transactions")).fetchone()
-        stats["min_date"], stats["max_date"] = row[0], row[1]
-    except Exception as e:
-        db.session.rollback()
-        info["errors"].append(f"min/max txn_date: {e}")
+    ?exact=1 faz COUNT(*) real; ?refresh=1 ignora o cache.
+    """
+    exact = request.args.get("exact") == "1"
+    refresh = request.args.get("refresh") == "1"
+    diag = get_diagnostics(exact=exact, refresh=refresh)
+    return render_template("admin_diagnostico.html", exact=exact, **diag)
 
-    try:
-        # Postgres
-        rows = db.session.execute(text(
-            """SELECT TO_CHAR(txn_date, 'YYYY-MM') AS ym, COUNT(*) 
-                 FROM transactions
-                 GROUP BY ym
-                 ORDER BY ym DESC
-                 LIMIT 24"""
-        )).fetchall()
-        stats["months"] = [{"month": r[0], "count": int(r[1])} for r in rows]
-    except Exception:
-        # SQLite fallback
-        try:
-            rows = db.session.execute(text(
-                """SELECT substr(txn_date,1,7) AS ym, COUNT(*) 
-                     FROM transactions
-                     GROUP BY ym
-                     ORDER BY ym DESC
-                     LIMIT 24"""
-            )).fetchall()
-            stats["months"] = [{"month": r[0], "count": int(r[1])} for r in rows]
-        except Exception as e2:
-            info["errors"].append(f"months group: {e2}")
-
-    last_txns = []
-    try:
-        last = Transaction.query.order_by(Transaction.id.desc()).limit(10).all()
-        for t in last:
-            last_txns.append({
-                "id": t.id,
-                "date": t.txn_date.isoformat() if t.txn_date else "",
-                "type": t.txn_type,
-                "amount": float(t.amount) if t.amount is not None else 0,
-                "category": getattr(t.category, "name", "") if getattr(t, "category", None) else "",
-                "account": getattr(t.account, "name", "") if getattr(t, "account", None) else "",
-                "desc": (t.description or "")[:80]
-            })
-    except Exception as e:
-        db.session.rollback()
-        info["errors"].append(f"last transactions: {e}")
 
+@bp.route("/admin/auditoria")
+@admin_required
+def admin_auditoria():
+    """Linha do tempo das alterações em lançamentos (?tid= filtra um lançamento)."""
+    tid = request.args.get("tid", type=int)
+    before = request.args.get("before", type=int)
+    events = timeline(entity_id=tid, before_id=before)
+    names = {
+        "category_id": {c.id: c.name for c in Category.query},
+        "account_id": {a.id: a.name for a in Account.query},
+        "users": {u.id: u.username for u in User.query},
+    }
+    names["to_account_id"] = names["account_id"]
     return render_template(
-        "admin_diagnostico.html",
-        info=info,
-        counts=counts,
-        stats=stats,
-        last_txns=last_txns
+        "admin_auditoria.html", events=events, tid=tid, names=names,
+        labels=FIELD_LABELS, type_labels=TYPE_LABELS,
+        next_before=events[-1]["id"] if len(events) == 100 else None,
     )
 
 
@@ -882,6 +1177,12 @@ def add_recurring():
     if txn_type not in ("income","expense"):
         txn_type = "expense"
 
+    # só aceita categoria/conta da própria casa (consultas já vêm filtradas)
+    if not category_id.isdigit() or not account_id.isdigit() \
+            or not db.session.get(Category, int(category_id)) or not db.session.get(Account, int(account_id)):
+        flash("Categoria ou conta inválida.", "danger")
+        return redirect(url_for("bp.settings"))
+
     desc = request.form.get("description","").strip()
 
     db.session.add(RecurringTransaction(
@@ -909,13 +1210,23 @@ def delete_recurring(rid: int):
     return redirect(url_for("bp.settings"))
 
 # ---------------- PWA files ----------------
+@bp.route("/sw.js")
+def service_worker():
+    # servido na raiz para o service worker controlar todas as páginas; a
+    # lista de pré-cache sai do manifest do build (nomes com hash)
+    urls = precache_urls()
+    resp = Response(render_template("sw.js", precache=urls, version=precache_version(urls)),
+                    mimetype="application/javascript")
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
 @bp.route("/manifest.json")
 def manifest():
     from flask import current_app
     return {
         "name": current_app.config.get("PWA_NAME","Finanças da Casa"),
         "short_name": "Finanças",
-        "start_url": "/",
+        "start_url": "/app",
         "display": "standalone",
         "background_color": "#0b1220",
         "theme_color": "#0b1220",
@@ -0,0 +1,101 @@
+"""Ajustes de schema em bancos já existentes.
+
+`db.create_all()` só cria tabelas que ainda não existem; colunas e índices
+novos em tabelas antigas são aplicados aqui, comparando os modelos com o
+catálogo do banco. Cada passo é idempotente e roda logo após o create_all.
+
+Colunas novas NOT NULL precisam de `server_default` no modelo (é o valor
+usado para as linhas antigas); sem ele a coluna é criada aceitando NULL.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+
+from . import db
+from .dbutil import is_postgres
+
+
+def upgrade_schema():
+    insp = inspect(db.engine)
+    _add_missing_columns(insp)
+    _budgets_unique_month_category(insp)
+    _drop_global_unique_names(insp)
+    db.session.commit()
+    _create_missing_indexes(inspect(db.engine))
+
+
+def _index_names(insp, table: str) -> set:
+    return {ix["name"] for ix in insp.get_indexes(table)}
+
+
+def _default_sql(column, dialect) -> str:
+    arg = column.server_default.arg
+    if isinstance(arg, str):
+        return "'" + arg.replace("'", "''") + "'"
+    return str(arg.compile(dialect=dialect))
+
+
+def _add_missing_columns(insp):
+    dialect = db.engine.dialect
+    existing = set(insp.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        have = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in have:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(dialect=dialect)}"
+            if col.server_default is not None:
+                ddl += f" DEFAULT {_default_sql(col, dialect)}"
+                if not col.nullable:
+                    ddl += " NOT NULL"
+            db.session.execute(text(ddl))
+
+
+def _create_missing_indexes(insp):
+    existing = set(insp.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        have = _index_names(insp, table.name)
+        for index in table.indexes:
+            if index.name not in have:
+                index.create(db.engine, checkfirst=True)
+
+
+def _budgets_unique_month_category(insp):
+    if "uq_budgets_month_category" in _index_names(insp, "budgets"):
+        return
+    # bases antigas podem ter exceções duplicadas: fica a mais recente (maior id)
+    db.session.execute(text(
+        """DELETE FROM budgets
+            WHERE id NOT IN (SELECT MAX(id) FROM budgets GROUP BY month, category_id)"""
+    ))
+    db.session.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_budgets_month_category ON budgets (month, category_id)"
+    ))
+
+
+def _drop_global_unique_names(insp):
+    """Nome de categoria/conta passou a ser único por casa, não no sistema.
+
+    No Postgres remove as constraints antigas (categories_name_key,
+    accounts_name_key). No SQLite a UNIQUE antiga faz parte da tabela, então
+    a tabela é recriada (cria nova, copia, apaga a antiga, renomeia).
+    """
+    for table in ("categories", "accounts"):
+        if is_postgres():
+            db.session.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_name_key"))
+            continue
+        if any(u["column_names"] == ["name"] for u in insp.get_unique_constraints(table)):
+            _sqlite_rebuild(table)
+
+
+def _sqlite_rebuild(name: str):
+    table = db.metadata.tables[name]
+    cols = ", ".join(c.name for c in table.columns)
+    ddl = str(CreateTable(table).compile(db.engine)).replace(f"CREATE TABLE {name} ", f"CREATE TABLE {name}__new ", 1)
+    db.session.execute(text(ddl))
+    db.session.execute(text(f"INSERT INTO {name}__new ({cols}) SELECT {cols} FROM {name}"))
+    db.session.execute(text(f"DROP TABLE {name}"))
+    db.session.execute(text(f"ALTER TABLE {name}__new RENAME TO {name}"))
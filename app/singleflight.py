@@ -0,0 +1,142 @@
+"""Uma só execução para pedidos idênticos e simultâneos (single-flight).
+
+Quando duas pessoas da casa abrem o mesmo relatório ao mesmo tempo, ou
+alguém clica duas vezes em "Exportar", o trabalho pesado roda uma vez:
+
+- `do(key, fn)`: dentro do processo, quem chega com a mesma chave enquanto
+  `fn` roda espera e recebe o mesmo resultado (ou a mesma exceção).
+- `shared_file(folder, base_name, ext, key, write)`: entre workers do
+  gunicorn, o arquivo exportado tem nome derivado da chave; o primeiro a
+  pegar o lock (advisory lock no Postgres, lock de arquivo nos demais)
+  grava, e os outros encontram o arquivo pronto.
+
+A chave deve conter tudo que muda a saída: endpoint, filtros normalizados,
+casa e a versão dos dados. Entre processos, a versão é a impressão digital
+dos lançamentos do período (cache.transactions_fingerprint), que muda a
+cada inclusão, edição ou exclusão em qualquer worker, mais a das
+categorias, contas e cotações (cache.reference_fingerprint).
+
+Ao gravar um arquivo novo, as versões anteriores do mesmo nome-base são
+apagadas, menos as gravadas há menos de PRUNE_GRACE segundos (podem estar
+entre o `shared_file` e o envio em outro pedido).
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+PRUNE_GRACE = 60
+
+_lock = threading.Lock()
+_calls = {}  # chave -> _Call em andamento
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def do(key, fn):
+    """fn() uma vez por chave entre chamadas simultâneas deste processo."""
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+    try:
+        call.result = fn()
+        return call.result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+def digest(key) -> str:
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+@contextmanager
+def interprocess_lock(name: str):
+    """Lock exclusivo entre processos: pg_advisory_lock no Postgres, flock nos demais."""
+    from . import db
+    from .dbutil import is_postgres
+    from sqlalchemy import text
+
+    h = digest(("singleflight", name))
+    if is_postgres():
+        lock_id = int.from_bytes(bytes.fromhex(h[:16]), "big", signed=True)
+        with db.engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": lock_id})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+        return
+    try:
+        import fcntl
+    except ImportError:  # Windows: sem lock entre processos (uso local)
+        yield
+        return
+    folder = Path(tempfile.gettempdir()) / "financas-casa-locks"
+    folder.mkdir(exist_ok=True)
+    with open(folder / f"{h[:32]}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _prune(folder: Path, base_name: str, ext: str, keep: Path):
+    """Apaga as versões antigas de `base_name` (quem já está baixando segue com o arquivo aberto)."""
+    cutoff = time.time() - PRUNE_GRACE
+    for p in folder.glob(f"{base_name}_{'?' * 12}.{ext}"):
+        if p == keep:
+            continue
+        try:
+            if p.stat().st_mtime < cutoff:
+                p.unlink()
+        except FileNotFoundError:
+            pass  # outro worker apagou antes
+
+
+def shared_file(folder: Path, base_name: str, ext: str, key, write) -> Path:
+    """Caminho de `<base_name>_<hash>.<ext>`, gravado por `write(caminho)` uma vez só.
+
+    Se o arquivo da mesma chave já existe (outro pedido ou outro worker o
+    gerou), volta direto. A gravação vai para um arquivo oculto e é renomeada
+    no fim, então ninguém lê arquivo pela metade.
+    """
+    h = digest(key)
+    path = Path(folder) / f"{base_name}_{h[:12]}.{ext}"
+    if path.exists():
+        return path
+
+    def produce():
+        with interprocess_lock(h):
+            if not path.exists():
+                tmp = path.with_name(f".{path.stem}.{os.getpid()}.{threading.get_ident()}.{ext}")
+                try:
+                    write(tmp)
+                    os.replace(tmp, path)
+                finally:
+                    if tmp.exists():
+                        tmp.unlink()
+                _prune(Path(folder), base_name, ext, keep=path)
+        return path
+
+    return do(("file", h), produce)
@@ -0,0 +1,179 @@
+"""Lançamentos divididos entre categorias (rateio de um mesmo comprovante).
+
+Uma compra de supermercado de R$ 300 pode ser R$ 200 de Mercado, R$ 70 de
+Casa e R$ 30 de Escola: um lançamento só (uma conta, um comprovante, um
+movimento no razão) com linhas em transaction_splits. O lançamento guarda o
+total em `amount`, a categoria da maior linha em `category_id` e
+`is_split = true`.
+
+Somas por categoria leem "linhas": a do rateio nos divididos, o próprio
+lançamento nos outros. `line_columns()` faz isso com um LEFT JOIN cuja
+condição começa por `is_split`, então lançamento não dividido não procura
+linha nenhuma:
+
+    SELECT coalesce(s.category_id, t.category_id), sum(coalesce(s.amount, t.amount))
+      FROM transactions t
+      LEFT JOIN transaction_splits s ON t.is_split AND s.transaction_id = t.id
+     GROUP BY 1
+
+Casa que nunca dividiu um lançamento (`in_use()` em cache) nem faz o JOIN:
+as consultas ficam iguais às de antes do rateio.
+
+Totais por tipo e por conta não mudam (o total do lançamento é a soma das
+linhas). Filtro por categoria usa o índice de transactions para os não
+divididos e ix_transaction_splits_category para os divididos
+(`in_categories`). Anos arquivados continuam com as linhas no banco;
+`expand` troca cada dividido arquivado pelas linhas dele.
+"""
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import and_, delete, event, func, literal, or_, select
+from sqlalchemy.orm import Session, joinedload
+
+from . import db
+from .cache import cached
+from .models import Category, Transaction, TransactionSplit
+
+
+class SplitError(ValueError):
+    pass
+
+
+def parse_lines(category_ids, amounts) -> list:
+    """[(categoria, valor)] dos campos do formulário; linhas em branco são ignoradas."""
+    lines = []
+    for i, (cid, raw) in enumerate(zip(category_ids, amounts), start=1):
+        raw = (raw or "").strip().replace(",", ".")
+        if not cid and not raw:
+            continue
+        try:
+            value = round(float(raw), 2)
+            cid = int(cid)
+        except (TypeError, ValueError):
+            raise SplitError(f"Linha {i} do rateio: informe categoria e valor.")
+        if value <= 0:
+            raise SplitError(f"Linha {i} do rateio: valor precisa ser positivo.")
+        lines.append((cid, value))
+    return lines
+
+
+def apply(transaction: Transaction, lines: list, amount: float = None):
+    """Grava o rateio (2+ linhas) ou o desfaz (lista vazia). Não faz commit.
+
+    Com `amount`, a soma das linhas precisa bater com ele.
+    """
+    if not lines:
+        if transaction.is_split:
+            transaction.splits = []
+            transaction.is_split = False
+            transaction.updated_at = datetime.utcnow()
+        return
+    if len(lines) < 2:
+        raise SplitError("O rateio precisa de pelo menos duas linhas.")
+    for cid, _ in lines:
+        category = db.session.get(Category, cid)
+        if category is None:
+            raise SplitError("Categoria inválida no rateio.")
+        if category.kind != transaction.txn_type:
+            raise SplitError("As categorias do rateio precisam ser do mesmo tipo do lançamento (receita/despesa).")
+    total = round(sum(v for _, v in lines), 2)
+    if amount is not None and abs(total - amount) > 0.005:
+        raise SplitError(f"A soma das linhas ({total:.2f}) difere do valor do lançamento ({amount:.2f}).")
+    transaction.splits = [TransactionSplit(category_id=cid, amount=v) for cid, v in lines]
+    transaction.is_split = True
+    transaction.amount = total
+    transaction.category_id = max(lines, key=lambda line: line[1])[0]
+    # só as linhas mudarem não altera a linha de transactions; backup
+    # incremental, sincronização e caches por período olham updated_at
+    transaction.updated_at = datetime.utcnow()
+
+
+# ---------------- consultas ----------------
+def in_use() -> bool:
+    """A casa tem algum lançamento dividido (em cache até a próxima gravação)."""
+    return cached(("splits_in_use",), lambda: db.session.execute(
+        select(literal(1)).select_from(TransactionSplit).limit(1)
+    ).first() is not None)
+
+
+def line_columns():
+    """(categoria, valor, join): colunas por linha e o LEFT JOIN que as traz.
+
+    `join(stmt)` recebe um select que já tem transactions no FROM.
+    """
+    if not in_use():
+        return Transaction.category_id, Transaction.amount, (lambda stmt: stmt)
+    s = TransactionSplit
+
+    def join(stmt):
+        return stmt.outerjoin(s, and_(Transaction.is_split, s.transaction_id == Transaction.id))
+    return func.coalesce(s.category_id, Transaction.category_id), func.coalesce(s.amount, Transaction.amount), join
+
+
+def in_categories(category_ids):
+    """Lançamentos com alguma linha nas categorias (por índice, sem o JOIN das linhas)."""
+    if not in_use():
+        return Transaction.category_id.in_(category_ids)
+    s = TransactionSplit
+    return or_(
+        Transaction.category_id.in_(category_ids),
+        Transaction.id.in_(select(s.transaction_id).where(s.category_id.in_(category_ids))),
+    )
+
+
+def lines_for(transactions) -> dict:
+    """{id do lançamento: [linhas]} só dos divididos; sem nenhum, nenhuma consulta."""
+    ids = [t.id for t in transactions if getattr(t, "is_split", False)]
+    out = {}
+    if not ids:
+        return out
+    rows = (
+        TransactionSplit.query.options(joinedload(TransactionSplit.category))
+        .filter(TransactionSplit.transaction_id.in_(ids))
+        .order_by(TransactionSplit.id)
+    )
+    for line in rows:
+        out.setdefault(line.transaction_id, []).append(line)
+    return out
+
+
+def flush_lines(state, before: bool = False) -> list:
+    """(categoria, valor) das linhas do rateio, antes ou depois deste flush (listeners).
+
+    As linhas não são alteradas no lugar (apply troca todas), então as de
+    antes são as que continuam mais as removidas.
+    """
+    hist = state.attrs.splits.load_history()
+    objs = list(hist.unchanged) + list(hist.deleted if before else hist.added)
+    return [(s.category_id, s.amount) for s in objs]
+
+
+def expand(rows: list, categories: dict = None) -> list:
+    """Lançamentos (ex.: arquivados) com cada dividido trocado por uma cópia por linha."""
+    lines = lines_for(rows)
+    if not lines:
+        return rows
+    out = []
+    for r in rows:
+        for line in lines.get(r.id, ()):
+            out.append(SimpleNamespace(**dict(
+                vars(r), category_id=line.category_id, amount=line.amount, is_split=False,
+                category=(categories or {}).get(line.category_id, line.category),
+            )))
+        if r.id not in lines:
+            out.append(r)
+    return out
+
+
+def _drop_deleted(session, flush_context):
+    # passive_deletes: as linhas não são carregadas só para apagar
+    gone = [o.id for o in session.deleted if isinstance(o, Transaction) and o.is_split]
+    if gone:
+        s = TransactionSplit.__table__
+        session.connection().execute(delete(s).where(s.c.transaction_id.in_(gone)))
+
+
+def init_app(app):
+    if not event.contains(Session, "after_flush", _drop_deleted):
+        event.listen(Session, "after_flush", _drop_deleted)
@@ -0,0 +1,93 @@
+"""Modo embarcado (um nó só) com SQLite, ajustado para o gunicorn.
+
+Sem DATABASE_URL fora de produção o app usa instance/finance.db, e muita
+gente roda assim de vez. Com SQLITE_TUNING=1 (padrão), cada conexão nova
+recebe:
+
+    journal_mode=WAL          leitores não bloqueiam o escritor (e vice-versa)
+    synchronous=NORMAL        fsync só no checkpoint; seguro com WAL
+    mmap_size, cache_size     SQLITE_MMAP_MB (256) e SQLITE_CACHE_MB (64)
+    busy_timeout              SQLITE_BUSY_TIMEOUT_MS (5000)
+
+e transações de escrita começam com BEGIN IMMEDIATE: quem vai gravar pega
+o lock de escrita já no início e espera na fila (busy_timeout), em vez de
+começar como leitura e falhar com "database is locked" ao tentar gravar.
+Leituras continuam sem BEGIN (cada SELECT vê o último commit).
+
+O pool fica do tamanho das threads do gunicorn (GUNICORN_THREADS), uma
+conexão por thread, sem pre-ping (arquivo local não cai).
+
+Medição: python -m bench.concurrency (leituras e gravações simultâneas).
+"""
+import os
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+from . import db
+
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+)
+
+
+def enabled(url: str) -> bool:
+    """SQLite em arquivo e SQLITE_TUNING ligado."""
+    u = make_url(url)
+    if u.get_backend_name() != "sqlite" or u.database in (None, "", ":memory:"):
+        return False
+    return os.getenv("SQLITE_TUNING", "1") not in ("0", "false", "False")
+
+
+def busy_timeout_ms() -> int:
+    return int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def engine_options() -> dict:
+    threads = int(os.getenv("GUNICORN_THREADS", "4"))
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", str(threads))),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "2")),
+        "pool_timeout": busy_timeout_ms() / 1000,
+        "connect_args": {"timeout": busy_timeout_ms() / 1000, "check_same_thread": False},
+    }
+
+
+def _on_connect(dbapi_connection, connection_record):
+    # o pysqlite abre a transação sozinho antes de INSERT/UPDATE/DELETE;
+    # com isolation_level="IMMEDIATE" ele usa BEGIN IMMEDIATE
+    dbapi_connection.isolation_level = "IMMEDIATE"
+    mmap = int(os.getenv("SQLITE_MMAP_MB", "256")) * 1024 * 1024
+    cache_kb = int(os.getenv("SQLITE_CACHE_MB", "64")) * 1024
+    cur = dbapi_connection.cursor()
+    for name, value in PRAGMAS:
+        cur.execute(f"PRAGMA {name}={value}")
+    cur.execute(f"PRAGMA mmap_size={mmap}")
+    cur.execute(f"PRAGMA cache_size=-{cache_kb}")  # negativo = KiB
+    cur.execute(f"PRAGMA busy_timeout={busy_timeout_ms()}")
+    cur.close()
+
+
+def settings() -> dict:
+    """Valores em vigor numa conexão do pool (página de diagnóstico)."""
+    out = {}
+    for name in ("journal_mode", "synchronous", "mmap_size", "cache_size", "busy_timeout"):
+        out[name] = db.session.execute(text(f"PRAGMA {name}")).scalar()
+    out["pool_size"] = db.engine.pool.size() if hasattr(db.engine.pool, "size") else None
+    return out
+
+
+def configure(app):
+    """Antes de db.init_app: ajusta as opções do engine para SQLite."""
+    if enabled(app.config["SQLALCHEMY_DATABASE_URI"]):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options()
+
+
+def init_app(app):
+    """Depois de db.init_app: pragmas e BEGIN IMMEDIATE a cada conexão nova (principal e réplica)."""
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if enabled(engine.url.render_as_string(hide_password=False)) and not event.contains(engine, "connect", _on_connect):
+            event.listen(engine, "connect", _on_connect)
@@ -0,0 +1,243 @@
+// Modo offline: lançamentos no IndexedDB, sincronizados por delta
+// (/api/sync/delta) e fila de envio em lote (/api/sync/transactions).
+// A tela /app é desenhada daqui, do IndexedDB: abrir o app custa um delta.
+(function () {
+  if (!('indexedDB' in window) || !window.fetch) return;
+
+  const me = (document.currentScript && document.currentScript.dataset) || {};
+  if (!me.user) return;
+  // um banco por casa e usuário: outro login no mesmo aparelho não vê os
+  // dados nem herda o cursor do anterior
+  const DB_NAME = 'financas-' + me.household + '-' + me.user;
+  const LAST_DB = 'financas-db';
+  const BATCH = 100;
+
+  function clearPages() {
+    if (!window.caches) return Promise.resolve();
+    return caches.keys().then((keys) => Promise.all(
+      keys.filter((k) => k.startsWith('pages-')).map((k) => caches.delete(k))
+    ));
+  }
+
+  // dados locais de quem usou o aparelho antes (ou da versão sem casa/usuário)
+  function forgetPrevious() {
+    const last = localStorage.getItem(LAST_DB);
+    if (last === DB_NAME) return;
+    indexedDB.deleteDatabase(last || 'financas');
+    if (last) clearPages();
+    localStorage.setItem(LAST_DB, DB_NAME);
+  }
+
+  // sessão expirada: nada do usuário anterior fica no aparelho
+  function forgetAll() {
+    indexedDB.deleteDatabase(DB_NAME);
+    localStorage.removeItem(LAST_DB);
+    return clearPages().then(() => { window.location.href = '/login'; });
+  }
+
+  function openDb() {
+    return new Promise((resolve, reject) => {
+      const req = indexedDB.open(DB_NAME, 1);
+      req.onupgradeneeded = () => {
+        const db = req.result;
+        db.createObjectStore('transactions', { keyPath: 'id' });
+        db.createObjectStore('outbox', { keyPath: 'client_id' });
+        db.createObjectStore('meta');
+      };
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+  }
+
+  function tx(db, stores, mode, fn) {
+    return new Promise((resolve, reject) => {
+      const t = db.transaction(stores, mode);
+      const out = fn(t);
+      t.oncomplete = () => resolve(out);
+      t.onerror = () => reject(t.error);
+    });
+  }
+
+  function getAll(db, store) {
+    return new Promise((resolve, reject) => {
+      const req = db.transaction(store).objectStore(store).getAll();
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+  }
+
+  function getMeta(db, key) {
+    return new Promise((resolve) => {
+      const req = db.transaction('meta').objectStore('meta').get(key);
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => resolve(undefined);
+    });
+  }
+
+  function newClientId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+  }
+
+  async function pull(db) {
+    let cursor = (await getMeta(db, 'cursor')) || '';
+    for (;;) {
+      const resp = await fetch('/api/sync/delta?since=' + encodeURIComponent(cursor), { credentials: 'same-origin' });
+      if (resp.redirected && new URL(resp.url).pathname === '/login') return forgetAll();
+      if (!resp.ok || !(resp.headers.get('content-type') || '').includes('json')) return;
+      const data = await resp.json();
+      await tx(db, ['transactions', 'meta'], 'readwrite', (t) => {
+        const store = t.objectStore('transactions');
+        data.transactions.forEach((row) => store.put(row));
+        data.deleted.forEach((id) => store.delete(id));
+        const meta = t.objectStore('meta');
+        meta.put(data.cursor, 'cursor');
+        if (data.categories) meta.put(data.categories, 'categories');
+        if (data.accounts) meta.put(data.accounts, 'accounts');
+      });
+      cursor = data.cursor;
+      if (!data.more) return;
+    }
+  }
+
+  // recusados ficam marcados na fila (com o motivo) e não são reenviados
+  async function push(db) {
+    const pending = (await getAll(db, 'outbox')).filter((it) => !it.rejected);
+    const refused = [];
+    for (let i = 0; i < pending.length; i += BATCH) {
+      const items = pending.slice(i, i + BATCH);
+      const resp = await fetch('/api/sync/transactions', {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ items: items }),
+      });
+      if (!resp.ok) return refused;
+      const data = await resp.json();
+      const errors = {};
+      (data.results || []).forEach((r) => { if (r.error) errors[r.client_id] = r.error; });
+      await tx(db, ['outbox'], 'readwrite', (t) => {
+        const box = t.objectStore('outbox');
+        items.forEach((it) => {
+          if (errors[it.client_id]) {
+            box.put(Object.assign({}, it, { rejected: errors[it.client_id] }));
+            refused.push(errors[it.client_id]);
+          } else {
+            box.delete(it.client_id);
+          }
+        });
+      });
+    }
+    return refused;
+  }
+
+  // ---------------- tela /app ----------------
+  function money(value, currency) {
+    try {
+      return new Intl.NumberFormat('pt-BR', { style: 'currency', currency: currency || 'BRL' }).format(value);
+    } catch (e) {
+      return (currency || '') + ' ' + value.toFixed(2);
+    }
+  }
+
+  function el(tag, text, cls) {
+    const node = document.createElement(tag);
+    if (text !== undefined) node.textContent = text;
+    if (cls) node.className = cls;
+    return node;
+  }
+
+  async function render(db) {
+    const shell = document.querySelector('[data-offline-app]');
+    if (!shell) return;
+    const month = new Date().toISOString().slice(0, 7);
+    const names = {};
+    ((await getMeta(db, 'categories')) || []).forEach((c) => { names['c' + c.id] = c.name; });
+    ((await getMeta(db, 'accounts')) || []).forEach((a) => { names['a' + a.id] = a.name; });
+    const rows = (await getAll(db, 'transactions'))
+      .filter((t) => t.txn_date.slice(0, 7) === month)
+      .sort((a, b) => (b.txn_date + b.id).localeCompare(a.txn_date + a.id));
+    const outbox = await getAll(db, 'outbox');
+
+    const totals = {};
+    rows.forEach((t) => {
+      if (t.txn_type === 'transfer') return;
+      const cur = totals[t.currency] = totals[t.currency] || { income: 0, expense: 0 };
+      cur[t.txn_type] += t.amount;
+    });
+    const summary = shell.querySelector('[data-offline-summary]');
+    summary.replaceChildren();
+    Object.keys(totals).sort().forEach((cur) => {
+      const t = totals[cur];
+      summary.append(el('div', 'Receitas: ' + money(t.income, cur) + ' · Despesas: ' + money(t.expense, cur) +
+        ' · Saldo: ' + money(t.income - t.expense, cur)));
+    });
+    if (!summary.childElementCount) summary.append(el('div', 'Sem lançamentos neste mês.', 'text-muted'));
+
+    const list = shell.querySelector('[data-offline-list]');
+    list.replaceChildren();
+    rows.slice(0, 200).forEach((t) => {
+      const tr = el('tr');
+      tr.append(el('td', t.txn_date), el('td', names['c' + t.category_id] || ''), el('td', names['a' + t.account_id] || ''),
+        el('td', t.description), el('td', (t.txn_type === 'expense' ? '-' : '') + money(t.amount, t.currency), 'text-end'));
+      list.append(tr);
+    });
+
+    const pending = shell.querySelector('[data-offline-outbox]');
+    pending.replaceChildren();
+    outbox.forEach((it) => {
+      const li = el('li', it.txn_date + ' · ' + it.amount + ' · ' + (it.description || names['c' + it.category_id] || ''));
+      if (it.rejected) {
+        li.append(el('span', ' recusado: ' + it.rejected, 'text-danger'));
+        const drop = el('button', 'Descartar', 'btn btn-sm btn-link');
+        drop.addEventListener('click', async () => {
+          await tx(db, ['outbox'], 'readwrite', (t) => t.objectStore('outbox').delete(it.client_id));
+          render(db);
+        });
+        li.append(drop);
+      }
+      pending.append(li);
+    });
+    shell.querySelector('[data-offline-pending]').hidden = !outbox.length;
+  }
+
+  async function sync() {
+    try {
+      const db = await openDb();
+      await render(db);
+      if (!navigator.onLine) return;
+      const refused = await push(db);
+      await pull(db);
+      await render(db);
+      if (refused.length) {
+        alert(refused.length + ' lançamento(s) feitos offline foram recusados: ' + refused.join('; '));
+      }
+    } catch (e) { /* tenta de novo na próxima abertura/conexão */ }
+  }
+
+  // Formulário de novo lançamento: offline, vai para a fila
+  document.addEventListener('submit', async (e) => {
+    const form = e.target;
+    if (!form.matches('form[data-offline]') || navigator.onLine) return;
+    e.preventDefault();
+    const f = new FormData(form);
+    const item = {
+      client_id: newClientId(),
+      txn_type: f.get('txn_type'),
+      txn_date: f.get('txn_date') || new Date().toISOString().slice(0, 10),
+      category_id: f.get('category_id'),
+      account_id: f.get('account_id'),
+      to_account_id: f.get('to_account_id'),
+      amount: f.get('amount'),
+      description: f.get('description') || '',
+    };
+    const db = await openDb();
+    await tx(db, ['outbox'], 'readwrite', (t) => t.objectStore('outbox').put(item));
+    form.reset();
+    alert('Sem conexão: lançamento guardado e será enviado quando voltar a internet.');
+  });
+
+  forgetPrevious();
+  window.addEventListener('online', sync);
+  sync();
+})();
@@ -1 +0,0 @@
-self.addEventListener('fetch',()=>{});
\ No newline at end of file
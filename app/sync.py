@@ -0,0 +1,217 @@
+"""Sincronização incremental para o modo offline do PWA.
+
+O aparelho guarda os lançamentos no IndexedDB (static/offline.js) e, ao
+abrir o app, pede só o que mudou desde o último cursor:
+
+    GET  /api/sync/delta?since=<cursor>   -> alterados + apagados desde o cursor
+    POST /api/sync/transactions           -> lote de lançamentos feitos offline
+
+O lote tem resultado por item (aceito com o id, ou recusado com o motivo):
+um item inválido não trava a fila do aparelho, que marca o recusado e
+segue com os outros.
+
+O cursor é (updated_at, id) do último lançamento enviado, mais o instante
+em que a rodada de páginas começou. updated_at é o horário do flush, não
+do commit: uma gravação em andamento durante a leitura aparece depois com
+updated_at anterior ao cursor. Por isso, na última página, o cursor volta
+para SYNC_OVERLAP segundos antes do menor entre o último updated_at e o
+início da rodada, e a próxima sincronização relê essa janela. O aparelho
+grava por id, então repetir linhas não tem efeito. Exclusões ficam em
+transaction_tombstones.
+"""
+import os
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, event, or_
+from sqlalchemy.orm import Session
+
+from . import db
+from .ledger import TRANSFER, TXN_TYPES
+from .models import Account, Category, Transaction, TransactionTombstone
+from .utils import parse_amount
+
+PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+MAX_BATCH = 500
+OVERLAP = timedelta(seconds=int(os.getenv("SYNC_OVERLAP", "5")))
+
+
+class SyncError(ValueError):
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def _parse_cursor(since: str):
+    """'<iso>|<id>[|<início da rodada>]' -> (datetime, id, datetime | None); vazio = sincronização completa."""
+    if not since:
+        return None
+    try:
+        ts, _, rest = since.partition("|")
+        tid, _, started = rest.partition("|")
+        return datetime.fromisoformat(ts), int(tid or 0), datetime.fromisoformat(started) if started else None
+    except ValueError:
+        raise SyncError([f"cursor inválido: {since!r}"])
+
+
+def _format_cursor(ts: datetime, tid: int, started: datetime = None) -> str:
+    return f"{ts.isoformat()}|{tid}" + (f"|{started.isoformat()}" if started else "")
+
+
+def serialize(t: Transaction) -> dict:
+    return {
+        "id": t.id,
+        "client_id": t.client_id,
+        "txn_date": t.txn_date.isoformat(),
+        "txn_type": t.txn_type,
+        "category_id": t.category_id,
+        "account_id": t.account_id,
+        "to_account_id": t.to_account_id,
+        "amount": float(t.amount),
+        "currency": t.currency,
+        "description": t.description or "",
+        "updated_at": t.updated_at.isoformat(),
+    }
+
+
+def delta(since: str = "", limit: int = PAGE_SIZE) -> dict:
+    """Uma página de alterações depois do cursor (consultas já filtradas por casa)."""
+    cursor = _parse_cursor(since)
+    started = (cursor and cursor[2]) or datetime.utcnow()
+    q = Transaction.query
+    if cursor:
+        ts, tid, _ = cursor
+        q = q.filter(or_(Transaction.updated_at > ts,
+                         and_(Transaction.updated_at == ts, Transaction.id > tid)))
+    rows = q.order_by(Transaction.updated_at, Transaction.id).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    deleted = []
+    if cursor:
+        deleted = [r[0] for r in db.session.query(TransactionTombstone.transaction_id)
+                   .filter(TransactionTombstone.deleted_at > cursor[0] - OVERLAP).all()]
+
+    if more:
+        next_cursor = (rows[-1].updated_at, rows[-1].id, started)
+    elif rows or (cursor and cursor[2]):
+        # fim da rodada: relê o que pode ter sido gravado durante a leitura das páginas
+        end = rows[-1].updated_at if rows else cursor[0]
+        next_cursor = (min(end, started) - OVERLAP, 0)
+    elif cursor:
+        next_cursor = cursor[:2]  # já recuado quando foi emitido
+    else:
+        next_cursor = (started - OVERLAP, 0)
+
+    payload = {
+        "transactions": [serialize(t) for t in rows],
+        "deleted": deleted,
+        "cursor": _format_cursor(*next_cursor),
+        "more": more,
+    }
+    if not cursor:
+        # primeira carga: nomes para exibir offline
+        payload["categories"] = [{"id": c.id, "name": c.name, "kind": c.kind}
+                                 for c in Category.query.filter_by(is_active=True).order_by(Category.name)]
+        payload["accounts"] = [{"id": a.id, "name": a.name}
+                               for a in Account.query.filter_by(is_active=True).order_by(Account.name)]
+    return payload
+
+
+def _clean(it: dict, categories: set, accounts: set) -> dict:
+    """Campos validados de um item do lote (ValueError com o motivo)."""
+    if not isinstance(it, dict) or not it.get("client_id"):
+        raise ValueError("client_id ausente")
+    txn_type = it.get("txn_type") or "expense"
+    if txn_type not in TXN_TYPES:
+        raise ValueError(f"tipo inválido: {txn_type}")
+    try:
+        category_id, account_id = int(it["category_id"]), int(it["account_id"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("informe categoria e conta")
+    if category_id not in categories or account_id not in accounts:
+        raise ValueError("categoria ou conta inválida")
+    to_account_id = None
+    if txn_type == TRANSFER:
+        try:
+            to_account_id = int(it.get("to_account_id"))
+        except (TypeError, ValueError):
+            to_account_id = None
+        if to_account_id not in accounts or to_account_id == account_id:
+            raise ValueError("transferência: conta de destino inválida")
+    try:
+        amount = parse_amount(it["amount"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"valor inválido: {it.get('amount')!r}")
+    try:
+        txn_date = date.fromisoformat(it["txn_date"]) if it.get("txn_date") else date.today()
+    except (TypeError, ValueError):
+        raise ValueError(f"data inválida: {it.get('txn_date')!r}")
+    return dict(
+        client_id=str(it["client_id"])[:36],
+        txn_type=txn_type,
+        category_id=category_id,
+        account_id=account_id,
+        to_account_id=to_account_id,
+        amount=amount,
+        description=str(it.get("description") or "")[:200],
+        txn_date=txn_date,
+    )
+
+
+def apply_batch(items: list) -> list:
+    """Grava um lote de lançamentos offline; reenvios (mesmo client_id) são ignorados.
+
+    A checagem de client_id é feita aqui, não por índice único: tabela
+    particionada (partitioning.py) só aceita UNIQUE que inclua txn_date.
+
+    Não faz commit. Retorna, na ordem do lote, {"client_id", "id"} dos
+    aceitos e {"client_id", "error"} dos recusados. SyncError só para o
+    lote em si (vazio, grande demais).
+    """
+    if not isinstance(items, list) or not items:
+        raise SyncError(["envie 'items' com ao menos um lançamento"])
+    if len(items) > MAX_BATCH:
+        raise SyncError([f"no máximo {MAX_BATCH} lançamentos por lote"])
+
+    categories = {c.id for c in Category.query.with_entities(Category.id)}
+    accounts = {a.id for a in Account.query.with_entities(Account.id)}
+    results, clean = [], []
+    for it in items:
+        try:
+            c = _clean(it, categories, accounts)
+        except ValueError as e:
+            client_id = it.get("client_id") if isinstance(it, dict) else None
+            results.append({"client_id": client_id, "error": str(e)})
+            continue
+        results.append({"client_id": c["client_id"]})
+        clean.append(c)
+
+    existing = dict(
+        Transaction.query.with_entities(Transaction.client_id, Transaction.id)
+        .filter(Transaction.client_id.in_({c["client_id"] for c in clean})).all()
+    ) if clean else {}
+    new = []
+    for c in clean:
+        if c["client_id"] in existing:
+            continue
+        t = Transaction(receipt_filename="", **c)
+        existing[c["client_id"]] = t
+        new.append(t)
+    db.session.add_all(new)
+    db.session.flush()
+    for r in results:
+        if "error" not in r:
+            v = existing[r["client_id"]]
+            r["id"] = v if isinstance(v, int) else v.id
+    return results
+
+
+def _record_deletes(session, flush_context, instances):
+    for obj in session.deleted:
+        if isinstance(obj, Transaction):
+            session.add(TransactionTombstone(household_id=obj.household_id, transaction_id=obj.id))
+
+
+def register_listeners():
+    if not event.contains(Session, "before_flush", _record_deletes):
+        event.listen(Session, "before_flush", _record_deletes)
@@ -0,0 +1,198 @@
+"""Etiquetas (tags) de lançamentos: "viagem", "reforma-2026", "rec:12".
+
+`tags` guarda os nomes de cada casa; `transaction_tags` liga lançamento e
+etiqueta, com a chave (transaction_id, tag_id) e o índice inverso
+(tag_id, transaction_id). Filtrar por etiquetas vira leitura desse índice,
+sem LIKE em `description`:
+
+- todas (AND): um SELECT por etiqueta no índice inverso, cruzados com
+  INTERSECT (interseção das listas de ids, feita pelo banco);
+- qualquer uma (OR): um único SELECT com tag_id IN (...).
+
+O resultado entra como `transactions.id IN (...)` nos relatórios,
+exportações e na lista de lançamentos. Etiqueta inexistente num filtro AND
+já responde vazio, sem consulta.
+
+Os lançamentos gerados por recorrentes levam a etiqueta `rec:<id>` (antes
+era o texto "[REC:id]" na descrição). A contagem de uso de cada etiqueta,
+para o autocompletar, fica em cache até a próxima gravação.
+"""
+import re
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import delete, event, false, func, insert, intersect, literal, select
+from sqlalchemy.orm import Session
+
+from . import db
+from .cache import cached
+from .dbutil import upsert
+from .models import Tag, Transaction, TransactionTag
+
+MAX_LENGTH = 40
+MATCH = ("all", "any")
+RECURRING_PREFIX = "rec:"
+_LEGACY_RECURRING = re.compile(r"\s*\[REC:(\d+)\]")
+
+
+def normalize(raw) -> list:
+    """Nomes de etiqueta limpos e sem repetição, de "a, b" ou de uma lista."""
+    if raw is None:
+        return []
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    out = []
+    for name in raw:
+        name = " ".join(str(name).replace(",", " ").split()).lstrip("#").lower()[:MAX_LENGTH]
+        if name and name not in out:
+            out.append(name)
+    return out
+
+
+def recurring_tag(recurring_id: int) -> str:
+    return f"{RECURRING_PREFIX}{recurring_id}"
+
+
+# ---------------- filtro ----------------
+class TagFilter(NamedTuple):
+    """Etiquetas pedidas num filtro; `match` "all" (todas) ou "any" (qualquer uma)."""
+    names: tuple
+    match: str = "all"
+
+
+def parse_filter(raw, match: str = "all"):
+    """TagFilter da query string (?tags=a,b&tag_match=any), ou None sem etiquetas."""
+    names = normalize(raw)
+    if not names:
+        return None
+    return TagFilter(tuple(names), match if match in MATCH else "all")
+
+
+def _ids(names) -> dict:
+    """{nome: id} das etiquetas da casa (consulta filtrada por tenancy)."""
+    return dict(db.session.execute(select(Tag.name, Tag.id).where(Tag.name.in_(list(names)))).all())
+
+
+def tagged(tag_filter: TagFilter):
+    """SELECT dos transaction_id que atendem o filtro."""
+    tt = TransactionTag.__table__
+    ids = _ids(tag_filter.names)
+    if not ids or (tag_filter.match == "all" and len(ids) < len(tag_filter.names)):
+        return select(tt.c.transaction_id).where(false())
+    if tag_filter.match == "any" or len(ids) == 1:
+        return select(tt.c.transaction_id).where(tt.c.tag_id.in_(list(ids.values())))
+    return intersect(*[select(tt.c.transaction_id).where(tt.c.tag_id == i) for i in ids.values()])
+
+
+def condition(column, tag_filter):
+    """`column IN (lançamentos com as etiquetas)`, ou None sem filtro."""
+    if not tag_filter:
+        return None
+    return column.in_(tagged(tag_filter))
+
+
+def matching_ids(tag_filter) -> set:
+    """Ids dos lançamentos que atendem o filtro (para os arquivados, fora do banco)."""
+    return set(db.session.execute(tagged(tag_filter)).scalars())
+
+
+# ---------------- gravação ----------------
+def _ensure(conn, household_id: int, names) -> dict:
+    """{nome: id}, criando as etiquetas que faltam (criação simultânea não duplica)."""
+    t = Tag.__table__
+    conn.execute(upsert(t).values([{"household_id": household_id, "name": n} for n in names])
+                 .on_conflict_do_nothing(index_elements=["household_id", "name"]))
+    return dict(conn.execute(
+        select(t.c.name, t.c.id).where(t.c.household_id == household_id, t.c.name.in_(list(names)))
+    ).all())
+
+
+def set_tags(transaction: Transaction, names) -> bool:
+    """Troca as etiquetas de um lançamento já gravado (com id). True se mudou. Não faz commit."""
+    names = normalize(names)
+    current = {tag.name: tag.id for tag in transaction.tags}
+    if set(current) == set(names):
+        return False
+    conn = db.session.connection()
+    tt = TransactionTag.__table__
+    removed = [i for n, i in current.items() if n not in names]
+    if removed:
+        conn.execute(delete(tt).where(tt.c.transaction_id == transaction.id, tt.c.tag_id.in_(removed)))
+    added = [n for n in names if n not in current]
+    if added:
+        ids = _ensure(conn, transaction.household_id, added)
+        conn.execute(insert(tt), [
+            {"household_id": transaction.household_id, "transaction_id": transaction.id, "tag_id": ids[n]}
+            for n in added
+        ])
+    # sincronização e caches por período olham updated_at
+    transaction.updated_at = datetime.utcnow()
+    db.session.expire(transaction, ["tags"])
+    return True
+
+
+def _drop_deleted(session, flush_context):
+    gone = [o.id for o in session.deleted if isinstance(o, Transaction)]
+    if gone:
+        tt = TransactionTag.__table__
+        session.connection().execute(delete(tt).where(tt.c.transaction_id.in_(gone)))
+
+
+def tag_legacy_recurring() -> int:
+    """Troca o marcador "[REC:id]" da descrição pela etiqueta rec:<id>. Não faz commit."""
+    t = Transaction.__table__
+    tt = TransactionTag.__table__
+    conn = db.session.connection()
+    rows = conn.execute(
+        select(t.c.id, t.c.household_id, t.c.description).where(t.c.description.like("%[REC:%"))
+    ).all()
+    n = 0
+    for tid, household_id, description in rows:
+        found = _LEGACY_RECURRING.findall(description or "")
+        if not found:
+            continue
+        ids = _ensure(conn, household_id, [recurring_tag(int(r)) for r in found])
+        conn.execute(upsert(tt).values([
+            {"household_id": household_id, "transaction_id": tid, "tag_id": i} for i in ids.values()
+        ]).on_conflict_do_nothing(index_elements=["transaction_id", "tag_id"]))
+        conn.execute(t.update().where(t.c.id == tid).values(
+            description=_LEGACY_RECURRING.sub("", description).strip(), updated_at=datetime.utcnow(),
+        ))
+        n += 1
+    return n
+
+
+def rebuild_if_empty():
+    """Primeira subida com as etiquetas: converte os marcadores antigos dos recorrentes."""
+    has_tags = db.session.execute(select(literal(1)).select_from(Tag).limit(1)).first()
+    if not has_tags and tag_legacy_recurring():
+        db.session.commit()
+
+
+# ---------------- autocompletar ----------------
+def counts() -> list:
+    """[(nome, lançamentos)] das etiquetas da casa, mais usadas primeiro (em cache)."""
+    def compute():
+        tt = TransactionTag
+        return [tuple(r) for r in db.session.execute(
+            select(Tag.name, func.count(tt.transaction_id))
+            .join(tt, tt.tag_id == Tag.id)
+            .group_by(Tag.name)
+            .order_by(func.count(tt.transaction_id).desc(), Tag.name)
+        )]
+    return cached(("tag_counts",), compute)
+
+
+def suggest(prefix: str = "", limit: int = 20) -> list:
+    """Etiquetas que começam com `prefix` (ou contêm, se faltar), para o autocompletar."""
+    prefix = (normalize(prefix) or [""])[0]
+    rows = counts()
+    starts = [r for r in rows if r[0].startswith(prefix)]
+    if len(starts) < limit:
+        starts += [r for r in rows if prefix in r[0] and not r[0].startswith(prefix)]
+    return starts[:limit]
+
+
+def init_app(app):
+    if not event.contains(Session, "after_flush", _drop_deleted):
+        event.listen(Session, "after_flush", _drop_deleted)
@@ -0,0 +1,71 @@
+// Service worker: arquivos estáticos em cache (cache-first) e páginas
+// com rede primeiro, caindo para a última cópia quando offline. A tela
+// /app (dados vêm do IndexedDB) abre do cache e se atualiza em segundo plano.
+// PRECACHE e VERSION vêm do manifest do build (assets.precache_urls): um
+// build novo muda a versão e o worker troca os caches.
+const VERSION = {{ version|tojson }};
+const STATIC_CACHE = 'static-' + VERSION;
+const PAGES_CACHE = 'pages-' + VERSION;
+// Bootstrap do CDN (sem `python -m app.assets vendor`) entra no cache na primeira vez que é usado
+const PRECACHE = {{ precache|tojson }};
+const SHELL_PAGES = ['/dashboard', '/transactions', '/transactions/new'];
+const APP_SHELL = '/app';
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(caches.open(STATIC_CACHE).then((c) => c.addAll(PRECACHE)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys.filter((k) => !k.endsWith(VERSION)).map((k) => caches.delete(k))))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const req = event.request;
+  if (req.method !== 'GET') return;
+  const url = new URL(req.url);
+
+  // API de sincronização: sempre rede (o IndexedDB é o cache dela)
+  if (url.pathname.startsWith('/api/')) return;
+
+  if (url.pathname.startsWith('/static/') || url.origin !== self.location.origin) {
+    event.respondWith(
+      caches.match(req).then((hit) => hit || fetch(req).then((resp) => {
+        if (resp.ok) {
+          const copy = resp.clone();
+          caches.open(STATIC_CACHE).then((c) => c.put(req, copy));
+        }
+        return resp;
+      }))
+    );
+    return;
+  }
+
+  if (req.mode === 'navigate' && url.pathname === APP_SHELL) {
+    const fresh = fetch(req).then((resp) => {
+      if (resp.ok && !resp.redirected) {
+        const copy = resp.clone();
+        caches.open(PAGES_CACHE).then((c) => c.put(APP_SHELL, copy));
+      }
+      return resp;
+    });
+    event.waitUntil(fresh.catch(() => {}));
+    event.respondWith(caches.match(APP_SHELL).then((hit) => hit || fresh));
+    return;
+  }
+
+  if (req.mode === 'navigate' && SHELL_PAGES.includes(url.pathname)) {
+    event.respondWith(
+      fetch(req).then((resp) => {
+        if (resp.ok && !resp.redirected) {
+          const copy = resp.clone();
+          caches.open(PAGES_CACHE).then((c) => c.put(url.pathname, copy));
+        }
+        return resp;
+      }).catch(() => caches.match(url.pathname))
+    );
+  }
+});
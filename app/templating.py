@@ -0,0 +1,52 @@
+"""Ajustes de desempenho do Jinja.
+
+- Bytecode dos templates compilados fica em disco (JINJA_CACHE_DIR), então
+  workers novos não recompilam os templates a cada boot. O nome dos arquivos
+  leva uma assinatura dos filtros (quais recebem o contexto): o bytecode
+  embute a forma de chamar cada filtro, e o checksum do Jinja só olha o
+  texto do template.
+- `{% cache "nome", chave1, chave2 %}...{% endcache %}` guarda o HTML do
+  trecho no cache em memória (cache.py): por casa, invalidado por qualquer
+  gravação e com validade de FRAGMENT_TTL segundos. A chave precisa conter
+  tudo de que o trecho depende (perfil do usuário, mês, versão dos dados).
+"""
+import hashlib
+import os
+import tempfile
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from .cache import cached
+
+FRAGMENT_TTL = int(os.getenv("FRAGMENT_TTL", "300"))
+
+
+class FragmentCacheExtension(Extension):
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        call = self.call_method("_render", [nodes.List(key)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        return cached(("fragment",) + tuple(str(k) for k in key), caller, ttl=FRAGMENT_TTL)
+
+
+def _filters_signature(env):
+    parts = sorted(f"{name}:{getattr(fn, 'jinja_pass_arg', '')}" for name, fn in env.filters.items())
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:10]
+
+
+def init_app(app):
+    """Chamar depois de registrar os filtros do app."""
+    folder = os.getenv("JINJA_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "finance_jinja")
+    os.makedirs(folder, exist_ok=True)
+    pattern = f"__jinja2_{_filters_signature(app.jinja_env)}_%s.cache"
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(folder, pattern)
+    app.jinja_env.add_extension(FragmentCacheExtension)
@@ -0,0 +1,95 @@
+"""Separação de dados por casa (household).
+
+Todo modelo com o mixin HouseholdScoped recebe, em toda consulta ORM
+(SELECT, UPDATE e DELETE) feita durante uma requisição logada, o filtro
+`household_id = <casa do usuário>`, aplicado num único lugar
+(evento do_orm_execute). Objetos novos recebem a casa no flush.
+
+Fora de requisição (CLI, seed) não há filtro. Consultas que precisam ver
+todas as casas (ex.: username é único no sistema) usam
+`.execution_options(all_households=True)`.
+
+Atenção: INSERT ... SELECT e SQL textual não passam pelo filtro; quem usa
+precisa filtrar por `current_household_id()` explicitamente.
+"""
+import click
+from flask import g, has_request_context, session
+from flask.cli import with_appcontext
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from . import db
+from .dbutil import is_postgres
+from .models import DEFAULT_HOUSEHOLD_ID, Household, HouseholdScoped, User, seed_household
+
+
+def current_household_id():
+    """Casa da requisição atual, ou None fora de requisição/antes do login."""
+    if not has_request_context():
+        return None
+    return g.get("household_id")
+
+
+def household_for_insert() -> int:
+    return current_household_id() or DEFAULT_HOUSEHOLD_ID
+
+
+def _load_household():
+    hid = session.get("household_id")
+    if hid is None and session.get("user_id"):
+        # sessões abertas antes da separação por casa
+        hid = DEFAULT_HOUSEHOLD_ID
+    g.household_id = hid
+
+
+def _scope_statement(state):
+    if not (state.is_select or state.is_update or state.is_delete):
+        return
+    if state.is_column_load or state.execution_options.get("all_households"):
+        return
+    hid = current_household_id()
+    if hid is None:
+        return
+    state.statement = state.statement.options(
+        with_loader_criteria(HouseholdScoped, lambda cls: cls.household_id == hid, include_aliases=True)
+    )
+
+
+def _stamp_new_objects(session, flush_context, instances):
+    hid = current_household_id()
+    if hid is None:
+        return
+    for obj in session.new:
+        if isinstance(obj, HouseholdScoped) and obj.household_id is None:
+            obj.household_id = hid
+
+
+@click.command("household-create")
+@click.argument("name")
+@click.option("--admin-username", required=True)
+@click.option("--admin-password", required=True)
+@click.option("--admin-name", default="Administrador")
+@with_appcontext
+def household_create_command(name, admin_username, admin_password, admin_name):
+    """Cria uma nova casa com categorias/contas padrão e um admin."""
+    if User.query.filter_by(username=admin_username).first():
+        raise click.ClickException(f"Usuário '{admin_username}' já existe.")
+    if is_postgres():
+        # a casa padrão é criada com id explícito: o sequence continua depois da maior
+        db.session.execute(text("SELECT setval(pg_get_serial_sequence('households', 'id'), MAX(id)) FROM households"))
+    h = Household(name=name)
+    db.session.add(h)
+    db.session.flush()
+    u = User(household_id=h.id, name=admin_name, username=admin_username, role="admin", is_active=True, password_hash="")
+    u.set_password(admin_password)
+    db.session.add(u)
+    seed_household(h.id)
+    click.echo(f"Casa {h.id} ({name}) criada com admin '{admin_username}'.")
+
+
+def init_app(app):
+    app.before_request(_load_household)
+    app.cli.add_command(household_create_command)
+    if not event.contains(Session, "do_orm_execute", _scope_statement):
+        event.listen(Session, "do_orm_execute", _scope_statement)
+        event.listen(Session, "before_flush", _stamp_new_objects)
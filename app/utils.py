@@ -1,6 +1,7 @@
 from datetime import date, datetime
 from functools import wraps
 from flask import session, redirect, url_for, flash, request
+from jinja2 import pass_context
 
 def month_now() -> str:
     return datetime.now().strftime("%Y-%m")
@@ -15,6 +16,20 @@ def next_month_first_day(ym: str) -> date:
         return date(y + 1, 1, 1)
     return date(y, m + 1, 1)
 
+def parse_amount(raw) -> float:
+    """Valor digitado: "12,50", "1.234,56", "1,234.56" ou número.
+
+    Com os dois separadores, o último é o decimal; repetido, é de milhar.
+    """
+    if isinstance(raw, (int, float)):
+        return float(raw)
+    text = str(raw).strip().replace(" ", "")
+    if "," in text and "." in text:
+        text = text.replace("." if text.rfind(",") > text.rfind(".") else ",", "")
+    elif text.count(",") > 1 or text.count(".") > 1:
+        text = text.replace("," if "," in text else ".", "")
+    return float(text.replace(",", "."))
+
 def login_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
@@ -36,19 +51,56 @@ def admin_required(fn):
         return fn(*args, **kwargs)
     return wrapper
 
-def format_currency(value):
-    """Formata números como moeda brasileira (R$ 1.234,56).
+# símbolo, separador de milhar, separador decimal
+CURRENCY_FORMATS = {
+    "BRL": ("R$", ".", ","),
+    "USD": ("US$", ",", "."),
+    "EUR": ("€", ".", ","),
+    "GBP": ("£", ",", "."),
+    "ARS": ("AR$", ".", ","),
+}
+
+def _default_currency() -> str:
+    from flask import current_app, has_app_context
+    return current_app.config.get("REPORT_CURRENCY", "BRL") if has_app_context() else "BRL"
+
+def format_currency(value, currency="BRL"):
+    """Formata números como moeda (R$ 1.234,56, US$ 1,234.56...).
 
-    Usado como filtro Jinja: {{ valor|currency }}.
-    Funciona mesmo se o valor vier como None ou string vazia.
+    Funciona mesmo se o valor vier como None ou string vazia. Nos templates
+    é o filtro `currency` (ver currency_filter).
     """
+    fmt = CURRENCY_FORMATS.get(currency)
+    if fmt is None:
+        currency = str(currency or "BRL").upper()
+        fmt = CURRENCY_FORMATS.get(currency, (currency, ".", ","))
+    symbol, thousands, decimal = fmt
     try:
         if value is None:
             value = 0
         value = float(value)
     except (TypeError, ValueError):
-        return "R$ 0,00"
-    # Usa separador de milhar com ponto e decimal com vírgula
-    formatted = f"{value:,.2f}"
-    formatted = formatted.replace(",", "X").replace(".", ",").replace("X", ".")
-    return f"R$ {formatted}"
+        value = 0.0
+    text = f"{value:,.2f}"
+    if (thousands, decimal) != (",", "."):
+        # 1,234.56 -> 1.234,56. Não é um caminho "otimizado": é a formatação
+        # de sempre. str.translate e formatação inteira (divmod dos centavos)
+        # foram medidas e saíram mais lentas que o f-string em C + replace, e a
+        # inteira ainda arredonda diferente nos meio-centavos (648827.095).
+        text = text.replace(",", "\0").replace(".", decimal).replace("\0", thousands)
+    return f"{symbol} {text}"
+
+@pass_context
+def currency_filter(context, value, currency=None):
+    """{{ valor|currency }} ou {{ t.amount|currency(t.currency) }}.
+
+    O padrão é `report_currency` do contexto do template (context processor
+    de currency.py, lido uma vez por página), não uma consulta por célula.
+    """
+    return format_currency(value, currency or context.get("report_currency") or "BRL")
+
+def excel_currency_format(currency=None) -> str:
+    """number_format do openpyxl com o símbolo da moeda (o Excel aplica o separador do locale)."""
+    currency = (currency or _default_currency()).upper()
+    symbol = CURRENCY_FORMATS.get(currency, (currency,))[0]
+    return f'"{symbol}" #,##0.00;-"{symbol}" #,##0.00'
@@ -0,0 +1,157 @@
+"""Leituras e gravações simultâneas no SQLite, com e sem o perfil ajustado.
+
+Threads leitoras abrem dashboard, lançamentos e relatórios enquanto threads
+escritoras gravam lançamentos, durante alguns segundos. Sai a vazão e a
+latência de cada lado e quantas respostas falharam (5xx, em geral
+"database is locked"). Veja app/sqlite_profile.py.
+
+Exemplos:
+    python -m bench.concurrency                          # perfil ajustado x padrão
+    python -m bench.concurrency --profile on --readers 8 --writers 4 --seconds 20
+    python -m bench.concurrency --db /tmp/b1m.db --out concurrency.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+from .datagen import SIZES, generate
+
+
+def _summary(latencies: list, seconds: float) -> dict:
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"count": 0, "per_s": 0.0, "median_ms": None, "p95_ms": None}
+    return {
+        "count": len(latencies),
+        "per_s": round(len(latencies) / seconds, 1),
+        "median_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+    }
+
+
+def run(app, readers: int, writers: int, seconds: float) -> dict:
+    month = date.today().strftime("%Y-%m")
+    urls = [f"/dashboard?month={month}", f"/transactions?month={month}", f"/reports?month={month}"]
+    results = {"read": [], "write": []}
+    errors = []
+    lock = threading.Lock()
+    deadline = [0.0]
+    start = threading.Barrier(readers + writers, action=lambda: deadline.__setitem__(0, time.perf_counter() + seconds))
+
+    def worker(kind: str, n: int):
+        client = app.test_client()
+        client.post("/login", data={"username": "admin", "password": "admin123"})
+        start.wait()
+        i = n
+        mine, failed = [], []
+        while time.perf_counter() < deadline[0]:
+            t0 = time.perf_counter()
+            try:
+                if kind == "read":
+                    resp = client.get(urls[i % len(urls)])
+                else:
+                    resp = client.post("/transactions/new", data={
+                        "txn_type": "expense", "category_id": "1", "account_id": "1",
+                        "amount": f"{1 + i % 97}.50", "description": f"bench {n}/{i}",
+                        "txn_date": date.today().isoformat(),
+                    })
+                ok = resp.status_code < 500
+                if not ok:
+                    failed.append(f"{kind}: HTTP {resp.status_code}")
+            except Exception as e:  # noqa: BLE001 - contamos qualquer falha
+                ok = False
+                failed.append(f"{kind}: {type(e).__name__}: {str(e)[:120]}")
+            if ok:
+                mine.append((time.perf_counter() - t0) * 1000)
+            i += 1
+        with lock:
+            results[kind].extend(mine)
+            errors.extend(failed)
+
+    threads = [threading.Thread(target=worker, args=("read", n)) for n in range(readers)]
+    threads += [threading.Thread(target=worker, args=("write", n)) for n in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return {
+        "reads": _summary(results["read"], seconds),
+        "writes": _summary(results["write"], seconds),
+        "errors": len(errors),
+        "locked": sum("locked" in e for e in errors),
+        "sample_errors": sorted(set(errors))[:5],
+    }
+
+
+def _single(args) -> dict:
+    os.environ["SQLITE_TUNING"] = "1" if args.profile == "on" else "0"
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    os.environ.setdefault("EXPORT_FOLDER", tempfile.mkdtemp(prefix="finance_bench_exports_"))
+
+    from app import create_app, db
+    app = create_app()
+    with app.app_context():
+        # journal_mode fica gravado no arquivo: o modo padrão volta para DELETE
+        mode = "WAL" if args.profile == "on" else "DELETE"
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql(f"PRAGMA journal_mode={mode}")
+        pool = db.engine.pool
+        pool_size = pool.size() if hasattr(pool, "size") else None
+
+    out = run(app, args.readers, args.writers, args.seconds)
+    return {
+        "profile": args.profile, "journal_mode": mode, "pool_size": pool_size,
+        "readers": args.readers, "writers": args.writers, "seconds": args.seconds, **out,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leituras x gravações simultâneas no SQLite.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="10k")
+    parser.add_argument("--db", help="arquivo SQLite (gerado se não existir)")
+    parser.add_argument("--profile", choices=["on", "off", "both"], default="both")
+    parser.add_argument("--readers", type=int, default=6)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--out", help="grava o JSON neste arquivo (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    args.db = os.path.abspath(args.db or os.path.join(tempfile.mkdtemp(prefix="finance_bench_"), "bench.db"))
+    if not os.path.exists(args.db):
+        os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+        from app import create_app
+        generate(create_app(), SIZES[args.size])
+
+    if args.profile == "both":
+        # cada perfil num processo novo: as opções do engine são lidas no create_app
+        runs = []
+        for profile in ("on", "off"):
+            cmd = [sys.executable, "-m", "bench.concurrency", "--db", args.db, "--profile", profile,
+                   "--readers", str(args.readers), "--writers", str(args.writers), "--seconds", str(args.seconds)]
+            proc = subprocess.run(cmd, capture_output=True, text=True, cwd=Path(__file__).resolve().parent.parent)
+            if proc.returncode != 0:
+                raise SystemExit(proc.stderr)
+            runs.append(json.loads(proc.stdout))
+        report = {"size": args.size, "runs": runs}
+    else:
+        report = _single(args)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
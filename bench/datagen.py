@@ -0,0 +1,172 @@
+"""Gerador determinístico de dados sintéticos para o benchmark.
+
+Preenche os modelos existentes (categorias, contas, orçamentos padrão,
+exceções por mês, recorrências e lançamentos) a partir de uma semente fixa,
+então duas execuções com o mesmo tamanho produzem exatamente a mesma base.
+
+Uso direto:
+    python -m bench.datagen --size 10k --db /tmp/bench.db
+"""
+import argparse
+import os
+import random
+from datetime import date, timedelta
+
+SIZES = {
+    "10k": 10_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+
+EXTRA_EXPENSE_CATEGORIES = [
+    "Farmácia", "Pets", "Assinaturas", "Presentes", "Viagem", "Manutenção casa",
+    "Educação", "Vestuário", "Impostos", "Seguros", "Academia", "Doações",
+]
+EXTRA_ACCOUNTS = [("Conta Conjunta", "checking"), ("Cartão Adicional", "credit")]
+
+DESCRIPTIONS = [
+    "Supermercado", "Padaria", "Posto", "Uber", "Farmácia", "Restaurante",
+    "Conta de luz", "Internet", "Streaming", "Loja", "Feira", "Pix",
+]
+
+CHUNK = 20_000
+
+
+def month_range(end: date, months: int):
+    """Lista de (ano, mês) terminando em `end` (inclusive)."""
+    y, m = end.year, end.month
+    out = []
+    for _ in range(months):
+        out.append((y, m))
+        m -= 1
+        if m == 0:
+            y, m = y - 1, 12
+    return list(reversed(out))
+
+
+def generate(app, rows: int, seed: int = 42, months: int = 36, today: date = None):
+    """Gera `rows` lançamentos espalhados pelos últimos `months` meses."""
+    from sqlalchemy import insert
+
+    from app import db
+    from app.models import Account, Budget, BudgetTemplate, Category, RecurringTransaction, Transaction
+    from app.alerts import rebuild_spend
+    from app.ledger import rebuild_postings
+
+    rnd = random.Random(seed)
+    today = today or date.today()
+
+    with app.app_context():
+        existing = {c.name for c in Category.query.all()}
+        for name in EXTRA_EXPENSE_CATEGORIES:
+            if name not in existing:
+                db.session.add(Category(name=name, kind="expense", is_active=True))
+        existing = {a.name for a in Account.query.all()}
+        for name, kind in EXTRA_ACCOUNTS:
+            if name not in existing:
+                db.session.add(Account(name=name, kind=kind, is_active=True))
+        db.session.commit()
+
+        expense_ids = [c.id for c in Category.query.filter_by(kind="expense").order_by(Category.id).all()]
+        income_ids = [c.id for c in Category.query.filter_by(kind="income").order_by(Category.id).all()]
+        account_ids = [a.id for a in Account.query.order_by(Account.id).all()]
+
+        templates = {t.category_id: t for t in BudgetTemplate.query.all()}
+        for cid in expense_ids:
+            amount = float(rnd.randrange(200, 3000, 50))
+            if cid in templates:
+                templates[cid].planned_amount = amount
+            else:
+                db.session.add(BudgetTemplate(category_id=cid, planned_amount=amount))
+
+        span = month_range(today, months)
+        for y, m in span:
+            for cid in rnd.sample(expense_ids, k=min(3, len(expense_ids))):
+                db.session.add(Budget(
+                    month=f"{y:04d}-{m:02d}", category_id=cid,
+                    planned_amount=float(rnd.randrange(200, 3000, 50)),
+                ))
+
+        for i in range(6):
+            db.session.add(RecurringTransaction(
+                name=f"Recorrente {i + 1}",
+                txn_type="income" if i == 0 else "expense",
+                category_id=income_ids[0] if i == 0 else rnd.choice(expense_ids),
+                account_id=account_ids[0],
+                amount=float(rnd.randrange(100, 5000, 10)),
+                day_of_month=rnd.randint(1, 28),
+                description="",
+                is_active=True,
+                last_generated_month="",
+            ))
+        db.session.commit()
+
+        first_day = date(span[0][0], span[0][1], 1)
+        total_days = (today - first_day).days + 1
+        stmt = insert(Transaction)
+        batch = []
+        for i in range(rows):
+            is_income = rnd.random() < 0.12
+            d = first_day + timedelta(days=rnd.randrange(total_days))
+            row = {
+                "txn_date": d,
+                "created_at": d,
+                "txn_type": "income" if is_income else "expense",
+                "category_id": rnd.choice(income_ids if is_income else expense_ids),
+                "account_id": rnd.choice(account_ids),
+                "amount": round(rnd.uniform(5, 6000 if is_income else 800), 2),
+                "description": f"{rnd.choice(DESCRIPTIONS)} #{i}",
+                "receipt_filename": "",
+                "to_account_id": None,
+            }
+            if i % 50 == 49:
+                # ~2% transferências entre contas (ex.: pagamento do cartão)
+                row["txn_type"] = "transfer"
+                row["to_account_id"] = account_ids[(account_ids.index(row["account_id"]) + 1) % len(account_ids)]
+            batch.append(row)
+            if len(batch) >= CHUNK:
+                db.session.execute(stmt, batch)
+                db.session.commit()
+                batch = []
+        if batch:
+            db.session.execute(stmt, batch)
+            db.session.commit()
+
+        # insert em lote não passa pelo flush do ORM: gera os movimentos e o acumulado de uma vez
+        rebuild_postings()
+        rebuild_spend()
+        db.session.commit()
+
+
+def sample_csv(rows: int, seed: int = 7, today: date = None) -> bytes:
+    """CSV no layout aceito por /import (date, description, amount, type)."""
+    rnd = random.Random(seed)
+    today = today or date.today()
+    lines = ["date,description,amount,type"]
+    for i in range(rows):
+        d = today - timedelta(days=rnd.randrange(28))
+        amount = round(rnd.uniform(5, 900), 2)
+        typ = "income" if rnd.random() < 0.1 else "expense"
+        lines.append(f"{d.isoformat()},{rnd.choice(DESCRIPTIONS)} import {i},{amount},{typ}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos para o benchmark.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="10k")
+    parser.add_argument("--rows", type=int, help="sobrescreve o número de lançamentos do --size")
+    parser.add_argument("--db", required=True, help="arquivo SQLite ou URL do banco")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    url = args.db if "://" in args.db else f"sqlite:///{os.path.abspath(args.db)}"
+    os.environ["DATABASE_URL"] = url
+
+    from app import create_app
+    app = create_app()
+    generate(app, args.rows or SIZES[args.size], seed=args.seed)
+    print(f"ok: {args.rows or SIZES[args.size]} lançamentos em {url}")
+
+
+if __name__ == "__main__":
+    main()
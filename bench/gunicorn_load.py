@@ -0,0 +1,70 @@
+# Configuração do gunicorn usada por bench/load.py.
+#
+# Carrega o gunicorn.conf.py da raiz (mesmos padrões de produção) e acrescenta,
+# em cada worker, contadores do pool de conexões. No fim do worker eles vão
+# para LOAD_STATS_DIR/<pid>.json, que o bench soma.
+import json
+import os
+import threading
+from pathlib import Path
+
+_base = {"__file__": str(Path(__file__).resolve().parent.parent / "gunicorn.conf.py")}
+exec(Path(_base["__file__"]).read_text(encoding="utf-8"), _base)
+
+workers = _base["workers"]
+threads = _base["threads"]
+timeout = _base["timeout"]
+preload_app = _base["preload_app"]
+graceful_timeout = 10
+accesslog = None
+
+_stats = {"checkouts": 0, "overflow_checkouts": 0, "at_limit": 0, "peak_checked_out": 0,
+          "timeouts": 0, "errors": 0, "pool_size": None, "max_overflow": None}
+_lock = threading.Lock()
+
+
+def _on_checkout(engine):
+    pool = engine.pool
+
+    def listener(dbapi_connection, connection_record, connection_proxy):
+        size = pool.size()
+        limit = size + max(pool._max_overflow, 0)
+        n = pool.checkedout()
+        with _lock:
+            _stats["checkouts"] += 1
+            _stats["peak_checked_out"] = max(_stats["peak_checked_out"], n)
+            if n > size:
+                _stats["overflow_checkouts"] += 1
+            if n >= limit:
+                _stats["at_limit"] += 1  # pool cheio: o próximo pedido espera
+    return listener
+
+
+def _on_exception(sender, exception, **extra):
+    from sqlalchemy.exc import TimeoutError as PoolTimeout
+    with _lock:
+        _stats["errors"] += 1
+        if isinstance(exception, PoolTimeout):
+            _stats["timeouts"] += 1
+
+
+def post_fork(server, worker):
+    _base["post_fork"](server, worker)
+    from flask import got_request_exception
+    from sqlalchemy import event
+
+    from app import db
+    app = worker.app.wsgi()
+    with app.app_context():
+        engine = db.engine
+    _stats["pool_size"] = engine.pool.size() if hasattr(engine.pool, "size") else None
+    _stats["max_overflow"] = getattr(engine.pool, "_max_overflow", None)
+    if hasattr(engine.pool, "checkedout"):
+        event.listen(engine, "checkout", _on_checkout(engine))
+    got_request_exception.connect(_on_exception, app, weak=False)
+
+
+def worker_exit(server, worker):
+    folder = os.getenv("LOAD_STATS_DIR")
+    if folder:
+        Path(folder, f"{os.getpid()}.json").write_text(json.dumps(_stats), encoding="utf-8")
@@ -0,0 +1,358 @@
+"""Teste de carga com o gunicorn de verdade, varrendo workers, threads e pool.
+
+Para cada combinação de --workers x --threads x --pool sobe o gunicorn
+(wsgi:app, com bench/gunicorn_load.py por cima do gunicorn.conf.py) numa
+porta local, contra um banco já populado, e para cada nível de --users
+roda usuários virtuais em paralelo por --seconds. Cada usuário faz login e
+repete uma sessão mista: dashboard, lançamentos, novo lançamento,
+relatórios e exportações (pesos em SCENARIO).
+
+Sai, por rodada: vazão (respostas/s), latência (mediana, p95, p99, geral e
+por ação), respostas com erro e os eventos do pool somados dos workers:
+pico de conexões em uso, checkouts acima do pool_size (overflow), checkouts
+com o pool no limite (pool_size + max_overflow) e esperas que estouraram
+DB_POOL_TIMEOUT. No fim, `recommended` é a rodada de maior vazão sem erros,
+sem timeout de pool e com p95 dentro de --slo-ms.
+
+Exemplos:
+    python -m bench.load                                   # SQLite 10k gerado na hora
+    python -m bench.load --workers 1,2,4 --threads 2,4,8 --pool auto,5 --users 8,16,32
+    python -m bench.load --database-url postgresql://... --seconds 30 --out load.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from urllib.parse import urlencode
+
+from .datagen import SIZES, generate
+
+ROOT = Path(__file__).resolve().parent.parent
+SCENARIO = (  # (ação, peso)
+    ("dashboard", 30),
+    ("transactions", 20),
+    ("new_transaction", 20),
+    ("reports", 15),
+    ("export_csv", 10),
+    ("export_xlsx", 5),
+)
+
+
+def _months(count: int = 6) -> list:
+    y, m = date.today().year, date.today().month
+    out = []
+    for _ in range(count):
+        out.append(f"{y:04d}-{m:02d}")
+        y, m = (y, m - 1) if m > 1 else (y - 1, 12)
+    return out
+
+
+def _action(kind: str, rnd: random.Random, months: list, n: int):
+    """(método, caminho, formulário) de uma ação da sessão."""
+    month = rnd.choice(months)
+    if kind == "dashboard":
+        return "GET", f"/dashboard?month={month}", None
+    if kind == "transactions":
+        return "GET", f"/transactions?month={month}", None
+    if kind == "reports":
+        return "GET", f"/reports?month={month}", None
+    if kind == "export_csv":
+        return "GET", f"/reports/export/csv?month={month}", None
+    if kind == "export_xlsx":
+        return "GET", f"/reports/export/xlsx?month={month}", None
+    return "POST", "/transactions/new", {
+        "txn_type": "expense", "category_id": "1", "account_id": "1",
+        "amount": f"{1 + n % 97}.90", "description": f"carga {n}",
+        "txn_date": date.today().isoformat(),
+    }
+
+
+class _Client:
+    """Conexão keep-alive com o cookie de sessão, sem seguir redirects."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.cookie = None
+        self.conn = None
+
+    def call(self, method: str, path: str, form: dict = None) -> int:
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=180)
+        headers = {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+        cookie = resp.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return resp.status
+
+
+def _percentile(values: list, p: float):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * p))], 2)
+
+
+def _latency(values: list) -> dict:
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "median_ms": round(statistics.median(values), 2) if values else None,
+        "p95_ms": _percentile(values, 0.95),
+        "p99_ms": _percentile(values, 0.99),
+    }
+
+
+def drive(port: int, users: int, seconds: float, warmup: float, seed: int = 7) -> dict:
+    """Usuários virtuais contra o servidor; mede só depois do aquecimento."""
+    kinds = [k for k, _ in SCENARIO]
+    weights = [w for _, w in SCENARIO]
+    months = _months()
+    samples = []  # (ação, status, ms)
+    errors = []
+    lock = threading.Lock()
+    window = {}
+    start = threading.Barrier(users, action=lambda: window.update(
+        begin=time.perf_counter() + warmup, end=time.perf_counter() + warmup + seconds,
+    ))
+
+    def user(i: int):
+        rnd = random.Random(seed * 1000 + i)
+        client = _Client(port)
+        mine, failed = [], []
+        try:
+            client.call("POST", "/login", {"username": "admin", "password": "admin123"})
+        except Exception as e:  # noqa: BLE001
+            failed.append(f"login: {type(e).__name__}")
+        start.wait()
+        n = i
+        while True:
+            t0 = time.perf_counter()
+            if t0 >= window["end"]:
+                break
+            kind = rnd.choices(kinds, weights)[0]
+            method, path, form = _action(kind, rnd, months, n)
+            try:
+                status = client.call(method, path, form)
+            except Exception as e:  # noqa: BLE001 - conexão recusada, timeout etc.
+                status = None
+                if t0 >= window["begin"]:
+                    failed.append(f"{kind}: {type(e).__name__}")
+            if t0 >= window["begin"]:
+                mine.append((kind, status, (time.perf_counter() - t0) * 1000))
+            n += users
+        with lock:
+            samples.extend(mine)
+            errors.extend(failed)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    ok = [ms for _, status, ms in samples if status is not None and status < 500]
+    by_kind = {}
+    for kind in kinds:
+        by_kind[kind] = _latency([ms for k, status, ms in samples if k == kind and status is not None and status < 500])
+    failed = [s for s in samples if s[1] is None or s[1] >= 500]
+    return {
+        "users": users,
+        "throughput_rps": round(len(ok) / seconds, 1),
+        **_latency(ok),
+        "errors": len(failed),
+        "error_statuses": sorted({str(s[1]) for s in failed}),
+        "sample_errors": sorted(set(errors))[:5],
+        "by_action": by_kind,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(proc, port: int, timeout: float = 90):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn saiu com código {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/login")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.3)
+    raise RuntimeError("gunicorn não respondeu a tempo")
+
+
+def _pool_stats(folder: Path) -> dict:
+    total = {"checkouts": 0, "overflow_checkouts": 0, "at_limit": 0, "timeouts": 0, "app_errors": 0,
+             "peak_checked_out": 0, "workers_reported": 0}
+    for f in folder.glob("*.json"):
+        s = json.loads(f.read_text(encoding="utf-8"))
+        total["workers_reported"] += 1
+        for key in ("checkouts", "overflow_checkouts", "at_limit", "timeouts"):
+            total[key] += s[key]
+        total["app_errors"] += s["errors"]
+        total["peak_checked_out"] = max(total["peak_checked_out"], s["peak_checked_out"])
+        total["pool_size"], total["max_overflow"] = s["pool_size"], s["max_overflow"]
+        f.unlink()
+    return total
+
+
+def run_config(args, database_url: str, workers: int, threads: int, pool: str) -> list:
+    """Sobe o gunicorn com a combinação e roda cada nível de usuários (um servidor por nível)."""
+    out = []
+    for users in args.users:
+        port = _free_port()
+        stats_dir = Path(tempfile.mkdtemp(prefix="finance_load_stats_"))
+        env = {
+            **os.environ,
+            "DATABASE_URL": database_url,
+            "GUNICORN_THREADS": str(threads),
+            "DB_POOL_SIZE": str(threads if pool == "auto" else int(pool)),
+            "DB_MAX_OVERFLOW": str(args.max_overflow),
+            "DB_POOL_TIMEOUT": str(args.pool_timeout),
+            "LOAD_STATS_DIR": str(stats_dir),
+            "EXPORT_FOLDER": tempfile.mkdtemp(prefix="finance_load_exports_"),
+        }
+        cmd = [
+            sys.executable, "-m", "gunicorn", "wsgi:app", "-c", str(ROOT / "bench" / "gunicorn_load.py"),
+            "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--threads", str(threads),
+            "--log-level", "warning",
+        ]
+        log = open(stats_dir / "gunicorn.log", "w+", encoding="utf-8")
+        proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            _wait_ready(proc, port)
+            result = drive(port, users, args.seconds, args.warmup)
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        log.seek(0)
+        pool_errors = sum("QueuePool limit" in line for line in log)
+        log.close()
+        stats = _pool_stats(stats_dir)
+        stats["timeouts"] = max(stats["timeouts"], pool_errors)
+        row = {"workers": workers, "threads": threads, "pool": pool, **result, "pool_events": stats}
+        out.append(row)
+        print(_line(row), file=sys.stderr, flush=True)
+    return out
+
+
+def _line(r: dict) -> str:
+    p = r["pool_events"]
+    return (
+        f"w={r['workers']:<2} t={r['threads']:<2} pool={r['pool']:<4} users={r['users']:<3} "
+        f"{r['throughput_rps']:>7.1f} req/s  p50={r['median_ms'] or 0:>7.1f}ms  p95={r['p95_ms'] or 0:>7.1f}ms  "
+        f"erros={r['errors']:<3} pico={p['peak_checked_out']:<3} overflow={p['overflow_checkouts']:<4} "
+        f"no_limite={p['at_limit']:<4} timeouts={p['timeouts']}"
+    )
+
+
+def recommend(runs: list, slo_ms: float):
+    """Maior vazão sem erros, sem timeout de pool e com p95 <= slo_ms (menos processos no empate)."""
+    good = [
+        r for r in runs
+        if r["errors"] == 0 and r["pool_events"]["timeouts"] == 0 and r["p95_ms"] is not None and r["p95_ms"] <= slo_ms
+    ]
+    if not good:
+        return None
+    best = max(good, key=lambda r: (r["throughput_rps"], -r["workers"] * r["threads"]))
+    return {k: best[k] for k in ("workers", "threads", "pool", "users", "throughput_rps", "p95_ms")}
+
+
+def _csv_ints(text: str) -> list:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carga com gunicorn: varre workers, threads e pool.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="10k")
+    parser.add_argument("--db", help="arquivo SQLite (gerado se não existir)")
+    parser.add_argument("--database-url", help="banco já populado (ex.: Postgres); ignora --db")
+    parser.add_argument("--workers", type=_csv_ints, default=[1, 2, 4])
+    parser.add_argument("--threads", type=_csv_ints, default=[2, 4, 8])
+    parser.add_argument("--pool", default="auto",
+                        help="DB_POOL_SIZE, separados por vírgula; auto = uma conexão por thread")
+    parser.add_argument("--max-overflow", type=int, default=int(os.getenv("DB_MAX_OVERFLOW", "10")))
+    parser.add_argument("--pool-timeout", type=int, default=5, help="DB_POOL_TIMEOUT dos workers (s)")
+    parser.add_argument("--users", type=_csv_ints, default=[8, 16, 32], help="usuários simultâneos")
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--slo-ms", type=float, default=500, help="p95 máximo aceito na recomendação")
+    parser.add_argument("--out", help="grava o JSON neste arquivo (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        raise SystemExit("gunicorn não instalado (pip install -r requirements.txt).")
+
+    if args.database_url:
+        database_url = args.database_url
+    else:
+        args.db = os.path.abspath(args.db or os.path.join(tempfile.mkdtemp(prefix="finance_bench_"), "bench.db"))
+        database_url = f"sqlite:///{args.db}"
+        if not os.path.exists(args.db):
+            os.environ["DATABASE_URL"] = database_url
+            from app import create_app
+            generate(create_app(), SIZES[args.size])
+
+    runs = []
+    for workers in args.workers:
+        for threads in args.threads:
+            for pool in [p.strip() for p in args.pool.split(",") if p.strip()]:
+                runs.extend(run_config(args, database_url, workers, threads, pool))
+
+    report = {
+        "size": args.size if not args.database_url else None,
+        "database": database_url.split(":", 1)[0],
+        "seconds": args.seconds,
+        "max_overflow": args.max_overflow,
+        "pool_timeout": args.pool_timeout,
+        "scenario": dict(SCENARIO),
+        "runs": runs,
+        "recommended": recommend(runs, args.slo_ms),
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
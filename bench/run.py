@@ -0,0 +1,265 @@
+"""Benchmark dos endpoints mais usados, via Flask test client.
+
+Para cada endpoint mede latência (mín/mediana/p95), número de queries SQL
+e pico de memória Python (tracemalloc, em uma execução separada para não
+distorcer a latência). O resultado sai em JSON e é comparado com
+bench/thresholds.json e, opcionalmente, com um resultado anterior.
+
+Exemplos:
+    python -m bench.run --size 10k
+    python -m bench.run --size 1m --db /tmp/bench_1m.db --out bench_output.json
+    python -m bench.run --size 10k --baseline bench_prev.json --tolerance 0.25
+
+Sai com código 1 se algum limite for ultrapassado.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from pathlib import Path
+
+from .datagen import SIZES, generate, sample_csv
+
+HERE = Path(__file__).resolve().parent
+METRICS = ("median_ms", "p95_ms", "queries", "peak_kb")
+
+
+def endpoints(month: str):
+    """(nome, método, url, payload) de cada cenário medido."""
+    return [
+        ("dashboard", "GET", f"/dashboard?month={month}", None),
+        ("transactions_list", "GET", f"/transactions?month={month}", None),
+        ("reports", "GET", f"/reports?month={month}", None),
+        ("reports_export_csv", "GET", f"/reports/export/csv?month={month}", None),
+        ("reports_export_xlsx", "GET", f"/reports/export/xlsx?month={month}", None),
+        ("reports_export_pdf", "GET", f"/reports/export/pdf?month={month}", None),
+        ("budgets", "GET", f"/budgets?month={month}", None),
+        ("import_csv", "POST", "/import", "csv"),
+    ]
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+def _clear_exports():
+    # exportações iguais reaproveitam o arquivo (app/singleflight.py); aqui medimos a geração
+    folder = os.environ.get("EXPORT_FOLDER")
+    if folder and os.path.isdir(folder):
+        for f in Path(folder).iterdir():
+            f.unlink()
+
+
+def _request(client, method, url, payload, import_rows):
+    if method == "GET":
+        if "/export/" in url:
+            _clear_exports()
+        return client.get(url)
+    data = {
+        "file": (io.BytesIO(sample_csv(import_rows)), "bench.csv"),
+        "account_name": "Conta Corrente",
+        "do_import": "1",
+    }
+    return client.post(url, data=data, content_type="multipart/form-data")
+
+
+# roda num interpretador novo: mede imports + create_app com o banco já criado
+STARTUP_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+queries = [0]
+event.listen(Engine, "before_cursor_execute", lambda *a: queries.__setitem__(0, queries[0] + 1))
+from app import create_app
+create_app()
+print(json.dumps({
+    "ms": (time.perf_counter() - t0) * 1000,
+    "queries": queries[0],
+    "heavy_modules": sorted(m for m in ("openpyxl", "reportlab") if m in sys.modules),
+}))
+"""
+
+
+def measure_startup(repeat: int):
+    """Boot a frio de um worker (processo novo), como no deploy/restart."""
+    root = str(HERE.parent)
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    timings, last = [], {}
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", STARTUP_SNIPPET], cwd=root, env=env,
+            capture_output=True, text=True, check=True,
+        ).stdout
+        last = json.loads(out.strip().splitlines()[-1])
+        timings.append(last["ms"])
+    timings.sort()
+    return {
+        "endpoint": "startup",
+        "url": None,
+        "status": 200,
+        "runs": repeat,
+        "min_ms": round(timings[0], 2),
+        "median_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        "queries": last["queries"],
+        "peak_kb": None,
+        "heavy_modules": last["heavy_modules"],
+    }
+
+
+def measure(app, repeat: int, import_rows: int, month: str, only=None):
+    from app import db
+
+    client = app.test_client()
+    resp = client.post("/login", data={"username": "admin", "password": "admin123"})
+    if resp.status_code not in (200, 302):
+        raise SystemExit(f"login falhou: HTTP {resp.status_code}")
+
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+
+    results = []
+    for name, method, url, payload in endpoints(month):
+        if only and name not in only:
+            continue
+        # aquecimento (também gera recorrentes do mês, que não deve entrar na medida)
+        status = _request(client, method, url, payload, import_rows).status_code
+
+        timings, queries = [], []
+        for _ in range(repeat):
+            before = counter.count
+            t0 = time.perf_counter()
+            resp = _request(client, method, url, payload, import_rows)
+            timings.append((time.perf_counter() - t0) * 1000)
+            queries.append(counter.count - before)
+            status = resp.status_code
+
+        tracemalloc.start()
+        _request(client, method, url, payload, import_rows)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        timings.sort()
+        results.append({
+            "endpoint": name,
+            "url": url,
+            "status": status,
+            "runs": repeat,
+            "min_ms": round(timings[0], 2),
+            "median_ms": round(statistics.median(timings), 2),
+            "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+            "queries": max(queries),
+            "peak_kb": round(peak / 1024, 1),
+        })
+    return results
+
+
+def check(results, size: str, thresholds: dict, baseline: dict = None, tolerance: float = 0.2):
+    """Lista de regressões: limites absolutos e, se houver, comparação com baseline."""
+    regressions = []
+    limits = thresholds.get(size, {})
+    previous = {}
+    if baseline:
+        previous = {r["endpoint"]: r for r in baseline.get("results", []) if baseline.get("size") == size}
+
+    for r in results:
+        name = r["endpoint"]
+        if r["status"] >= 500:
+            regressions.append({"endpoint": name, "metric": "status", "value": r["status"], "limit": "< 500"})
+        for metric, limit in limits.get(name, {}).items():
+            if r.get(metric) is not None and r[metric] > limit:
+                regressions.append({"endpoint": name, "metric": metric, "value": r[metric], "limit": limit})
+        old = previous.get(name)
+        if old:
+            for metric in METRICS:
+                if old.get(metric) and r.get(metric) is not None and r[metric] > old[metric] * (1 + tolerance):
+                    regressions.append({
+                        "endpoint": name, "metric": metric, "value": r[metric],
+                        "limit": round(old[metric] * (1 + tolerance), 2), "baseline": old[metric],
+                    })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos endpoints principais.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="10k")
+    parser.add_argument("--db", help="arquivo SQLite (reaproveitado se já existir) ou URL do banco já populado")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--import-rows", type=int, default=500, help="linhas do CSV enviado em /import")
+    parser.add_argument("--month", help="mês medido (YYYY-MM); padrão: mês atual")
+    parser.add_argument("--only", nargs="*", help="mede só estes endpoints")
+    parser.add_argument("--out", help="grava o JSON neste arquivo (padrão: stdout)")
+    parser.add_argument("--thresholds", default=str(HERE / "thresholds.json"))
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="folga relativa ao baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    needs_data = True
+    if args.db and "://" in args.db:
+        url, needs_data = args.db, False
+    else:
+        path = os.path.abspath(args.db or os.path.join(tempfile.mkdtemp(prefix="finance_bench_"), "bench.db"))
+        needs_data = not os.path.exists(path)
+        url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("EXPORT_FOLDER", tempfile.mkdtemp(prefix="finance_bench_exports_"))
+
+    t0 = time.perf_counter()
+    from app import create_app
+    app = create_app()
+    startup_ms = (time.perf_counter() - t0) * 1000
+
+    generate_s = None
+    if needs_data:
+        t0 = time.perf_counter()
+        generate(app, SIZES[args.size])
+        generate_s = round(time.perf_counter() - t0, 2)
+
+    month = args.month or date.today().strftime("%Y-%m")
+    results = measure(app, args.repeat, args.import_rows, month, only=args.only)
+    if not args.only or "startup" in args.only:
+        results.append(measure_startup(args.repeat))
+
+    thresholds = json.loads(Path(args.thresholds).read_text(encoding="utf-8")) if args.thresholds else {}
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8")) if args.baseline else None
+    regressions = check(results, args.size, thresholds, baseline, args.tolerance)
+
+    report = {
+        "size": args.size,
+        "rows": SIZES[args.size],
+        "month": month,
+        "database": app.config["SQLALCHEMY_DATABASE_URI"].split("://", 1)[0],
+        "python": platform.python_version(),
+        "startup_ms": round(startup_ms, 2),
+        "generate_s": generate_s,
+        "results": results,
+        "regressions": regressions,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    for r in regressions:
+        print(f"REGRESSÃO {r['endpoint']}.{r['metric']}: {r['value']} > {r['limit']}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
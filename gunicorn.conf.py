@@ -0,0 +1,23 @@
+# Configuração do gunicorn (lida automaticamente a partir da raiz do projeto).
+#
+# Com preload_app o app é criado uma vez no processo master (schema/seed e
+# imports acontecem só ali) e os workers nascem por fork, já aquecidos.
+# create_app() fecha o pool ao final, e o post_fork abaixo garante que
+# nenhum worker reaproveite conexão aberta no master.
+import os
+
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") not in ("0", "false", "False")
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    from app import db
+    app = worker.app.wsgi()
+    with app.app_context():
+        # close=False: só descarta o pool herdado, sem fechar sockets do master
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,53 @@
+"""App com um banco SQLite novo por teste e uma segunda casa ("Outra")."""
+import pytest
+
+from app import cache, create_app, db, diagnostics
+from app.models import Account, Category
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv("EXPORT_FOLDER", str(tmp_path / "exports"))
+    monkeypatch.delenv("DATABASE_REPLICA_URL", raising=False)
+    app = create_app()
+    app.config.update(TESTING=True, UPLOAD_FOLDER=str(tmp_path))
+    # caches são do processo; cada teste começa do zero
+    cache.bump_data_version()
+    diagnostics._cache.clear()
+    result = app.test_cli_runner().invoke(args=[
+        "household-create", "Outra", "--admin-username", "outra", "--admin-password", "outra123",
+    ])
+    assert result.exit_code == 0, result.output
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def login(app, username, password):
+    client = app.test_client()
+    resp = client.post("/login", data={"username": username, "password": password})
+    assert resp.status_code == 302
+    return client
+
+
+@pytest.fixture
+def client(app):
+    """Admin da casa 1."""
+    return login(app, "admin", "admin123")
+
+
+@pytest.fixture
+def other_client(app):
+    """Admin da casa 2."""
+    return login(app, "outra", "outra123")
+
+
+def ids(app, household_id, category="Mercado", account="Conta Corrente"):
+    """(categoria, conta) de uma casa, pelo nome."""
+    with app.app_context():
+        c = Category.query.filter_by(household_id=household_id, name=category).one()
+        a = Account.query.filter_by(household_id=household_id, name=account).one()
+        return c.id, a.id
@@ -0,0 +1,19 @@
+"""Feed de alertas de orçamento (/api/alerts)."""
+from .conftest import ids
+from .test_backup import new_transaction
+
+
+def test_api_alerts_limit_is_parsed_and_clamped(app, client):
+    cat, _ = ids(app, 1)
+    client.post("/budgets", data={"month": "2026-10", "category_id": cat, "planned_amount": "100", "scope": "template"})
+    new_transaction(client, app, "110.00")  # cruza 80% e 100%
+
+    def count(limit):
+        resp = client.get(f"/api/alerts?limit={limit}")
+        assert resp.status_code == 200
+        return len(resp.get_json()["alerts"])
+
+    assert count("x") == 2
+    assert count("1") == 1
+    assert count("-5") == 1
+    assert count("100000") == 2
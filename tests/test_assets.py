@@ -0,0 +1,35 @@
+"""Build dos estáticos e lista de pré-cache do service worker."""
+import json
+import re
+
+from app import assets
+from app.assets import minify_css
+
+
+def test_minify_css_keeps_descendant_space_before_pseudo_class():
+    css = ".a :not(.b) , .c > .d:hover {\n  color : red ;\n  background: url(data:x) }\n@media (max-width: 600px) { .e { margin : 0 } }"
+    assert minify_css(css) == (
+        ".a :not(.b),.c>.d:hover{color:red;background:url(data:x)}@media (max-width: 600px){.e{margin:0}}"
+    )
+
+
+def test_service_worker_precaches_fingerprinted_assets(app, tmp_path, monkeypatch):
+    static = tmp_path / "static"
+    static.mkdir()
+    (static / "app.css").write_text(".a :hover { color : red }", encoding="utf-8")
+    (static / "offline.js").write_text("// x\nconsole.log(1);\n", encoding="utf-8")
+    manifest = assets.build(static)
+    monkeypatch.setattr(assets, "STATIC", static)
+    monkeypatch.setattr(assets, "_manifest", manifest)
+
+    def worker():
+        body = app.test_client().get("/sw.js").get_data(as_text=True)
+        return {name: json.loads(re.search(rf"const {name} = (.*);", body).group(1)) for name in ("VERSION", "PRECACHE")}
+
+    first = worker()
+    assert first["PRECACHE"] == [f"/static/dist/{manifest['app.css']}", f"/static/dist/{manifest['offline.js']}"]
+
+    # build novo, outra versão do worker
+    (static / "app.css").write_text(".a :hover { color : blue }", encoding="utf-8")
+    monkeypatch.setattr(assets, "_manifest", assets.build(static))
+    assert worker()["VERSION"] != first["VERSION"]
@@ -0,0 +1,114 @@
+"""Backup completo + incremental restaurado com --replace reproduz o banco."""
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app import db
+from app.backup import DERIVED, EXCLUDED, backup, restore
+from app.models import RecurringTransaction, Transaction, User
+
+from .conftest import ids
+
+
+def snapshot():
+    """Conteúdo de todas as tabelas; nas derivadas (refeitas na restauração) sem o id."""
+    out = {}
+    for t in db.metadata.sorted_tables:
+        if t.name in EXCLUDED:
+            continue
+        cols = [c for c in t.columns if not (t.name in DERIVED and c.name == "id")]
+        out[t.name] = sorted(map(tuple, db.session.execute(db.select(*cols)).all()), key=repr)
+    db.session.rollback()
+    return out
+
+
+def new_transaction(client, app, amount, **extra):
+    cat, acc = ids(app, 1)
+    data = {"txn_type": "expense", "category_id": cat, "account_id": acc, "amount": amount, "txn_date": "2026-10-02"}
+    data.update(extra)
+    client.post("/transactions/new", data=data)
+    with app.app_context():
+        return db.session.execute(db.select(db.func.max(Transaction.id))).scalar()
+
+
+def run_backup(app, out, since=None):
+    with app.app_context():
+        backup(out, since)
+
+
+def restore_and_compare(app, *folders):
+    with app.app_context():
+        before = snapshot()
+        restore(list(folders), replace=True, jobs=1, log=lambda *a: None)
+        assert snapshot() == before
+
+
+def test_incremental_restore_drops_rows_deleted_between_backups(app, client, tmp_path):
+    cat, acc = ids(app, 1)
+    client.post("/settings/recurring", data={
+        "name": "Aluguel", "amount": "1500", "day_of_month": "5", "txn_type": "expense",
+        "category_id": cat, "account_id": acc,
+    })
+    client.post("/settings/user", data={"name": "Visita", "username": "visita", "password": "visita1"})
+    gone = new_transaction(client, app, "10.00", tags="viagem")
+    new_transaction(client, app, "20.00")
+    run_backup(app, tmp_path / "full")
+
+    with app.app_context():
+        rid = RecurringTransaction.query.one().id
+        uid = User.query.filter_by(username="visita").one().id
+    client.post(f"/settings/recurring/{rid}/delete")
+    client.post(f"/settings/user/{uid}/delete")
+    client.post(f"/transactions/{gone}/delete")
+    new_transaction(client, app, "30.00")
+    run_backup(app, tmp_path / "inc", since=tmp_path / "full")
+
+    restore_and_compare(app, tmp_path / "full", tmp_path / "inc")
+    with app.app_context():
+        assert RecurringTransaction.query.count() == 0
+        assert User.query.filter_by(username="visita").count() == 0
+        assert db.session.get(Transaction, gone) is None
+
+
+def test_incremental_restore_replaces_split_lines_and_tags_per_transaction(app, client, tmp_path):
+    cat, _ = ids(app, 1)
+    other, _ = ids(app, 1, category="Contas")
+    resplit = new_transaction(client, app, "60.00", tags="casa, viagem",
+                              split_category_id=[cat, other], split_amount=["30", "30"])
+    deleted = new_transaction(client, app, "50.00", tags="viagem",
+                              split_category_id=[cat, other], split_amount=["25", "25"])
+    run_backup(app, tmp_path / "full")
+
+    client.post(f"/transactions/{resplit}/edit", data={
+        "txn_type": "expense", "category_id": cat, "account_id": ids(app, 1)[1], "amount": "60.00",
+        "txn_date": "2026-10-02", "tags": "casa", "split_category_id": [cat, other], "split_amount": ["40", "20"],
+    })
+    client.post(f"/transactions/{deleted}/delete")
+    run_backup(app, tmp_path / "inc", since=tmp_path / "full")
+
+    restore_and_compare(app, tmp_path / "full", tmp_path / "inc")
+    with app.app_context():
+        t = db.session.get(Transaction, resplit)
+        assert sorted(s.amount for s in t.splits) == [20.0, 40.0]
+        assert [tag.name for tag in t.tags] == ["casa"]
+        for name in ("transaction_splits", "transaction_tags"):
+            table = db.metadata.tables[name]
+            assert not db.session.execute(db.select(table).where(table.c.transaction_id == deleted)).first()
+
+
+def test_incremental_picks_up_rows_committed_after_the_previous_backup_read(app, client, tmp_path):
+    new_transaction(client, app, "10.00")
+    run_backup(app, tmp_path / "full")
+    mark = json.loads((tmp_path / "full" / "manifest.json").read_text())["watermarks"]["transactions"]
+
+    # flush antes da leitura do backup completo, commit depois dela
+    late = new_transaction(client, app, "20.00", tags="viagem")
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(update(Transaction).where(Transaction.id == late)
+                     .values(updated_at=datetime.fromisoformat(mark) - timedelta(seconds=2)))
+    run_backup(app, tmp_path / "inc", since=tmp_path / "full")
+
+    restore_and_compare(app, tmp_path / "full", tmp_path / "inc")
+    with app.app_context():
+        assert db.session.get(Transaction, late) is not None
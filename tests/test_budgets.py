@@ -0,0 +1,50 @@
+"""Orçamento x realizado por período e cache entre workers."""
+import pytest
+from flask import g
+
+from app import db
+from app.budget_engine import period_months, period_totals
+from app.models import Transaction
+
+from .conftest import ids
+from .test_backup import new_transaction
+
+
+def test_period_months_rejects_invalid_periods():
+    assert period_months("2025-q4") == ["2025-10", "2025-11", "2025-12"]
+    assert period_months("2025") == [f"2025-{m:02d}" for m in range(1, 13)]
+    assert period_months("2025-02") == ["2025-02"]
+    for bad in ("2025-Q5", "2025-Q0", "2025-13", "25-01", "2025-1", ""):
+        with pytest.raises(ValueError):
+            period_months(bad)
+
+
+def test_dashboard_period_sums_the_quarter(app, client):
+    cat, _ = ids(app, 1)
+    client.post("/budgets", data={"month": "2026-10", "category_id": cat, "planned_amount": "100", "scope": "template"})
+    new_transaction(client, app, "10.00")
+    new_transaction(client, app, "20.00", txn_date="2026-12-05")
+
+    page = client.get("/dashboard?month=2026-10&period=2026-Q4").get_data(as_text=True)
+    assert "Despesas de 2026-Q4" in page and "R$ 30,00" in page
+    assert "R$ 300,00" in page  # orçamento padrão x 3 meses
+    page = client.get("/dashboard?month=2026-10&period=2026-Q5").get_data(as_text=True)
+    assert "Período inválido" in page and "Despesas do mês" in page
+
+
+def test_period_totals_see_writes_from_another_worker(app, client):
+    new_transaction(client, app, "10.00")
+
+    def expenses():
+        with app.test_request_context():
+            g.household_id = 1
+            return period_totals("2026-10")["expense"]
+
+    assert expenses() == 10.0
+    # gravação que não passa por esta sessão (outro processo): sem bump da versão local
+    with app.app_context(), db.engine.begin() as conn:
+        row = dict(conn.execute(db.select(Transaction.__table__).limit(1)).mappings().one())
+        del row["id"]
+        row["amount"] = 5.0
+        conn.execute(Transaction.__table__.insert().values(row))
+    assert expenses() == 15.0
@@ -0,0 +1,60 @@
+"""Impressão digital dos lançamentos (chave de cache entre workers)."""
+import os
+from datetime import date
+from pathlib import Path
+
+from flask import g
+from sqlalchemy import update
+
+from app import db
+from app.models import Category
+
+from app.cache import transactions_fingerprint
+
+from .conftest import ids
+from .test_backup import new_transaction
+
+OCTOBER = (date(2026, 10, 1), date(2026, 11, 1))
+
+
+def fingerprint(app):
+    with app.test_request_context():
+        g.household_id = 1
+        return transactions_fingerprint(*OCTOBER)
+
+
+def test_fingerprint_changes_when_only_tags_or_split_lines_change(app, client):
+    cat, acc = ids(app, 1)
+    other, _ = ids(app, 1, category="Contas")
+    tid = new_transaction(client, app, "60.00", tags="casa")
+    edit = {"txn_type": "expense", "category_id": cat, "account_id": acc, "amount": "60.00", "txn_date": "2026-10-02"}
+
+    seen = [fingerprint(app)]
+    client.post(f"/transactions/{tid}/edit", data=dict(edit, tags="casa, viagem"))
+    seen.append(fingerprint(app))
+    client.post(f"/transactions/{tid}/edit", data=dict(
+        edit, tags="casa, viagem", split_category_id=[cat, other], split_amount=["40", "20"]))
+    seen.append(fingerprint(app))
+    client.post(f"/transactions/{tid}/edit", data=dict(
+        edit, tags="casa, viagem", split_category_id=[cat, other], split_amount=["30", "30"]))
+    seen.append(fingerprint(app))
+    assert len(set(seen)) == 4
+
+
+def test_export_follows_category_rename_from_another_worker(app, client):
+    cat, _ = ids(app, 1)
+    new_transaction(client, app, "60.00")
+    folder = Path(app.config["EXPORT_FOLDER"])
+
+    first = client.get("/reports/export/csv?month=2026-10")
+    assert b"Mercado" in first.data
+    [old] = folder.glob("lancamentos_*.csv")
+    os.utime(old, (0, 0))  # já baixado há tempo
+
+    # outro worker renomeia a categoria: a versão em memória deste não muda
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(update(Category).where(Category.id == cat).values(name="Supermercado"))
+    second = client.get("/reports/export/csv?month=2026-10")
+    assert b"Supermercado" in second.data
+    assert [p.name for p in folder.glob("lancamentos_*.csv")] != [old.name]
+    assert not old.exists()
@@ -0,0 +1,40 @@
+"""Exportação colunar: Arrow IPC e Parquet lidos de volta."""
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .conftest import ids
+from .test_backup import new_transaction
+
+
+def add_transactions(app, client):
+    cat, _ = ids(app, 1)
+    other, _ = ids(app, 1, category="Contas")
+    new_transaction(client, app, "10.00")
+    new_transaction(client, app, "20.00")
+    new_transaction(client, app, "60.00", split_category_id=[cat, other], split_amount=["40", "20"])
+
+
+def check(table):
+    # dividido: uma linha por categoria
+    assert table.num_rows == 4
+    for name in ("category", "account"):
+        assert pa.types.is_dictionary(table.schema.field(name).type), name
+    assert sorted(table.column("category").to_pylist()) == ["Contas", "Mercado", "Mercado", "Mercado"]
+    assert set(table.column("account").to_pylist()) == {"Conta Corrente"}
+    assert sum(table.column("amount_converted").to_pylist()) == 90.0
+
+
+def test_arrow_stream_reads_back(app, client):
+    add_transactions(app, client)
+    resp = client.get("/api/export/transactions.arrow?month=2026-10")
+    assert resp.status_code == 200 and resp.mimetype == "application/vnd.apache.arrow.stream"
+    check(pa.ipc.open_stream(io.BytesIO(resp.get_data())).read_all())
+
+
+def test_parquet_file_reads_back(app, client):
+    add_transactions(app, client)
+    resp = client.get("/reports/export/parquet?month=2026-10")
+    assert resp.status_code == 200
+    check(pq.read_table(io.BytesIO(resp.get_data())))
@@ -0,0 +1,90 @@
+"""Moeda do lançamento e conversão para a moeda dos relatórios."""
+from datetime import date
+from types import SimpleNamespace
+
+from flask import g
+
+from app import cache, db
+from app.budget_engine import period_totals
+from app.currency import load_rates, parse_rates, rate_table
+from app.models import ExchangeRate, Transaction
+
+from .conftest import ids
+from .test_backup import new_transaction
+
+
+def test_moving_transaction_to_another_account_takes_its_currency(app, client):
+    client.post("/settings/account", data={"name": "Conta EUA", "kind": "checking", "currency": "USD"})
+    cat, acc = ids(app, 1)
+    _, usd = ids(app, 1, account="Conta EUA")
+    tid = new_transaction(client, app, "10.00")
+
+    edit = {"txn_type": "expense", "category_id": cat, "amount": "10.00", "txn_date": "2026-10-02"}
+    client.post(f"/transactions/{tid}/edit", data=dict(edit, account_id=usd))
+    with app.app_context():
+        assert db.session.get(Transaction, tid).currency == "USD"
+    client.post(f"/transactions/{tid}/edit", data=dict(edit, account_id=acc))
+    with app.app_context():
+        assert db.session.get(Transaction, tid).currency == "BRL"
+
+
+def expenses(app):
+    with app.test_request_context():
+        g.household_id = 1
+        return period_totals("2026-10")["expense"]
+
+
+def test_parse_rates_reads_thousands_separators():
+    rows = parse_rates("data;moeda;cotacao\n2026-10-01;JPY;1,234.56\n01/10/2026;EUR;1.234,56\n2026-10-02;USD;5,43\n", "BRL")
+    assert [r["rate"] for r in rows] == [1234.56, 1234.56, 5.43]
+
+
+def test_foreign_amount_without_rate_is_left_out_and_flagged(app, client):
+    client.post("/settings/account", data={"name": "Conta EUA", "kind": "checking", "currency": "USD"})
+    _, usd = ids(app, 1, account="Conta EUA")
+    new_transaction(client, app, "10.00")
+    new_transaction(client, app, "100.00", account_id=usd)
+
+    assert expenses(app) == 10.0
+    page = client.get("/dashboard?month=2026-10").get_data(as_text=True)
+    assert "Sem cotação para 1 lançamento(s) em USD" in page
+
+    with app.app_context():
+        load_rates(parse_rates("2026-09-30;USD;5,00\n", "BRL"))
+        db.session.commit()
+    assert expenses(app) == 510.0
+    assert "Sem cotação" not in client.get("/dashboard?month=2026-10").get_data(as_text=True)
+
+
+def test_report_totals_convert_and_follow_split_lines(app, client):
+    client.post("/settings/account", data={"name": "Conta EUA", "kind": "checking", "currency": "USD"})
+    cat, _ = ids(app, 1)
+    other, usd = ids(app, 1, category="Contas", account="Conta EUA")
+    with app.app_context():
+        load_rates(parse_rates("2026-09-30;USD;5,00\n", "BRL"))
+        db.session.commit()
+    new_transaction(client, app, "10.00")
+    new_transaction(client, app, "100.00", account_id=usd, split_category_id=[cat, other], split_amount=["60", "40"])
+
+    page = client.get("/reports?month=2026-10").get_data(as_text=True)
+    assert "Despesas: <strong class=\"text-danger\">R$ 510,00</strong>" in page
+    page = client.get(f"/reports?month=2026-10&category_id={other}").get_data(as_text=True)
+    assert "Despesas: <strong class=\"text-danger\">R$ 200,00</strong>" in page
+
+
+def test_rate_table_follows_rates_loaded_by_another_worker(app, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+
+    def usd_rate():
+        with app.test_request_context():
+            g.household_id = 1
+            return rate_table().rate("USD", "BRL", date(2026, 10, 2))
+
+    assert usd_rate() is None
+    # outro worker carrega a cotação: a versão em memória deste não muda
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(ExchangeRate.__table__.insert().values(rate_date=date(2026, 10, 1), currency="USD", quote="BRL", rate=5.0))
+    assert usd_rate() is None  # dentro do CACHE_TTL
+    clock[0] += cache.CACHE_TTL + 1
+    assert usd_rate() == 5.0
@@ -0,0 +1,84 @@
+"""Importação em lote: razão, auditoria e alertas só dos lançamentos inseridos."""
+import io
+from datetime import date
+
+import pytest
+from flask import g
+from sqlalchemy import update
+
+from app import db
+from app.importers import ImportFormatError, import_rows, read_statement
+from app.models import Account, Category, CategorySpend, Posting, Transaction, TransactionEvent
+
+
+def test_import_follows_up_only_the_inserted_rows(app):
+    rows = [{"txn_date": date(2026, 10, d), "description": f"linha {d}", "amount": -10.0 * d} for d in range(1, 6)]
+
+    def statement():
+        # outro usuário grava no meio da importação (sem passar por esta sessão)
+        with db.engine.begin() as conn:
+            row = dict(conn.execute(db.select(Transaction.__table__).limit(1)).mappings().one())
+            del row["id"]
+            row["description"] = "de fora"
+            conn.execute(Transaction.__table__.insert().values(row))
+        yield from rows
+
+    with app.test_request_context():
+        g.household_id = 1
+        account = Account.query.filter_by(name="Conta Corrente").one()
+        category = Category.query.filter_by(name="Mercado").one()
+        db.session.add(Transaction(txn_type="expense", category_id=category.id, account_id=account.id,
+                                   amount=1.0, description="antes", txn_date=date(2026, 10, 1)))
+        db.session.commit()
+
+        assert import_rows(statement(), account, category, batch_size=2) == 5
+        db.session.commit()
+
+        outside = Transaction.query.filter_by(description="de fora").one().id
+        imported = [t.id for t in Transaction.query.filter(Transaction.description.like("linha %"))]
+        assert db.session.query(Posting.transaction_id).filter(Posting.transaction_id == outside).count() == 0
+        assert sorted(p.transaction_id for p in Posting.query.filter(Posting.transaction_id.in_(imported))) == sorted(imported)
+        imported_events = TransactionEvent.query.filter(TransactionEvent.changes.like('%"import"%'))
+        assert sorted(e.entity_id for e in imported_events) == sorted(imported)
+
+        # acumulado dos alertas = o de antes + os importados (sem o de fora)
+        incremental = {(s.month, s.category_id): round(s.amount, 2) for s in CategorySpend.query}
+        assert incremental[("2026-10", category.id)] == 1.0 + 150.0
+
+
+def test_import_matches_category_by_name_and_kind(app):
+    rows = [
+        {"txn_date": date(2026, 10, 1), "description": "mercado", "amount": -50.0, "category": "mercado"},
+        {"txn_date": date(2026, 10, 2), "description": "estorno", "amount": 50.0, "category": "Mercado"},
+    ]
+    with app.test_request_context():
+        g.household_id = 1
+        account = Account.query.filter_by(name="Conta Corrente").one()
+        market = Category.query.filter_by(name="Mercado").one()
+        fallback = Category.query.filter_by(name="Contas").one()
+        assert market.kind == "expense"
+        import_rows(rows, account, fallback)
+        db.session.commit()
+        got = {t.description: t.category_id for t in Transaction.query.filter(Transaction.description.in_(["mercado", "estorno"]))}
+        assert got == {"mercado": market.id, "estorno": fallback.id}
+
+
+def test_unknown_encoding_hint_is_a_format_error():
+    ofx = b"OFXHEADER:100\nDATA:OFXSGML\nCHARSET:9999\n<OFX></OFX>\n"
+    with pytest.raises(ImportFormatError, match="cp9999"):
+        read_statement(io.BytesIO(ofx), "extrato.ofx")
+    xml = b'<?xml version="1.0" encoding="x-nao-existe"?><OFX></OFX>'
+    with pytest.raises(ImportFormatError, match="x-nao-existe"):
+        read_statement(io.BytesIO(xml), "extrato.ofx")
+
+
+def test_import_without_expense_category_is_rejected(app, client):
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(update(Category).where(Category.kind == "expense").values(kind="income"))
+    csv = b"data;descricao;valor\n02/10/2026;padaria;-10,00\n"
+    resp = client.post("/import", data={"file": (io.BytesIO(csv), "extrato.csv"), "do_import": "1"},
+                       content_type="multipart/form-data", follow_redirects=True)
+    assert "Cadastre uma categoria de despesa" in resp.get_data(as_text=True)
+    with app.test_request_context():
+        g.household_id = 1
+        assert Transaction.query.filter_by(description="padaria").count() == 0
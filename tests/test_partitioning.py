@@ -0,0 +1,53 @@
+"""Períodos arquivados em arquivo: leitura em cache por arquivo e por casa."""
+import csv
+import gzip
+import os
+from datetime import date
+
+from flask import g
+
+from app import db, partitioning
+from app.models import ArchivedPeriod
+
+COLUMNS = ["id", "household_id", "txn_date", "txn_type", "category_id", "account_id", "to_account_id",
+           "amount", "is_split", "currency", "description", "receipt_filename", "created_at"]
+
+
+def write_archive(path, rows):
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(COLUMNS)
+        w.writerows(rows)
+
+
+def test_archive_is_parsed_once_and_filtered_by_household(app, tmp_path, monkeypatch):
+    path = tmp_path / "2020.csv.gz"
+    write_archive(path, [
+        (1, 1, "2020-03-02", "expense", 1, 1, "", "10.0", "False", "BRL", "casa 1", "", ""),
+        (2, 2, "2020-03-03", "expense", 1, 1, "", "20.0", "False", "BRL", "casa 2", "", ""),
+        (3, 1, "2020-01-05", "expense", 1, 1, "", "30.0", "False", "BRL", "janeiro", "", ""),
+    ])
+    with app.app_context():
+        db.session.add(ArchivedPeriod(start_date=date(2020, 1, 1), end_date=date(2021, 1, 1),
+                                      path=str(path), fmt="csv.gz", rows=3))
+        db.session.commit()
+
+    reads = []
+    read_archive = partitioning._read_archive
+    monkeypatch.setattr(partitioning, "_read_archive", lambda *a: reads.append(a) or read_archive(*a))
+    partitioning._parsed_archive.cache_clear()
+
+    def descriptions(start, end):
+        with app.test_request_context():
+            g.household_id = 1
+            return [t.description for t in partitioning.archived_transactions(start, end)]
+
+    assert descriptions(date(2020, 3, 1), date(2020, 4, 1)) == ["casa 1"]
+    assert descriptions(date(2020, 1, 1), date(2021, 1, 1)) == ["janeiro", "casa 1"]
+    assert len(reads) == 1
+
+    # arquivo regravado (outro mtime/tamanho): lido de novo
+    write_archive(path, [(1, 1, "2020-03-02", "expense", 1, 1, "", "10.0", "False", "BRL", "regravado", "", "")])
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000))
+    assert descriptions(date(2020, 3, 1), date(2020, 4, 1)) == ["regravado"]
+    assert len(reads) == 2
@@ -0,0 +1,14 @@
+"""Tabela categoria x mês: filtros da query string."""
+from app.utils import month_now
+
+
+def test_malformed_end_falls_back_to_current_month(client):
+    for url in ("/reports/pivot?end=foo", "/reports/pivot/export/json?end=foo", "/reports/pivot/export/xlsx?end=2026-13"):
+        assert client.get(url).status_code == 200, url
+    assert client.get("/reports/pivot/export/json?end=foo").get_json()["months"][-1] == month_now()
+
+
+def test_malformed_start_is_rejected_without_error(client):
+    assert client.get("/reports/pivot?start=foo&end=2026-10").status_code == 302
+    resp = client.get("/reports/pivot/export/json?start=foo&end=2026-10")
+    assert resp.status_code == 400 and resp.get_json()["ok"] is False
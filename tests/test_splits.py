@@ -0,0 +1,58 @@
+"""Rateio: validação das linhas, auditoria e acumulado dos alertas."""
+import json
+
+from app import db
+from app.alerts import rebuild_spend
+from app.models import CategorySpend, Transaction, TransactionEvent
+
+from .conftest import ids
+from .test_backup import new_transaction
+
+
+def spend():
+    """{(mês, categoria): gasto} de category_spend, sem as linhas zeradas."""
+    return {(r.month, r.category_id): round(r.amount, 2) for r in CategorySpend.query if round(r.amount, 2)}
+
+
+def events(tid):
+    return {e.action: json.loads(e.changes) for e in TransactionEvent.query.filter_by(entity_id=tid)}
+
+
+def test_split_lines_must_match_the_transaction_type(app, client):
+    cat, acc = ids(app, 1)
+    income, _ = ids(app, 1, category="Salário")
+    resp = client.post("/transactions/new", data={
+        "txn_type": "expense", "category_id": cat, "account_id": acc, "amount": "50", "txn_date": "2026-10-02",
+        "split_category_id": [cat, income], "split_amount": ["30", "20"],
+    }, follow_redirects=True)
+    assert "mesmo tipo do lançamento" in resp.get_data(as_text=True)
+    with app.app_context():
+        assert Transaction.query.count() == 0
+
+
+def test_split_changes_are_audited_and_keep_alert_totals_consistent(app, client):
+    cat, acc = ids(app, 1)
+    other, _ = ids(app, 1, category="Contas")
+    tid = new_transaction(client, app, "60.00", split_category_id=[cat, other], split_amount=["40", "20"])
+    with app.app_context():
+        assert sorted(events(tid)["create"]["splits"]) == sorted([[cat, 40.0], [other, 20.0]])
+
+    client.post(f"/transactions/{tid}/edit", data={
+        "txn_type": "expense", "category_id": cat, "account_id": acc, "amount": "60.00", "txn_date": "2026-10-02",
+        "split_category_id": [cat, other], "split_amount": ["10", "50"],
+    })
+    with app.app_context():
+        before, after = events(tid)["update"]["splits"]
+        assert sorted(before) == sorted([[cat, 40.0], [other, 20.0]])
+        assert sorted(after) == sorted([[cat, 10.0], [other, 50.0]])
+        incremental = spend()
+        rebuild_spend(1)
+        assert spend() == incremental
+        db.session.rollback()
+
+    client.post(f"/transactions/{tid}/delete")
+    with app.app_context():
+        gone = events(tid)["delete"]
+        assert gone["is_split"] is True
+        assert sorted(gone["splits"]) == sorted([[cat, 10.0], [other, 50.0]])
+        assert spend() == {}
@@ -0,0 +1,79 @@
+"""Lote offline do PWA: resultado por item, sem travar a fila."""
+from datetime import datetime, timedelta
+
+from flask import g
+from sqlalchemy import update
+
+from app import db
+from app.models import Transaction
+from app.sync import delta
+
+from .conftest import ids
+from .test_backup import new_transaction
+
+
+def test_batch_reports_each_item_and_keeps_the_valid_ones(app, client):
+    cat, acc = ids(app, 1)
+    _, savings = ids(app, 1, account="Poupança")
+    foreign, _ = ids(app, 2)
+    items = [
+        {"client_id": "a", "txn_type": "expense", "category_id": cat, "account_id": acc, "amount": "12,50"},
+        {"client_id": "b", "txn_type": "transfer", "category_id": cat, "account_id": acc,
+         "to_account_id": savings, "amount": "1.234,56"},
+        {"client_id": "c", "txn_type": "expense", "category_id": foreign, "account_id": acc, "amount": "5"},
+        {"client_id": "d", "txn_type": "expense", "category_id": cat, "account_id": acc, "amount": "doze"},
+        {"txn_type": "expense", "category_id": cat, "account_id": acc, "amount": "1"},
+    ]
+    data = client.post("/api/sync/transactions", json={"items": items}).get_json()
+    assert data["ok"]
+    results = data["results"]
+    assert [r["client_id"] for r in results] == ["a", "b", "c", "d", None]
+    assert [("id" in r, "error" in r) for r in results] == [(True, False)] * 2 + [(False, True)] * 3
+    with app.app_context():
+        amounts = {t.client_id: t.amount for t in Transaction.query}
+    assert amounts == {"a": 12.5, "b": 1234.56}
+
+    # reenvio do mesmo lote não duplica e devolve os mesmos ids
+    again = client.post("/api/sync/transactions", json={"items": items[:2]}).get_json()
+    assert again["ids"] == data["ids"]
+    with app.app_context():
+        assert Transaction.query.count() == 2
+
+
+def test_logout_clears_offline_data(client):
+    assert client.get("/app").status_code == 200
+    resp = client.get("/logout")
+    assert '"storage"' in resp.headers["Clear-Site-Data"]
+
+
+def test_sync_rereads_rows_committed_late_while_paging(app, client):
+    now = datetime.utcnow()
+    tids = [new_transaction(client, app, str(v)) for v in (1, 2, 3)]
+
+    def stamp(tid, seconds):
+        with app.app_context(), db.engine.begin() as conn:
+            conn.execute(update(Transaction).where(Transaction.id == tid)
+                         .values(updated_at=now + timedelta(seconds=seconds)))
+
+    # gravações durante a rodada de páginas
+    for tid, seconds in zip(tids, (100, 200, 300)):
+        stamp(tid, seconds)
+
+    def page(cursor, limit=1):
+        with app.test_request_context():
+            g.household_id = 1
+            return delta(cursor, limit=limit)
+
+    seen, cursor = [], ""
+    while True:
+        data = page(cursor)
+        seen += [t["id"] for t in data["transactions"]]
+        cursor = data["cursor"]
+        if len(seen) == 2:
+            # flush antes da página 2, commit só depois dela
+            late = new_transaction(client, app, "4")
+            stamp(late, 150)
+        if not data["more"]:
+            break
+    assert late not in seen
+    assert late in [t["id"] for t in page(cursor, limit=50)["transactions"]]
@@ -0,0 +1,16 @@
+"""Etiquetas: autocompletar (/api/tags)."""
+from .test_backup import new_transaction
+
+
+def test_api_tags_limit_is_parsed_and_clamped(app, client):
+    new_transaction(client, app, "10.00", tags="viagem, praia, casa")
+
+    def names(limit):
+        resp = client.get(f"/api/tags?limit={limit}")
+        assert resp.status_code == 200
+        return [t["name"] for t in resp.get_json()["tags"]]
+
+    assert sorted(names("x")) == ["casa", "praia", "viagem"]
+    assert len(names("2")) == 2
+    assert len(names("-1")) == 1
+    assert len(names("0")) == 1
@@ -0,0 +1,79 @@
+"""Cada casa só lê e grava os próprios dados."""
+from datetime import date
+
+from app import db
+from app.models import Budget, BudgetTemplate, RecurringTransaction, Transaction
+
+from .conftest import ids
+
+
+def test_lists_and_dashboard_show_only_own_household(app, client, other_client):
+    cat, acc = ids(app, 1)
+    client.post("/transactions/new", data={
+        "txn_type": "expense", "category_id": cat, "account_id": acc,
+        "amount": "777.00", "txn_date": "2026-10-02",
+    })
+    assert "777" in client.get("/transactions?month=2026-10").get_data(as_text=True)
+    assert "777" not in other_client.get("/transactions?month=2026-10").get_data(as_text=True)
+    assert "777" not in other_client.get("/dashboard?month=2026-10").get_data(as_text=True)
+
+
+def test_transaction_rejects_foreign_category_and_account(app, other_client):
+    cat, acc = ids(app, 1)
+    other_client.post("/transactions/new", data={
+        "txn_type": "expense", "category_id": cat, "account_id": acc, "amount": "10", "txn_date": "2026-10-02",
+    })
+    with app.app_context():
+        assert Transaction.query.count() == 0
+
+
+def test_recurring_rejects_foreign_category_and_account(app, other_client):
+    cat, acc = ids(app, 1)
+    other_client.post("/settings/recurring", data={
+        "name": "Aluguel", "amount": "1500", "day_of_month": "5", "txn_type": "expense",
+        "category_id": cat, "account_id": acc,
+    })
+    with app.app_context():
+        assert RecurringTransaction.query.count() == 0
+    own_cat, own_acc = ids(app, 2)
+    other_client.post("/settings/recurring", data={
+        "name": "Aluguel", "amount": "1500", "day_of_month": "5", "txn_type": "expense",
+        "category_id": own_cat, "account_id": own_acc,
+    })
+    with app.app_context():
+        assert [r.household_id for r in RecurringTransaction.query] == [2]
+
+
+def test_budget_rejects_foreign_or_income_category(app, other_client):
+    cat, _ = ids(app, 1)
+    income, _ = ids(app, 2, category="Salário")
+    for category_id in (cat, income):
+        for scope in ("template", "month"):
+            resp = other_client.post("/budgets?month=2026-10", data={
+                "month": "2026-10", "category_id": category_id, "planned_amount": "100", "scope": scope,
+            })
+            assert resp.status_code == 302
+    with app.app_context():
+        assert Budget.query.count() == 0
+        assert BudgetTemplate.query.filter_by(category_id=cat).one().household_id == 1
+        assert BudgetTemplate.query.filter_by(category_id=income).count() == 0
+
+
+def test_receipts_are_served_only_to_their_household(app, client, other_client):
+    cat, acc = ids(app, 1)
+    with open(f"{app.config['UPLOAD_FOLDER']}/recibo.txt", "w") as f:
+        f.write("comprovante")
+    with app.app_context():
+        db.session.add(Transaction(
+            household_id=1, txn_type="expense", category_id=cat, account_id=acc, amount=5,
+            txn_date=date(2026, 10, 2), receipt_filename="recibo.txt",
+        ))
+        db.session.commit()
+    assert client.get("/uploads/recibo.txt").status_code == 200
+    assert other_client.get("/uploads/recibo.txt").status_code == 404
+
+
+def test_diagnostics_hide_database_wide_numbers_with_several_households(app, client):
+    page = client.get("/admin/diagnostico").get_data(as_text=True)
+    assert "Tabelas encontradas" not in page
+    assert "(desta casa)" in page